@@ -0,0 +1,279 @@
+"""
+Batch generation of the static dashboards for a range of semesters.
+
+The KPIs of every semester are fetched in one pass (one query per KPI covering all semesters),
+then the dashboards are rendered in a process pool and an index page linking them is written.
+
+With `--single-file`, all the semesters are saved in one HTML file instead, with a selector
+that switches between them in the browser (see `utils.semester_switcher`). The other semesters
+are embedded in the file, compressed, and decoded when first selected, so the page also opens
+from disk. `--patch-folder` writes them to a folder instead (next to the file by default), fetched
+when selected: the page is then smaller but must be served over HTTP.
+
+Usage (from `src/`):
+    python batch.py --from-year 2021 --to-year 2024 [--semesters Spring Summer Winter] [--workers 4]
+    python batch.py --from-year 2021 --to-year 2024 --single-file [--patch-folder [FOLDER]]
+"""
+import argparse
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from bokeh.io import output_file, save
+
+import main
+from db_config import DatabaseEngineFactory
+from utils import document_optimizer, helpers, level_of_detail, semester_switcher
+
+SEMESTERS = ["Spring", "Summer", "Winter"]
+DEFAULT_OUTPUT_DIR = "dashboards"
+FETCH_WORKERS = 5
+
+
+def get_periods(from_year, to_year, semesters=SEMESTERS):
+    return [(year, semester) for year in range(from_year, to_year + 1) for semester in semesters]
+
+
+def fetch_all_kpis(periods, engine=None):
+    """
+    Fetches every KPI for every semester, running one batched query per KPI concurrently.
+
+    Returns:
+        dict: (year, semester) -> {KPI name: DataFrame}
+    """
+    engine = engine or main.get_engine()
+    frames_by_period = {period: {} for period in periods}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="batch-kpi") as executor:
+        futures = {
+            executor.submit(main.fetch_kpi_batch, kpi_name, periods, engine): kpi_name
+            for kpi_name in main.KPI_QUERIES
+        }
+        for future in as_completed(futures):
+            for period, df in future.result().items():
+                frames_by_period[period][futures[future]] = df
+    return frames_by_period
+
+
+def _render_worker(year, semester, frames, output_dir, optimize):
+    start = time.perf_counter()
+    filename = os.path.join(output_dir, main.get_dashboard_filename(year, semester))
+    main.render_dashboard(year, semester, frames, filename=filename, optimize=optimize)
+    return filename, time.perf_counter() - start
+
+
+def write_index(results, output_dir, index_name="index.html"):
+    """
+    Writes an HTML page linking the generated dashboards, grouped by year.
+    """
+    sections = []
+    for year in sorted({year for year, _ in results}, reverse=True):
+        links = "\n".join(
+            f'      <li><a href="{html.escape(os.path.basename(filename))}">'
+            f"{html.escape(main.get_dashboard_title(year, semester))}</a></li>"
+            for (result_year, semester), filename in results.items()
+            if result_year == year
+        )
+        sections.append(f"    <h2>{year}</h2>\n    <ul>\n{links}\n    </ul>")
+
+    page = (
+        "<!DOCTYPE html>\n<html lang=\"es\">\n<head>\n  <meta charset=\"utf-8\">\n"
+        "  <title>Métricas para el CDA</title>\n</head>\n<body>\n"
+        "  <h1>Métricas para el CDA</h1>\n"
+        f"  <p>Generado el {datetime.now():%Y-%m-%d %H:%M}</p>\n"
+        + "\n".join(sections)
+        + "\n</body>\n</html>\n"
+    )
+    index_path = os.path.join(output_dir, index_name)
+    with open(index_path, "w", encoding="utf-8") as index_file:
+        index_file.write(page)
+    return index_path
+
+
+def generate_dashboards(from_year, to_year, semesters=SEMESTERS, workers=None, output_dir=DEFAULT_OUTPUT_DIR, optimize=True):
+    """
+    Generates the dashboards of every semester in the range, reporting throughput.
+
+    Args:
+        from_year (int): First year (inclusive).
+        to_year (int): Last year (inclusive).
+        semesters (list): Semesters of each year.
+        workers (int): Render processes, defaults to the number of CPUs.
+        output_dir (str): Folder of the dashboards and the index page.
+        optimize (bool): Compact the documents before saving (see `main.export_dashboard`).
+
+    Returns:
+        dict: (year, semester) -> path of the saved dashboard.
+    """
+    periods = get_periods(from_year, to_year, semesters)
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    frames_by_period = fetch_all_kpis(periods)
+    fetch_time = time.perf_counter() - start
+    print(f"Fetched {len(main.KPI_QUERIES)} KPIs for {len(periods)} semesters in {fetch_time:.2f}s")
+    # Workers never query the database; pooled connections must not be shared with them
+    DatabaseEngineFactory.dispose()
+
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_render_worker, year, semester, frames_by_period[(year, semester)], output_dir, optimize): (year, semester)
+            for year, semester in periods
+        }
+        for future in as_completed(futures):
+            period = futures[future]
+            try:
+                filename, seconds = future.result()
+            except Exception as e:
+                failures[period] = str(e)
+                print(f"Failed to render {period[1]} {period[0]}: {e}")
+                continue
+            results[period] = filename
+            print(f"Rendered {filename} in {seconds:.2f}s")
+
+    results = {period: results[period] for period in periods if period in results}
+    index_path = write_index(results, output_dir)
+    elapsed = time.perf_counter() - start
+    render_time = elapsed - fetch_time
+
+    print(f"Index saved as {index_path}")
+    print(
+        f"{len(results)} dashboards in {elapsed:.2f}s "
+        f"(fetch {fetch_time:.2f}s, render {render_time:.2f}s): "
+        f"{len(results) / elapsed * 60:.1f} dashboards/min"
+    )
+    if failures:
+        print(f"{len(failures)} dashboards failed: {', '.join(f'{semester} {year}' for year, semester in failures)}")
+    return results
+
+
+def get_lod_thresholds(frames_by_period):
+    """
+    Level-of-detail mode of each `main.LOD_PLOTS` plot for a whole single-file export.
+
+    Every semester must have the same models to be switched in the page, so a plot is drawn in
+    level-of-detail mode for all of them as soon as the KPI of one semester has more rows than
+    `level_of_detail.LOD_THRESHOLD` (the plots filter their rows, so it never leaves out a
+    semester that would exceed it), and never otherwise.
+
+    Returns:
+        dict: Plot name -> `lod_threshold` of `main.build_dashboard_layout`.
+    """
+    thresholds = {}
+    for plot_name in main.LOD_PLOTS:
+        kpi_name, _ = main.DASHBOARD_PLOTS[plot_name]
+        rows = max((len(frames[kpi_name]) for frames in frames_by_period.values()), default=0)
+        thresholds[plot_name] = level_of_detail.ALWAYS_LOD if rows > level_of_detail.LOD_THRESHOLD else None
+    return thresholds
+
+
+def get_multi_semester_filename(from_year, to_year):
+    return f"course_completion_dashboard_{from_year}_{to_year}.html"
+
+
+def get_patch_folder(filename):
+    return f"{os.path.splitext(filename)[0]}_semesters"
+
+
+def export_multi_semester(from_year, to_year, semesters=SEMESTERS, filename=None, optimize=True, patch_folder=None):
+    """
+    Saves the dashboards of every semester in the range as one HTML file with a semester selector.
+
+    The most recent semester is embedded in the page; the others are stored as compressed
+    patches that are loaded when they are selected: embedded in the page, or with
+    `patch_folder` one file per semester in that folder (e.g. `get_patch_folder(filename)`),
+    which the page fetches over HTTP. The level-of-detail mode of the plots is the same for
+    every semester (see `get_lod_thresholds`).
+
+    Returns:
+        str: Path of the saved HTML file.
+    """
+    periods = get_periods(from_year, to_year, semesters)
+    start = time.perf_counter()
+    frames_by_period = fetch_all_kpis(periods)
+    lod_thresholds = get_lod_thresholds(frames_by_period)
+    lod_plots = [plot_name for plot_name, threshold in lod_thresholds.items() if threshold is not None]
+    print(f"Level-of-detail mode for all semesters: {', '.join(lod_plots) or 'none'}")
+
+    layouts = {}
+    for year, semester in periods:
+        label = f"{helpers.get_semester_in_spanish(semester)} {year}"
+        try:
+            layout, _ = main.build_dashboard_layout(
+                year, semester, frames_by_period[(year, semester)], lod_thresholds=lod_thresholds
+            )
+        except Exception as e:
+            print(f"Skipping {label}: {e}")
+            continue
+        if optimize:
+            # Sharing sources depends on the data and would change the structure between semesters
+            document_optimizer.optimize_document(layout, share_sources=False)
+        layouts[label] = layout
+
+    if not layouts:
+        raise ValueError("No dashboard could be built for the requested semesters")
+
+    filename = filename or get_multi_semester_filename(from_year, to_year)
+    base_label = list(layouts)[-1]
+    root, payload_sizes = semester_switcher.add_semester_selector(
+        layouts[base_label],
+        base_label,
+        layouts,
+        patch_folder=patch_folder,
+        # Patches are fetched relative to the page
+        patch_url=os.path.relpath(patch_folder, os.path.dirname(filename) or ".") if patch_folder else None,
+    )
+
+    output_file(filename, title=f"Métricas para el CDA - {from_year}-{to_year}")
+    save(root)
+
+    print(f"Semester payloads (compressed, {'embedded' if patch_folder is None else f'in {patch_folder}'})")
+    for label, size in payload_sizes.items():
+        print(f"  {label:<28} {size / 1024:>8.1f} KB")
+    print(
+        f"Dashboard with {len(payload_sizes)} semesters saved as {filename} "
+        f"({os.path.getsize(filename) / 1024:.1f} KB) in {time.perf_counter() - start:.2f}s"
+    )
+    return filename
+
+
+if __name__ == "__main__":
+    current_year = datetime.now().year
+    parser = argparse.ArgumentParser(description="Generate the static dashboards of a range of semesters.")
+    parser.add_argument("--from-year", type=int, default=current_year)
+    parser.add_argument("--to-year", type=int, default=current_year)
+    parser.add_argument("--semesters", nargs="+", default=SEMESTERS, choices=SEMESTERS)
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: number of CPUs)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--no-optimize", action="store_true", help="Save the documents without compacting them")
+    parser.add_argument("--single-file", action="store_true", help="Save every semester in one file with a semester selector")
+    parser.add_argument("--filename", default=None, help="Output file of --single-file")
+    parser.add_argument(
+        "--patch-folder", nargs="?", const=True, default=None,
+        help="Write the semesters of --single-file to a folder fetched over HTTP instead of embedding them "
+             "(default folder: <filename>_semesters next to the file)",
+    )
+    args = parser.parse_args()
+
+    if args.single_file:
+        filename = args.filename or get_multi_semester_filename(args.from_year, args.to_year)
+        patch_folder = get_patch_folder(filename) if args.patch_folder is True else args.patch_folder
+        export_multi_semester(
+            args.from_year,
+            args.to_year,
+            semesters=args.semesters,
+            filename=filename,
+            optimize=not args.no_optimize,
+            patch_folder=patch_folder,
+        )
+    else:
+        generate_dashboards(
+            args.from_year,
+            args.to_year,
+            semesters=args.semesters,
+            workers=args.workers,
+            output_dir=args.output_dir,
+            optimize=not args.no_optimize,
+        )
@@ -0,0 +1,54 @@
+"""
+Monthly course availability: per-month boolean masks vs. `v1.availability` interval counting.
+
+Checks that `kpi_calculator.calculate_monthly_course_availability` gives the same counts as
+the previous mask-based implementation for every semester of several years (see
+`check_availability`, which also runs on its own), then times both for all the semesters a
+user can select and times weekly and daily timelines.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_availability --courses 200000
+"""
+import argparse
+import time
+
+from benchmarks.check_availability import SEMESTERS, YEARS, check_monthly_parity, legacy_monthly_course_availability, synthetic_courses
+from v1 import kpi_calculator
+from v1.availability import CourseAvailabilityIndex
+
+
+def measure(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, default=200_000)
+    args = parser.parse_args()
+
+    courses_df = synthetic_courses(args.courses)
+    index = CourseAvailabilityIndex(courses_df)
+    periods = [(year, semester) for year in YEARS for semester in SEMESTERS]
+
+    check_monthly_parity(courses_df, periods, index)
+    print(f"{args.courses:,} courses, parity ok for {len(periods)} semesters")
+
+    legacy = measure(lambda: [legacy_monthly_course_availability(courses_df, *period) for period in periods])
+    build = measure(lambda: CourseAvailabilityIndex(courses_df))
+    indexed = measure(lambda: [
+        kpi_calculator.calculate_monthly_course_availability(courses_df, *period, availability_index=index)
+        for period in periods
+    ])
+    print(f"{'all semesters, masks (ms)':<34} {legacy:>9.1f}")
+    print(f"{'index build (ms)':<34} {build:>9.1f}")
+    print(f"{'all semesters, index (ms)':<34} {indexed:>9.1f}")
+
+    for freq, label in (("W-MON", "weekly"), ("D", "daily")):
+        timeline = index.timeline("2020-01-01", "2024-12-31", freq)
+        elapsed = measure(lambda: index.timeline("2020-01-01", "2024-12-31", freq))
+        print(f"{f'{label} timeline, {len(timeline)} periods (ms)':<34} {elapsed:>9.1f}")
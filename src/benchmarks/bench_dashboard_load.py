@@ -0,0 +1,351 @@
+"""
+Load test of the v1 Bokeh server dashboard: N simulated sessions changing year and semester.
+
+Writes synthetic DAP CSV exports (`--rows` per table) in a temporary folder and starts a Bokeh
+server for `v1/dashboard.py` on them in a separate process, with its own shared-data export and
+result store, so nothing outside the temporary folder is read or written and no network access
+is needed. For each number of sessions in `--sessions`, a fresh server is started and that many
+sessions are opened (`DashboardClient`, one websocket each, all on one event loop). Every
+session changes the year or the semester to a random other value, waits until the monthly plot
+shows the new selection and thinks for up to `--think` seconds, for `--duration` seconds.
+
+Reports, per number of sessions: session open time, update latency percentiles (from the change
+to the updated document in the client), updates that took longer than `--timeout`, sessions
+that failed (each reported with its error), and the CPU and resident memory of the server
+process (with its child processes). Needs psutil.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_dashboard_load --rows 200000 --sessions 1 5 10 20 --duration 30
+    python -m benchmarks.bench_dashboard_load --no-warm-up   # semesters computed on first use
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from bokeh.client.util import websocket_url_for_server_url
+from bokeh.client.websocket import WebSocketClientConnectionWrapper
+from bokeh.document import Document
+from bokeh.protocol import Protocol
+from bokeh.protocol.receiver import Receiver
+from bokeh.util.token import generate_jwt_token, generate_session_id
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+from benchmarks.bench_datasets import write_csvs
+
+V1_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "v1")
+DASHBOARD_PATH = os.path.join(V1_PATH, "dashboard.py")
+APP_PATH = "/dashboard"
+SAMPLE_SECONDS = 0.5
+PERCENTILES = (50, 90, 95, 99)
+
+
+def configure(folder):
+    """
+    Points the datasets, the shared-data export and the result store at `folder`.
+    """
+    from utils import constants
+    from v1 import datasets
+
+    for name, spec in datasets.DATASETS.items():
+        spec["path"] = os.path.join(folder, f"{name}.csv")
+    constants.SHARED_DATA_PATH = os.path.join(folder, "shared_data")
+    constants.RESULT_STORE_PATH = os.path.join(folder, "result_store")
+
+
+def serve(folder, port, warm_up, ready):
+    """
+    Runs the dashboard on a Bokeh server until the process is terminated.
+    """
+    from bokeh.application import Application
+    from bokeh.application.handlers import ScriptHandler
+    from bokeh.server.server import Server
+
+    from v1 import precompute
+
+    logging.basicConfig(level=logging.WARNING)
+    configure(folder)
+    # The dashboard imports its plot helpers from its own folder
+    sys.path.insert(0, V1_PATH)
+    if not warm_up:
+        precompute.start_warm_up = lambda **kwargs: None
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    server = Server(
+        {APP_PATH: Application(ScriptHandler(filename=DASHBOARD_PATH))},
+        port=port, allow_websocket_origin=[f"localhost:{port}"],
+    )
+    server.start()
+    ready.set()
+    server.io_loop.start()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples the CPU (percent of one core) and resident memory of a process and its children.
+    """
+
+    def __init__(self, pid):
+        import psutil
+
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.samples = []
+        self.running = True
+
+    def _processes(self):
+        return [self.process, *self.process.children(recursive=True)]
+
+    def run(self):
+        import psutil
+
+        cpu_times = {}
+        while self.running:
+            cpu, rss = 0.0, 0
+            for process in self._processes():
+                try:
+                    times = process.cpu_times()
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+                total = times.user + times.system
+                cpu += total - cpu_times.get(process.pid, total)
+                cpu_times[process.pid] = total
+            self.samples.append((100 * cpu / SAMPLE_SECONDS, rss / 2**20))
+            time.sleep(SAMPLE_SECONDS)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        # The first sample has no CPU interval
+        return self.samples[1:] or self.samples
+
+
+class DashboardClient:
+    """
+    A Bokeh protocol client on one websocket, standing in for a browser tab.
+
+    `bokeh.client` handles each message from a recursive coroutine and fails with a
+    RecursionError after a few dozen updates, so this client pulls the document, sends its own
+    changes and applies the server's patches in a flat read loop instead.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.document = Document()
+        self.protocol = Protocol()
+        self.socket = None
+        self.patched = asyncio.Event()
+        self.closed = False
+        self._outgoing = []
+        self._reader = None
+
+    async def connect(self):
+        session_id = generate_session_id()
+        request = HTTPRequest(websocket_url_for_server_url(self.url))
+        connection = await websocket_connect(request, subprotocols=["bokeh", generate_jwt_token(session_id)])
+        self.socket = WebSocketClientConnectionWrapper(connection)
+        self.receiver = Receiver(self.protocol)
+
+        ack = await self._read()
+        if ack is None or ack.msgtype != "ACK":
+            raise RuntimeError(f"Expected ACK, got {ack and ack.msgtype}")
+        await self.protocol.create("PULL-DOC-REQ").send(self.socket)
+        reply = await self._read()
+        if reply is None or reply.msgtype != "PULL-DOC-REPLY":
+            raise RuntimeError(f"Could not pull the document: {reply and reply.content}")
+        reply.push_to_document(self.document)
+        self.document.on_change(self._on_change)
+        self._reader = asyncio.ensure_future(self._read_loop())
+
+    def _on_change(self, event):
+        # Changes made by this client, not the patches it applies from the server
+        if event.setter is not self:
+            self._outgoing.append(event)
+
+    async def _read(self):
+        while True:
+            fragment = await self.socket.read_message()
+            if fragment is None:
+                return None
+            message = await self.receiver.consume(fragment)
+            if message is not None:
+                return message
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = await self._read()
+                if message is None:
+                    break
+                if message.msgtype == "PATCH-DOC":
+                    message.apply_to_document(self.document, self)
+                    self.patched.set()
+        finally:
+            self.closed = True
+            self.patched.set()
+
+    async def send_changes(self):
+        """
+        Sends the changes made to the document since the last call to the server.
+        """
+        events, self._outgoing = self._outgoing, []
+        if events:
+            await self.protocol.create("PATCH-DOC", events).send(self.socket)
+
+    async def wait_for(self, predicate, timeout):
+        """
+        Waits until `predicate()` holds after a patch from the server.
+
+        Raises:
+            asyncio.TimeoutError: If it does not within `timeout` seconds.
+            ConnectionError: If the server closes the connection first.
+        """
+        until = time.perf_counter() + timeout
+        while not predicate():
+            if self.closed:
+                raise ConnectionError("The server closed the connection")
+            self.patched.clear()
+            await asyncio.wait_for(self.patched.wait(), until - time.perf_counter())
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+async def run_session(url, duration, think, timeout, seed, stats):
+    """
+    One simulated user: opens a session, then changes the selection until `duration` is over.
+    """
+    from bokeh.models import Plot, Select
+
+    from v1.precompute import SEMESTERS, YEARS
+
+    rng = random.Random(seed)
+    client = DashboardClient(url)
+    opened = time.perf_counter()
+    await asyncio.wait_for(client.connect(), timeout)
+    stats["open_seconds"].append(time.perf_counter() - opened)
+    try:
+        doc = client.document
+        selects = {select.title: select for select in doc.select({"type": Select})}
+        monthly_plot = next(plot for plot in doc.select({"type": Plot}) if plot.title.text.startswith("Monthly"))
+
+        until = time.perf_counter() + duration
+        while time.perf_counter() < until:
+            await asyncio.sleep(rng.uniform(0, think))
+            year, semester = int(selects["Year"].value), selects["Semester"].value
+            if rng.random() < 0.5:
+                year = rng.choice([y for y in YEARS if y != year])
+                selects["Year"].value = str(year)
+            else:
+                semester = rng.choice([s for s in SEMESTERS if s != semester])
+                selects["Semester"].value = semester
+            expected = f"Monthly Course Availability for {semester} {year}"
+
+            changed = time.perf_counter()
+            await client.send_changes()
+            try:
+                await client.wait_for(lambda: monthly_plot.title.text == expected, timeout)
+                stats["latencies"].append(time.perf_counter() - changed)
+            except asyncio.TimeoutError:
+                stats["timeouts"] += 1
+    finally:
+        client.close()
+
+
+async def run_sessions(url, sessions, args, stats):
+    """
+    Runs the sessions concurrently. A session that fails or outlives its run by more than
+    `args.timeout` is counted as failed, with its error, instead of holding up the others.
+    """
+    limit = args.duration + 3 * args.timeout
+
+    async def run_one(seed):
+        try:
+            await asyncio.wait_for(run_session(url, args.duration, args.think, args.timeout, seed, stats), limit)
+        except Exception as e:
+            stats["failures"].append(f"session {seed}: {type(e).__name__}: {e}")
+
+    await asyncio.gather(*(run_one(seed) for seed in range(sessions)))
+
+
+def run_stage(folder, sessions, args):
+    """
+    Starts a server, runs `sessions` simulated sessions against it and returns the measurements.
+    """
+    context = multiprocessing.get_context("spawn")
+    port = free_port()
+    ready = context.Event()
+    server = context.Process(target=serve, args=(folder, port, not args.no_warm_up, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(120):
+            raise RuntimeError("The dashboard server did not start")
+        sampler = ResourceSampler(server.pid)
+        sampler.start()
+
+        stats = {"open_seconds": [], "latencies": [], "timeouts": 0, "failures": []}
+        asyncio.run(run_sessions(f"http://localhost:{port}{APP_PATH}", sessions, args, stats))
+        stats["resources"] = sampler.stop()
+    finally:
+        server.terminate()
+        server.join()
+    for failure in stats["failures"]:
+        print(f"{sessions} sessions: {failure}")
+    return stats
+
+
+def report(results):
+    header = (
+        f"{'sessions':>8} {'open p50 s':>10} {'updates':>8} "
+        + " ".join(f"{f'p{p} ms':>8}" for p in PERCENTILES)
+        + f" {'max ms':>8} {'timeouts':>8} {'failed':>6} {'CPU avg %':>9} {'CPU max %':>9} {'RSS max MB':>10}"
+    )
+    print(header)
+    for sessions, stats in results.items():
+        latencies = np.array(stats["latencies"]) * 1000
+        cpu = np.array([sample[0] for sample in stats["resources"]])
+        rss = np.array([sample[1] for sample in stats["resources"]])
+        percentiles = np.percentile(latencies, PERCENTILES) if len(latencies) else [np.nan] * len(PERCENTILES)
+        print(
+            f"{sessions:>8} {np.median(stats['open_seconds']):>10.2f} {len(latencies):>8} "
+            + " ".join(f"{value:>8.1f}" for value in percentiles)
+            + f" {latencies.max() if len(latencies) else np.nan:>8.1f} {stats['timeouts']:>8} {len(stats['failures']):>6}"
+            f" {cpu.mean():>9.0f} {cpu.max():>9.0f} {rss.max():>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000, help="rows per synthetic table")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20], help="concurrent sessions, one run each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of changes per run")
+    parser.add_argument("--think", type=float, default=1.0, help="maximum seconds between the changes of a session")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for one update")
+    parser.add_argument("--no-warm-up", action="store_true", help="compute semesters on first use instead of at startup")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_csvs(folder, args.rows)
+        print(f"{args.rows:,} rows per table, {args.duration:.0f}s per run, think time up to {args.think}s, "
+              f"warm-up {'off' if args.no_warm_up else 'on'}")
+        results = {sessions: run_stage(folder, sessions, args) for sessions in args.sessions}
+    report(results)
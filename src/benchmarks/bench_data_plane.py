@@ -0,0 +1,113 @@
+"""
+Time and memory of a full dashboard build from the KPI frames.
+
+Builds and saves the dashboard of synthetic semesters (what `main.save_dashboard` does after
+fetching the KPIs), without the render cache, and reports wall time, peak traced memory
+(tracemalloc) and the number of ColumnDataSources and data columns in the document.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_data_plane --courses 1000 10000 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from bokeh.models import ColumnDataSource
+
+import main
+from utils import course_dimension
+
+
+def synthetic_frames(courses, seed=0):
+    """
+    KPI frames as `main.fetch_kpi` returns them, course names included.
+    """
+    rng = np.random.default_rng(seed)
+    course_ids = np.arange(courses) + 10_000
+    dimension = pd.DataFrame(
+        {"course_name": [f" Lección {i}" if i % 7 == 0 else f"Curso número {i}" for i in range(courses)]},
+        index=pd.Index(course_ids, name="course_id"),
+    )
+    dimension["display_name"] = course_dimension.normalize_course_names(dimension["course_name"])
+    dimension["is_lesson"] = course_dimension.is_lesson(dimension["display_name"])
+
+    total_enrolled = rng.integers(1, 300, courses)
+    completed = (total_enrolled * rng.uniform(0, 1, courses)).astype(int)
+    total = rng.integers(5, 400, courses)
+    active = np.maximum(1, (total * rng.uniform(0.2, 1.0, courses)).astype(int))
+    frames = {
+        "course_reqs_progress": pd.DataFrame({
+            "course_id": course_ids,
+            "completion_percentage": rng.uniform(0.5, 100, courses).round(2),
+        }),
+        "feedback": pd.DataFrame({
+            "course_id": course_ids,
+            "avg_feedback_days": rng.gamma(2.0, 3.0, courses).round(2),
+        }),
+        "completion_rate": pd.DataFrame({
+            "course_id": course_ids,
+            "total_enrolled": total_enrolled,
+            "completed_count": completed,
+            "completion_rate": (completed * 100.0 / total_enrolled).round(2),
+        }),
+        "learning_objective": pd.DataFrame({
+            "course_id": course_ids,
+            "avg_achievement_percentage": rng.uniform(20, 100, courses).round(2),
+            "mastery_percentage": rng.uniform(0, 100, courses).round(2),
+        }),
+        "student_retention": pd.DataFrame({
+            "course_id": course_ids,
+            "term_name": "PRIMAVERA 2024 LICENCIATURA",
+            "total_enrollments": total,
+            "active_enrollments": active,
+            "retention_rate_percentage": (active / total * 100).round(2),
+        }),
+    }
+    frames = {kpi_name: course_dimension.add_course_names(df, dimension) for kpi_name, df in frames.items()}
+    frames["feedback"]["circle_size"] = frames["feedback"]["avg_feedback_days"] * 2
+    return frames
+
+
+def measure(frames, filename):
+    tracemalloc.start()
+    start = time.perf_counter()
+    layout, plots_by_name = main.build_dashboard_layout(2024, "Spring", frames)
+    build = time.perf_counter() - start
+    main.export_dashboard(layout, plots_by_name, filename, "benchmark")
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sources = [model for model in layout.references() if isinstance(model, ColumnDataSource)]
+    return {
+        "build": build * 1000,
+        "total": total * 1000,
+        "peak": peak / 2**20,
+        "sources": len(sources),
+        "columns": sum(len(source.data) for source in sources),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        filename = os.path.join(output_dir, "dashboard.html")
+        for courses in args.courses:
+            frames = synthetic_frames(courses)
+            measure(frames, filename)  # warm up imports and Bokeh
+            rows.append((courses, measure(frames, filename)))
+
+    print(f"\n{'courses':>8} {'build ms':>9} {'build+save ms':>14} {'peak MB':>8} {'sources':>8} {'columns':>8}")
+    for courses, result in rows:
+        print(
+            f"{courses:>8} {result['build']:>9.1f} {result['total']:>14.1f} {result['peak']:>8.1f} "
+            f"{result['sources']:>8} {result['columns']:>8}"
+        )
@@ -0,0 +1,169 @@
+"""
+Loading the v1 dashboard datasets: raw `pd.read_csv` vs. `v1.datasets` cold and warm.
+
+Writes synthetic DAP CSV exports (with the extra columns the real exports have), then loads
+them in a fresh process per mode and reports load time, growth of the resident memory of the
+process (needs psutil), memory of the loaded frames and the time of one run of every KPI
+calculator. Also checks that the KPI calculators give the same results on the raw and the
+typed frames, and that they leave their inputs unchanged.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_datasets --rows 200000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from v1 import datasets, kpi_calculator
+
+MODES = ("read_csv", "cold", "warm")
+
+
+def resident_memory():
+    try:
+        import psutil
+    except ImportError:
+        return float("nan")
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def _timestamps(rng, rows, start="2023-01-01", days=700):
+    offsets = rng.integers(0, days * 86400, rows)
+    return (pd.Timestamp(start, tz="UTC") + pd.to_timedelta(offsets, unit="s")).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def write_csvs(folder, rows, seed=0):
+    """
+    Writes one CSV per dataset with `rows` rows (fewer for courses and assignments).
+    """
+    rng = np.random.default_rng(seed)
+    courses = max(rows // 100, 10)
+    assignments = max(rows // 10, 10)
+    states = np.array(["available", "completed", "deleted", "active", "graded", "submitted"])
+    filler = np.array([f"Texto de relleno {i}" for i in range(50)])
+
+    frames = {
+        "courses": pd.DataFrame({
+            "key.id": np.arange(courses),
+            "value.name": filler[rng.integers(0, 50, courses)],
+            "value.workflow_state": states[rng.integers(0, 3, courses)],
+            "value.created_at": _timestamps(rng, courses),
+            "value.updated_at": _timestamps(rng, courses, start="2024-01-01", days=300),
+        }),
+        "enrollments": pd.DataFrame({
+            "key.id": np.arange(rows),
+            "value.course_id": rng.integers(0, courses, rows),
+            "value.user_id": rng.integers(0, rows // 5 + 1, rows),
+            "value.type": "StudentEnrollment",
+            "value.workflow_state": states[rng.integers(0, 3, rows)],
+            "value.created_at": _timestamps(rng, rows),
+            "value.updated_at": _timestamps(rng, rows, start="2024-01-01", days=300),
+        }),
+        "assignments": pd.DataFrame({
+            "key.id": np.arange(assignments),
+            "value.context_id": rng.integers(0, courses, assignments),
+            "value.title": filler[rng.integers(0, 50, assignments)],
+            "value.created_at": _timestamps(rng, assignments),
+        }),
+        "submissions": pd.DataFrame({
+            "key.id": np.arange(rows),
+            "value.assignment_id": rng.integers(0, assignments, rows),
+            "value.course_id": rng.integers(0, courses, rows),
+            "value.score": np.where(rng.random(rows) < 0.1, np.nan, rng.uniform(0, 100, rows).round(1)),
+            "value.body": filler[rng.integers(0, 50, rows)],
+            "value.workflow_state": states[rng.integers(3, 6, rows)],
+            "value.created_at": _timestamps(rng, rows),
+            "value.updated_at": _timestamps(rng, rows, start="2023-02-01"),
+            "value.submitted_at": _timestamps(rng, rows),
+        }),
+        "scores": pd.DataFrame({
+            "key.id": np.arange(rows),
+            "value.enrollment_id": rng.integers(0, rows, rows),
+            "value.current_score": rng.uniform(0, 100, rows).round(1),
+            "value.final_score": rng.uniform(0, 100, rows).round(1),
+            "value.workflow_state": states[rng.integers(0, 4, rows)],
+            "value.created_at": _timestamps(rng, rows),
+            "value.updated_at": _timestamps(rng, rows, start="2024-01-01", days=300),
+        }),
+    }
+    for name, df in frames.items():
+        df.to_csv(os.path.join(folder, f"{name}.csv"), index=False)
+
+
+def load(folder, mode):
+    """
+    Loads every dataset in the current process; run in a fresh process per mode.
+    """
+    baseline_rss = resident_memory()
+    start = time.perf_counter()
+    frames = {}
+    for name in datasets.DATASETS:
+        csv_path = os.path.join(folder, f"{name}.csv")
+        if mode == "read_csv":
+            frames[name] = pd.read_csv(csv_path)
+        else:
+            frames[name] = datasets.load_dataset(name, csv_path=csv_path)
+    elapsed = time.perf_counter() - start
+
+    rss_growth = resident_memory() - baseline_rss
+    frame_memory = sum(df.memory_usage(deep=True).sum() for df in frames.values()) / 2**20
+
+    # One dashboard update: every KPI calculator for a semester
+    start = time.perf_counter()
+    kpis(frames)
+    update = time.perf_counter() - start
+    return elapsed, rss_growth, frame_memory, update
+
+
+def kpis(frames, year=2024, semester="Spring"):
+    return [
+        kpi_calculator.create_ratio_of_course_availability_and_activity_for_semester(frames["courses"], year, semester)[:2],
+        kpi_calculator.calculate_monthly_course_availability(frames["courses"], year, semester),
+        kpi_calculator.create_student_retention_rate(frames["enrollments"], year, semester),
+        kpi_calculator.calculate_tasks_completion_rate(frames["assignments"], frames["submissions"], year, semester),
+        round(kpi_calculator.calculate_average_score(frames["scores"], year, semester), 9),
+        len(kpi_calculator.calculate_score_distribution(frames["scores"], year, semester)),
+        kpi_calculator.calculate_feedback_time_vs_assignment_count(frames["submissions"], year, semester)["assignment_count"].sum(),
+        round(kpi_calculator.calculate_average_assignment_score(frames["assignments"], frames["submissions"])["value.score"].sum(), 6),
+    ]
+
+
+def check_parity(folder):
+    raw = {name: pd.read_csv(os.path.join(folder, f"{name}.csv")) for name in datasets.DATASETS}
+    typed = {name: datasets.load_dataset(name, csv_path=os.path.join(folder, f"{name}.csv")) for name in datasets.DATASETS}
+    before = {name: df.copy() for name, df in typed.items()}
+
+    if kpis(raw) != kpis(typed):
+        raise AssertionError(f"KPIs differ:\n{kpis(raw)}\n{kpis(typed)}")
+    for name, df in typed.items():
+        pd.testing.assert_frame_equal(df, before[name], obj=f"{name} after the KPI calculators")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_csvs(folder, args.rows)
+        csv_size = sum(os.path.getsize(os.path.join(folder, f"{name}.csv")) for name in datasets.DATASETS) / 2**20
+        print(f"{args.rows:,} rows per table, {csv_size:.1f} MB of CSV")
+
+        results = {}
+        for mode in MODES:
+            # A fresh process per mode, so peak memory is not shared between modes
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results[mode] = executor.submit(load, folder, mode).result()
+
+        check_parity(folder)
+
+    print(f"{'mode':<10} {'load s':>8} {'RSS growth MB':>14} {'frames MB':>10} {'KPI update s':>13}")
+    for mode, (elapsed, rss_growth, frame_memory, update) in results.items():
+        print(f"{mode:<10} {elapsed:>8.2f} {rss_growth:>14.1f} {frame_memory:>10.1f} {update:>13.2f}")
+    print("KPI parity: ok, inputs unchanged")
@@ -0,0 +1,99 @@
+"""
+Joins of the v1 KPI calculators: `pd.merge` on every call vs. gathers by position through `v1.key_index`.
+
+Builds typed synthetic tables (`--rows` submissions and scores, a tenth as many assignments and a
+twentieth as many enrollments), checks that `calculate_average_assignment_score` and
+`courses_with_high_failing_enrollments` give the same results as their previous merge-based
+versions (for every semester of 2024), then times one call of each both ways and the one-off
+build of the key indexes.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_key_index --rows 10000000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.bench_out_of_core import build_frames
+from utils.helpers import get_semester_dates
+from v1 import kpi_calculator
+from v1.key_index import build_key_indexes
+
+SEMESTERS = ("Spring", "Summer", "Winter")
+REPEATS = 3
+
+
+def legacy_high_failing(enrollments_df, scores_df, year, semester, failing_threshold=60, fail_count_threshold=10):
+    start_date, end_date = get_semester_dates(year, semester)
+    created = kpi_calculator.get_time_index(enrollments_df, 'value.created_at').between(start_date, end_date)
+    semester_enrollments = created[created['value.workflow_state'] == 'available']
+    merged_df = semester_enrollments.merge(
+        scores_df[['value.enrollment_id', 'value.final_score']], left_on='key.id', right_on='value.enrollment_id', how='left'
+    )
+    failing_enrollments = merged_df[(merged_df['value.final_score'] < failing_threshold) | (merged_df['value.final_score'].isnull())]
+    failing_counts = failing_enrollments.groupby('value.enrollment_id').size().reset_index(name='failing_enrollments')
+    return failing_counts[failing_counts['failing_enrollments'] >= fail_count_threshold]
+
+
+def legacy_average_assignment_score(assignments_df, submissions_df):
+    assignments = pd.DataFrame({
+        'key.id': assignments_df['key.id'].astype(int),
+        'value.context_id': assignments_df['value.context_id'].astype(int),
+    })
+    submissions = pd.DataFrame({
+        'value.assignment_id': submissions_df['value.assignment_id'].astype(int),
+        'value.score': pd.to_numeric(submissions_df['value.score'], errors='coerce'),
+    })
+    merged_df = pd.merge(submissions, assignments, left_on='value.assignment_id', right_on='key.id', how='inner')
+    merged_df = merged_df.dropna(subset=['value.score'])
+    average_scores = merged_df.groupby('value.context_id')['value.score'].mean().reset_index()
+    average_scores['value.context_id'] = average_scores['value.context_id'].astype(str)
+    return average_scores.rename(columns={'value.context_id': 'course_id'})
+
+
+def best_time(run):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    frames = build_frames(args.rows)
+    kpi_calculator.get_time_index(frames["enrollments"], "value.created_at")
+    start = time.perf_counter()
+    build_key_indexes(frames, kpi_calculator.KEY_INDEX_COLUMNS)
+    build_seconds = time.perf_counter() - start
+
+    # The budget is lifted so that both versions join in memory
+    calls = {
+        "average_assignment_score": (
+            lambda: legacy_average_assignment_score(frames["assignments"], frames["submissions"]),
+            lambda: kpi_calculator.calculate_average_assignment_score(frames["assignments"], frames["submissions"], memory_budget=None),
+        ),
+        "high_failing_enrollments": (
+            lambda semester="Spring": legacy_high_failing(frames["enrollments"], frames["scores"], 2024, semester),
+            lambda semester="Spring": kpi_calculator.courses_with_high_failing_enrollments(
+                frames["enrollments"], frames["scores"], 2024, semester, memory_budget=None
+            ),
+        ),
+    }
+
+    legacy, indexed = calls["average_assignment_score"]
+    pd.testing.assert_frame_equal(legacy(), indexed(), rtol=1e-9)
+    legacy, indexed = calls["high_failing_enrollments"]
+    for semester in SEMESTERS:
+        pd.testing.assert_frame_equal(legacy(semester), indexed(semester))
+
+    print(f"{args.rows:,} submissions and scores; results identical; key indexes built in {build_seconds:.2f}s")
+    print(f"{'calculator':<26} {'merge s':>8} {'gather s':>9} {'speedup':>8}")
+    for name, (legacy, indexed) in calls.items():
+        merge_seconds, gather_seconds = best_time(legacy), best_time(indexed)
+        print(f"{name:<26} {merge_seconds:>8.3f} {gather_seconds:>9.3f} {merge_seconds / gather_seconds:>7.1f}x")
@@ -0,0 +1,82 @@
+"""
+Level-of-detail rendering of the per-course bar charts.
+
+For a growing number of courses, builds the retention and learning objective plots with one
+bar per course and in level-of-detail mode, and reports build and serialization time, number
+of Bokeh models, glyphs drawn per course and the size of the optimized document. Browser
+rendering time grows with the document size and the number of bars/factors, which is what
+this measures headlessly.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_lod --courses 100 1000 5000 20000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from bokeh.core.serialization import Serializer
+from bokeh.models import ColumnDataSource, FactorRange
+
+import plots
+from utils import document_optimizer
+
+
+def synthetic_frames(courses, seed=0):
+    rng = np.random.default_rng(seed)
+    course_ids = np.arange(courses) + 10_000
+    names = [f"Curso {i}" for i in range(courses)]
+    total = rng.integers(5, 400, courses)
+    active = np.maximum(1, (total * rng.uniform(0.2, 1.0, courses)).astype(int))
+    retention = pd.DataFrame({
+        "course_id": course_ids,
+        "course_name": names,
+        "term_name": "PRIMAVERA 2024 LICENCIATURA",
+        "total_enrollments": total,
+        "active_enrollments": active,
+        "retention_rate_percentage": (active / total * 100).round(2),
+    })
+    learning = pd.DataFrame({
+        "course_id": course_ids,
+        "course_name": names,
+        "avg_achievement_percentage": rng.uniform(20, 100, courses).round(2),
+        "mastery_percentage": rng.uniform(0, 100, courses).round(2),
+    })
+    return {"retention": retention, "learning": learning}
+
+
+def measure(plot_function, df, lod_threshold):
+    start = time.perf_counter()
+    plot = plot_function(ColumnDataSource(df), lod_threshold=lod_threshold)
+    build = time.perf_counter() - start
+
+    document_optimizer.optimize_document(plot)
+    start = time.perf_counter()
+    size = len(json.dumps(Serializer(deferred=False).encode(plot), separators=(",", ":")))
+    serialize = time.perf_counter() - start
+
+    models = list(plot.references())
+    factors = sum(len(model.factors) for model in models if isinstance(model, FactorRange))
+    return {"build": build * 1000, "serialize": serialize * 1000, "models": len(models), "factors": factors, "size": size / 1024}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    args = parser.parse_args()
+
+    cases = (
+        ("retention", plots.create_students_retention_rate_plot),
+        ("learning", plots.plot_learning_objective_completion),
+    )
+    print(f"{'plot':<10} {'courses':>8} {'mode':<7} {'build ms':>9} {'serialize ms':>13} {'models':>7} {'factors':>8} {'size KB':>9}")
+    for courses in args.courses:
+        frames = synthetic_frames(courses)
+        for name, plot_function in cases:
+            for mode, threshold in (("detail", None), ("lod", 0)):
+                result = measure(plot_function, frames[name], threshold)
+                print(
+                    f"{name:<10} {courses:>8} {mode:<7} {result['build']:>9.1f} {result['serialize']:>13.1f} "
+                    f"{result['models']:>7} {result['factors']:>8} {result['size']:>9.1f}"
+                )
@@ -0,0 +1,124 @@
+"""
+Joins of the v1 KPI calculators: in memory vs. by partitions spilled to disk (`v1.out_of_core`).
+
+Builds typed synthetic tables (`--rows` submissions and scores, a tenth as many assignments and a
+twentieth as many enrollments) in a fresh process per mode, then runs
+`calculate_average_assignment_score` and `courses_with_high_failing_enrollments` with no memory
+budget (in memory) and with `--budget` MB (by partitions). Reports the time of each and the peak
+growth of the resident memory of the process while it runs (sampled, needs psutil), and checks
+that both modes give the same results.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_out_of_core --rows 20000000 --budget 256
+"""
+import argparse
+import gc
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from v1 import kpi_calculator
+
+MODES = ("in memory", "partitioned")
+SAMPLE_SECONDS = 0.005
+
+
+def build_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    assignments, enrollments = max(rows // 10, 10), max(rows // 20, 10)
+    missing = rng.random(rows) < 0.1
+    return {
+        "assignments": pd.DataFrame({
+            "key.id": pd.array(np.arange(assignments), dtype="Int64"),
+            "value.context_id": pd.array(rng.integers(0, max(assignments // 10, 1), assignments), dtype="Int64"),
+        }),
+        "submissions": pd.DataFrame({
+            "value.assignment_id": pd.array(rng.integers(0, assignments, rows), dtype="Int64"),
+            "value.score": np.where(missing, np.nan, rng.uniform(0, 100, rows)),
+        }),
+        "enrollments": pd.DataFrame({
+            "key.id": pd.array(np.arange(enrollments), dtype="Int64"),
+            "value.workflow_state": pd.Categorical(rng.choice(["available", "deleted"], enrollments, p=[0.9, 0.1])),
+            "value.created_at": pd.Timestamp("2024-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 365 * 86400, enrollments), unit="s"),
+        }),
+        "scores": pd.DataFrame({
+            "value.enrollment_id": pd.array(rng.integers(0, enrollments, rows), dtype="Int64"),
+            "value.final_score": np.where(missing, np.nan, rng.uniform(0, 100, rows)),
+        }),
+    }
+
+
+def peak_memory_growth(run):
+    """
+    Runs `run()`; returns its result, its time and the peak growth of the resident memory (MB).
+    """
+    import psutil
+
+    process = psutil.Process()
+    gc.collect()
+    baseline = process.memory_info().rss
+    peak, done = [baseline], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], process.memory_info().rss)
+            time.sleep(SAMPLE_SECONDS)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return result, elapsed, (max(peak[0], process.memory_info().rss) - baseline) / 2**20
+
+
+def run_mode(mode, rows, budget):
+    frames = build_frames(rows)
+    # The time index of the enrollments is built once, outside the measurements
+    kpi_calculator.get_time_index(frames["enrollments"], "value.created_at")
+    memory_budget = None if mode == "in memory" else budget
+    average, average_seconds, average_memory = peak_memory_growth(
+        lambda: kpi_calculator.calculate_average_assignment_score(frames["assignments"], frames["submissions"], memory_budget=memory_budget)
+    )
+    failing, failing_seconds, failing_memory = peak_memory_growth(
+        lambda: kpi_calculator.courses_with_high_failing_enrollments(
+            frames["enrollments"], frames["scores"], 2024, "Spring", memory_budget=memory_budget
+        )
+    )
+    return {
+        "average_assignment_score": (average, average_seconds, average_memory),
+        "high_failing_enrollments": (failing, failing_seconds, failing_memory),
+    }
+
+
+def check_parity(results):
+    expected, actual = (results[mode] for mode in MODES)
+    pd.testing.assert_frame_equal(expected["average_assignment_score"][0], actual["average_assignment_score"][0], rtol=1e-9)
+    pd.testing.assert_frame_equal(expected["high_failing_enrollments"][0], actual["high_failing_enrollments"][0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--budget", type=int, default=256, help="memory budget of the partitioned joins, in MB")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for mode in MODES:
+        # A fresh process per mode, so the peak memory of one mode does not hide the other's
+        with context.Pool(1) as pool:
+            results[mode] = pool.apply(run_mode, (mode, args.rows, args.budget * 2**20))
+    check_parity(results)
+
+    print(f"{args.rows:,} submissions and scores, budget {args.budget} MB; results identical")
+    print(f"{'calculator':<26} {'mode':<12} {'time s':>8} {'peak MB':>8}")
+    for name in results[MODES[0]]:
+        for mode in MODES:
+            _, seconds, memory = results[mode][name]
+            print(f"{name:<26} {mode:<12} {seconds:>8.2f} {memory:>8.1f}")
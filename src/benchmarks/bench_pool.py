@@ -0,0 +1,62 @@
+"""
+Effect of the connection pool settings on concurrent KPI execution.
+
+Runs every KPI query of a semester `--rounds` times from `--concurrency` threads for each
+pool configuration and reports wall time together with the pool metrics (checkout wait,
+peak connections in use, overflow and connect latency).
+
+Usage (from `src/`, needs DATABASE_URL):
+    python -m benchmarks.bench_pool --year 2023 --semester Spring --concurrency 10
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from db_config import DatabaseEngineFactory
+from utils.constants import APP_NAME
+
+WORKLOAD = "benchmark"
+POOL_CONFIGURATIONS = [
+    {"pool_size": 1, "max_overflow": 0},
+    {"pool_size": 2, "max_overflow": 2},
+    {"pool_size": 4, "max_overflow": 0},
+    {"pool_size": 4, "max_overflow": 28},
+    {"pool_size": 10, "max_overflow": 0},
+]
+
+
+def run_configuration(settings, year, semester, concurrency, rounds):
+    DatabaseEngineFactory.dispose(WORKLOAD)
+    DatabaseEngineFactory.configure_pool(WORKLOAD, pool_timeout=300, **settings)
+    engine = DatabaseEngineFactory.create(application_name=APP_NAME, workload=WORKLOAD)
+
+    jobs = [kpi_name for _ in range(rounds) for kpi_name in main.KPI_QUERIES]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda kpi_name: main.fetch_kpi(kpi_name, year, semester, engine), jobs))
+    elapsed = time.perf_counter() - start
+
+    snapshot = DatabaseEngineFactory.get_pool_metrics(WORKLOAD).snapshot()
+    DatabaseEngineFactory.dispose(WORKLOAD)
+    return elapsed, len(jobs), snapshot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--year", type=int, default=2023)
+    parser.add_argument("--semester", default="Spring")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    header = f"{'pool':>6} {'overflow':>8} {'wall (s)':>9} {'q/s':>7} {'avg wait':>9} {'p95 wait':>9} {'peak use':>8} {'peak ovf':>8} {'connect':>8}"
+    print(header)
+    print("-" * len(header))
+    for settings in POOL_CONFIGURATIONS:
+        elapsed, jobs, snapshot = run_configuration(settings, args.year, args.semester, args.concurrency, args.rounds)
+        print(
+            f"{settings['pool_size']:>6} {settings['max_overflow']:>8} {elapsed:>9.2f} {jobs / elapsed:>7.2f} "
+            f"{snapshot['avg_wait_ms']:>7.1f}ms {snapshot['p95_wait_ms']:>7.1f}ms {snapshot['peak_in_use']:>8} "
+            f"{snapshot['peak_overflow']:>8} {snapshot['avg_connect_ms']:>6.1f}ms"
+        )
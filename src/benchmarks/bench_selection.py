@@ -0,0 +1,97 @@
+"""
+Top / bottom / average course selection at institution scale.
+
+Compares the previous pandas implementation (full sort, `avg_diff` column, `nsmallest`,
+`pd.concat` and per-category boolean filtering) with `utils.selection`, checks that both pick
+the same values, and times the plots that use it on synthetic courses.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_selection --courses 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from bokeh.models import ColumnDataSource
+
+import plots
+from utils import selection
+
+N = 10
+AVG_COUNT = 10
+LABELS = ("Top", "Bottom", "Average")
+
+
+def legacy_selection(df, column, n=N, avg_count=AVG_COUNT):
+    df = df.copy()
+    sorted_df = df.sort_values(by=column, ascending=False)
+    top_n = sorted_df.head(n)
+    bottom_n = sorted_df.tail(n)
+
+    avg = df[column].mean()
+    df["avg_diff"] = abs(df[column] - avg)
+    avg_courses = df.nsmallest(avg_count, "avg_diff")
+
+    selected_df = pd.concat([top_n, bottom_n, avg_courses])
+    selected_df["category"] = ["Top"] * len(top_n) + ["Bottom"] * len(bottom_n) + ["Average"] * len(avg_courses)
+    return {category: selected_df[selected_df["category"] == category] for category in LABELS}
+
+
+def partition_selection(df, column, n=N, avg_count=AVG_COUNT):
+    selected_df, slices, _ = selection.select_frame(df, column, n, avg_count, labels=LABELS)
+    return {category: selected_df.iloc[rows] for category, rows in slices.items()}
+
+
+def synthetic_frame(courses, seed=0):
+    rng = np.random.default_rng(seed)
+    total_enrolled = rng.integers(1, 300, courses)
+    return pd.DataFrame({
+        "course_id": np.arange(courses) + 10_000,
+        "course_name": [f"Curso {i}" for i in range(courses)],
+        "completion_percentage": rng.uniform(0, 100, courses).round(2),
+        "avg_feedback_days": rng.gamma(2.0, 3.0, courses).round(2),
+        "completion_rate": rng.uniform(0.5, 99.5, courses).round(2),
+        "total_enrolled": total_enrolled,
+        "completed_count": (total_enrolled * rng.uniform(0, 1, courses)).astype(int),
+    })
+
+
+def measure(func, *args, repeat=5):
+    func(*args)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def check_parity(df, column):
+    legacy, partition = legacy_selection(df, column), partition_selection(df, column)
+    for category in LABELS:
+        expected = np.sort(legacy[category][column].to_numpy())
+        actual = np.sort(partition[category][column].to_numpy())
+        if not np.array_equal(expected, actual):
+            raise AssertionError(f"{column}/{category}: selections differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.courses)
+    print(f"{args.courses:,} courses")
+    print(f"{'selection':<24} {'pandas sort (ms)':>17} {'partition (ms)':>15} {'speedup':>8}")
+    for column in ("completion_percentage", "avg_feedback_days", "completion_rate"):
+        check_parity(df, column)
+        legacy = measure(legacy_selection, df, column, repeat=args.repeat)
+        partition = measure(partition_selection, df, column, repeat=args.repeat)
+        print(f"{column:<24} {legacy:>17.1f} {partition:>15.1f} {legacy / partition:>7.1f}x")
+
+    print(f"\n{'plot':<40} {'time (ms)':>10}")
+    source = ColumnDataSource(df)
+    for plot_function in (plots.create_progress_in_course_requirements, plots.create_feedback_bar_chart, plots.create_course_completion_rate):
+        print(f"{plot_function.__name__:<40} {measure(plot_function, source, repeat=args.repeat):>10.1f}")
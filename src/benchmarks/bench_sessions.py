@@ -0,0 +1,61 @@
+"""
+Session open/close overhead of `SessionManager`.
+
+Compares building a new `sessionmaker` per session (the previous behaviour) against the
+cached session factory and the reused read-only sessions, with and without a trivial query.
+
+Usage (from `src/`, needs DATABASE_URL):
+    python -m benchmarks.bench_sessions --iterations 5000
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from db_config import DatabaseEngineFactory, SessionManager
+from utils.constants import APP_NAME
+
+WORKLOAD = "benchmark"
+
+
+def legacy_session(engine, query):
+    session = sessionmaker(autocommit=False, expire_on_commit=False, autoflush=False, bind=engine)()
+    try:
+        if query:
+            session.execute(text("SELECT 1"))
+    finally:
+        session.close()
+
+
+def cached_session(engine, query):
+    with SessionManager(workload=WORKLOAD) as session:
+        if query:
+            session.execute(text("SELECT 1"))
+
+
+def read_only_session(engine, query):
+    with SessionManager(workload=WORKLOAD, read_only=True) as session:
+        if query:
+            session.execute(text("SELECT 1"))
+
+
+def measure(func, engine, iterations, query):
+    func(engine, query)  # warm up the pool and the factory
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(engine, query)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine = DatabaseEngineFactory.create(application_name=APP_NAME, workload=WORKLOAD)
+    print(f"{'session':<22} {'open/close (us)':>16} {'with SELECT 1 (us)':>19}")
+    for name, func in (("new sessionmaker", legacy_session), ("cached factory", cached_session), ("reused read-only", read_only_session)):
+        empty = measure(func, engine, args.iterations, query=False)
+        with_query = measure(func, engine, max(args.iterations // 10, 1), query=True)
+        print(f"{name:<22} {empty:>16.1f} {with_query:>19.1f}")
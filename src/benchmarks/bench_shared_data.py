@@ -0,0 +1,111 @@
+"""
+Memory of v1 dashboard sessions: datasets loaded per session vs. `v1.shared_data`.
+
+Writes synthetic DAP CSV exports, then opens sessions the way the dashboard script does at the
+top of each session: "per-session" loads the typed datasets and builds their time indexes for
+every session (as each session did before), "shared" takes them from `get_shared_datasets`
+(memory-mapped Arrow, once per process). Every session also computes the KPIs of one semester.
+Reports the unique memory (USS) of the process as sessions are added, and the total
+proportional memory (PSS) of several server processes holding one session each. Needs psutil.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_shared_data --rows 1000000 --sessions 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from benchmarks.bench_datasets import kpis, write_csvs
+from v1 import datasets, kpi_calculator, shared_data
+from v1.time_index import build_time_indexes
+
+MODES = ("per-session", "shared")
+
+
+def memory():
+    import psutil
+
+    info = psutil.Process().memory_full_info()
+    return info.uss / 2**20, info.pss / 2**20
+
+
+def configure(folder):
+    # Worker processes are spawned: point the dataset specs at the synthetic CSVs in each of them
+    for name, spec in datasets.DATASETS.items():
+        spec["path"] = os.path.join(folder, f"{name}.csv")
+
+
+def open_session(mode, folder):
+    """
+    What one dashboard session holds: the frames (with their indexes) and one semester of KPIs.
+    """
+    if mode == "per-session":
+        frames = datasets.load_datasets()
+        build_time_indexes(frames, kpi_calculator.TIME_INDEX_COLUMNS)
+    else:
+        frames = shared_data.get_shared_datasets(folder=os.path.join(folder, "shared")).frames
+    return frames, kpis(frames)
+
+
+def sessions_in_one_process(mode, folder, sessions):
+    configure(folder)
+    held, usage = [], []
+    for _ in range(sessions):
+        held.append(open_session(mode, folder))
+        usage.append(memory()[0])
+    return usage
+
+
+def one_session_process(mode, folder, barrier, results):
+    configure(folder)
+    session = open_session(mode, folder)  # noqa: F841 (held while measured)
+    # Measured once every process holds its session
+    barrier.wait()
+    results.put(memory())
+    barrier.wait()
+
+
+def sessions_in_processes(mode, folder, processes):
+    context = multiprocessing.get_context("spawn")
+    barrier, results = context.Barrier(processes), context.Queue()
+    workers = [context.Process(target=one_session_process, args=(mode, folder, barrier, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    usage = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(uss for uss, _ in usage), sum(pss for _, pss in usage)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_csvs(folder, args.rows)
+        configure(folder)
+        # Feather caches and the shared export are written once, before measuring
+        datasets.load_datasets()
+        shared_data.get_shared_datasets(folder=os.path.join(folder, "shared"))
+        print(f"{args.rows:,} rows per table")
+
+        context = multiprocessing.get_context("spawn")
+        by_sessions = {}
+        for mode in MODES:
+            with context.Pool(1) as pool:
+                by_sessions[mode] = pool.apply(sessions_in_one_process, (mode, folder, args.sessions))
+        by_processes = {mode: sessions_in_processes(mode, folder, args.processes) for mode in MODES}
+
+    print("\nOne server process, USS (MB) by open sessions")
+    print(f"{'sessions':>8} " + " ".join(f"{mode:>12}" for mode in MODES))
+    for i in range(args.sessions):
+        print(f"{i + 1:>8} " + " ".join(f"{by_sessions[mode][i]:>12.1f}" for mode in MODES))
+
+    print(f"\n{args.processes} server processes with one session each (MB)")
+    print(f"{'mode':<12} {'total USS':>10} {'total PSS':>10}")
+    for mode, (uss, pss) in by_processes.items():
+        print(f"{mode:<12} {uss:>10.1f} {pss:>10.1f}")
@@ -0,0 +1,191 @@
+"""
+Semester filters of the v1 KPI calculators: boolean masks over whole tables vs. `v1.time_index` slices.
+
+Builds typed synthetic tables (10M submissions by default, fewer rows in the other tables),
+checks that every time-filtered KPI calculator gives the same result as its previous mask-based
+version for every semester of several years, then times one dashboard update (all of them for
+one semester) both ways, and the one-off sort of the tables.
+
+Usage (from `src/`):
+    python -m benchmarks.bench_time_index --submissions 10000000
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.helpers import get_semester_dates
+from v1 import kpi_calculator
+from v1.time_index import TimeIndex, build_time_indexes
+
+YEARS = range(2022, 2025)
+SEMESTERS = ("Spring", "Summer", "Winter")
+
+
+def legacy_retention(enrollments_df, year, semester):
+    start, end = get_semester_dates(year, semester)
+    available = enrollments_df['value.workflow_state'] == 'available'
+    initial = enrollments_df[(enrollments_df['value.created_at'] <= start) & available].shape[0]
+    final = enrollments_df[(enrollments_df['value.updated_at'] >= end) & available].shape[0]
+    return final / initial * 100 if initial > 0 else 0
+
+
+def legacy_completion(assignments_df, submissions_df, year, semester):
+    start, end = get_semester_dates(year, semester)
+    created_at, submitted_at = assignments_df['value.created_at'], submissions_df['value.submitted_at']
+    assignments = assignments_df[(created_at >= start) & (created_at <= end)]
+    submissions = submissions_df[
+        (submitted_at >= start) & (submitted_at <= end) & (submissions_df['value.workflow_state'] == 'graded')
+    ]
+    total = assignments['key.id'].nunique()
+    return submissions['value.assignment_id'].nunique() / total * 100 if total else 0.0
+
+
+def legacy_average_score(scores_df, year, semester):
+    start, end = get_semester_dates(year, semester)
+    updated_at = scores_df['value.updated_at']
+    scores = scores_df[(updated_at >= start) & (updated_at <= end) & (scores_df['value.workflow_state'] == 'active')]
+    return 0.0 if scores.empty else scores['value.current_score'].mean()
+
+
+def legacy_score_distribution(scores_df, year, semester):
+    start, end = get_semester_dates(year, semester)
+    updated_at = scores_df['value.updated_at']
+    scores = scores_df[(scores_df['value.created_at'] <= end) & ((updated_at >= start) | updated_at.isna())]
+    return scores['value.final_score'].dropna()
+
+
+def legacy_feedback_time(submissions_df, year, semester):
+    start, end = get_semester_dates(year, semester)
+    created_at, updated_at = submissions_df['value.created_at'], submissions_df['value.updated_at']
+    in_semester = (created_at >= start) & (created_at <= end)
+    feedback = submissions_df.loc[in_semester, ['value.course_id']].assign(
+        feedback_time=(updated_at[in_semester] - created_at[in_semester]).dt.total_seconds() / 3600
+    ).dropna(subset=['feedback_time'])
+    grouped = feedback.groupby('value.course_id')['feedback_time']
+    return pd.DataFrame({'average_feedback_time': grouped.mean(), 'assignment_count': grouped.size()}).reset_index()
+
+
+def legacy_kpis(frames, year, semester):
+    return [
+        legacy_retention(frames["enrollments"], year, semester),
+        legacy_completion(frames["assignments"], frames["submissions"], year, semester),
+        legacy_average_score(frames["scores"], year, semester),
+        legacy_score_distribution(frames["scores"], year, semester),
+        legacy_feedback_time(frames["submissions"], year, semester),
+    ]
+
+
+def indexed_kpis(frames, year, semester):
+    return [
+        kpi_calculator.create_student_retention_rate(frames["enrollments"], year, semester),
+        kpi_calculator.calculate_tasks_completion_rate(frames["assignments"], frames["submissions"], year, semester),
+        kpi_calculator.calculate_average_score(frames["scores"], year, semester),
+        kpi_calculator.calculate_score_distribution(frames["scores"], year, semester),
+        kpi_calculator.calculate_feedback_time_vs_assignment_count(frames["submissions"], year, semester),
+    ]
+
+
+def _timestamps(rng, rows, start="2022-01-01", days=3 * 365, missing=0.0):
+    timestamps = pd.Timestamp(start, tz="UTC") + pd.to_timedelta(rng.integers(0, days * 86400, rows), unit="s")
+    return timestamps.where(rng.random(rows) >= missing)
+
+
+def synthetic_frames(submissions, seed=0):
+    """
+    Typed tables as `v1.datasets` loads them, with `submissions` submissions.
+    """
+    rng = np.random.default_rng(seed)
+    enrollments = max(submissions // 5, 10)
+    assignments = max(submissions // 50, 10)
+    courses = max(submissions // 1000, 10)
+
+    def states(rows, names):
+        return pd.Categorical.from_codes(rng.integers(0, len(names), rows), categories=names)
+
+    submission_created = _timestamps(rng, submissions)
+    return {
+        "enrollments": pd.DataFrame({
+            "key.id": pd.array(np.arange(enrollments), dtype="Int64"),
+            "value.course_id": pd.array(rng.integers(0, courses, enrollments), dtype="Int64"),
+            "value.workflow_state": states(enrollments, ["available", "completed", "deleted"]),
+            "value.created_at": _timestamps(rng, enrollments, missing=0.01),
+            "value.updated_at": _timestamps(rng, enrollments, missing=0.01),
+        }),
+        "assignments": pd.DataFrame({
+            "key.id": pd.array(np.arange(assignments), dtype="Int64"),
+            "value.context_id": pd.array(rng.integers(0, courses, assignments), dtype="Int64"),
+            "value.created_at": _timestamps(rng, assignments),
+        }),
+        "submissions": pd.DataFrame({
+            "value.assignment_id": pd.array(rng.integers(0, assignments, submissions), dtype="Int64"),
+            "value.course_id": pd.array(rng.integers(0, courses, submissions), dtype="Int64"),
+            "value.workflow_state": states(submissions, ["graded", "submitted", "pending_review"]),
+            "value.created_at": submission_created,
+            # Graded up to two weeks later, some never
+            "value.updated_at": (submission_created + pd.to_timedelta(rng.integers(0, 14 * 86400, submissions), unit="s"))
+            .where(rng.random(submissions) >= 0.05),
+            "value.submitted_at": _timestamps(rng, submissions, missing=0.1),
+        }),
+        "scores": pd.DataFrame({
+            "value.enrollment_id": pd.array(rng.integers(0, enrollments, enrollments), dtype="Int64"),
+            "value.current_score": rng.uniform(0, 100, enrollments).round(1),
+            "value.final_score": np.where(rng.random(enrollments) < 0.1, np.nan, rng.uniform(0, 100, enrollments).round(1)),
+            "value.workflow_state": states(enrollments, ["active", "deleted"]),
+            "value.created_at": _timestamps(rng, enrollments, missing=0.01),
+            "value.updated_at": _timestamps(rng, enrollments, missing=0.05),
+        }),
+    }
+
+
+def check_parity(expected, actual, label):
+    retention, completion, average, distribution, feedback = expected
+    if actual[0] != retention or actual[1] != completion:
+        raise AssertionError(f"{label}: rates {actual[:2]} != {[retention, completion]}")
+    if not math.isclose(actual[2], average, rel_tol=1e-12):
+        raise AssertionError(f"{label}: average score {actual[2]} != {average}")
+    # Same scores, in time order instead of table order
+    if not np.array_equal(np.sort(actual[3].to_numpy()), np.sort(distribution.to_numpy())):
+        raise AssertionError(f"{label}: score distributions differ")
+    pd.testing.assert_frame_equal(
+        actual[4][["value.course_id", "average_feedback_time", "assignment_count"]], feedback,
+        check_exact=False, rtol=1e-9, obj=f"{label} feedback time",
+    )
+
+
+def measure(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--submissions", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.submissions)
+    rows = ", ".join(f"{len(df):,} {name}" for name, df in frames.items())
+    print(rows)
+
+    start = time.perf_counter()
+    build_time_indexes(frames, kpi_calculator.TIME_INDEX_COLUMNS)
+    build = (time.perf_counter() - start) * 1000
+    submissions_sort = measure(lambda: TimeIndex(frames["submissions"], "value.created_at"), repeat=1)
+
+    periods = [(year, semester) for year in YEARS for semester in SEMESTERS]
+    for year, semester in periods:
+        check_parity(legacy_kpis(frames, year, semester), indexed_kpis(frames, year, semester), f"{semester} {year}")
+    print(f"parity ok for {len(periods)} semesters")
+
+    legacy = measure(lambda: legacy_kpis(frames, 2024, "Spring"))
+    indexed = measure(lambda: indexed_kpis(frames, 2024, "Spring"))
+    print(f"{'build all time indexes (ms)':<38} {build:>9.1f}")
+    print(f"{'submissions by created_at alone (ms)':<38} {submissions_sort:>9.1f}")
+    print(f"{'one semester update, masks (ms)':<38} {legacy:>9.1f}")
+    print(f"{'one semester update, slices (ms)':<38} {indexed:>9.1f}")
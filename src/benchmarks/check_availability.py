@@ -0,0 +1,128 @@
+"""
+Parity checks of `v1.availability`, fast enough to run on every change (a couple of seconds).
+
+`check_monthly_parity` compares `kpi_calculator.calculate_monthly_course_availability` with the
+previous mask-based implementation (`legacy_monthly_course_availability`) for every semester of
+several years. `check_known_counts` runs both on a few hand-written courses whose counts are
+known: courses without a start or end date, and courses that end before they start. Any
+difference raises an AssertionError. `bench_availability` runs the parity check on its own
+(larger) data before timing.
+
+Usage (from `src/`):
+    python -m benchmarks.check_availability
+"""
+import numpy as np
+import pandas as pd
+
+from v1 import kpi_calculator
+from v1.availability import CourseAvailabilityIndex
+
+COURSES = 5_000
+YEARS = range(2020, 2025)
+SEMESTERS = ("Spring", "Summer", "Winter")
+MONTHS = {
+    'spring': ['January', 'February', 'March', 'April', 'May', 'June'],
+    'summer': ['June', 'July'],
+    'winter': ['August', 'September', 'October', 'November', 'December'],
+}
+
+# Courses of Spring 2024 (January to June) and their expected counts
+KNOWN_COURSES = pd.DataFrame(
+    [
+        # Available with no end: active every month
+        ("available", "2023-12-01", None),
+        # No start: never counted
+        ("available", None, "2024-03-15"),
+        ("available", None, None),
+        # Not available with no end: never inactive
+        ("completed", "2023-01-01", None),
+        # Ended in February: inactive from March
+        ("completed", "2023-01-01", "2024-02-10"),
+        # End before start: active only where both conditions hold (April), never from its end alone
+        ("available", "2024-04-20", "2024-04-05"),
+        ("available", "2024-03-10", "2024-02-01"),
+        # End before start: inactive only once started (May), not from its end in January
+        ("deleted", "2024-05-20", "2024-01-15"),
+    ],
+    columns=["value.workflow_state", "value.created_at", "value.updated_at"],
+).assign(**{
+    "value.created_at": lambda df: pd.to_datetime(df["value.created_at"], utc=True),
+    "value.updated_at": lambda df: pd.to_datetime(df["value.updated_at"], utc=True),
+})
+KNOWN_COUNTS = {
+    "month": ["January", "February", "March", "April", "May", "June"],
+    "active": [1, 1, 1, 2, 1, 1],
+    "inactive": [0, 0, 1, 1, 2, 2],
+}
+
+
+def legacy_monthly_course_availability(courses_df, year, semester):
+    start_at = pd.to_datetime(courses_df['value.created_at'], utc=True)
+    end_at = pd.to_datetime(courses_df['value.updated_at'], utc=True)
+
+    active_counts, inactive_counts = [], []
+    for month in MONTHS[semester.lower()]:
+        month_start = pd.Timestamp(f"{year}-{month}-01", tz='UTC')
+        month_end = month_start + pd.offsets.MonthEnd(1)
+        active_counts.append(courses_df[
+            (courses_df['value.workflow_state'] == 'available') &
+            (start_at <= month_end) &
+            ((end_at >= month_start) | end_at.isna())
+        ].shape[0])
+        inactive_counts.append(courses_df[
+            (courses_df['value.workflow_state'] != 'available') &
+            (start_at <= month_end) &
+            (end_at < month_start) &
+            end_at.notna()
+        ].shape[0])
+    return {'month': MONTHS[semester.lower()], 'active': active_counts, 'inactive': inactive_counts}
+
+
+def synthetic_courses(courses, seed=0):
+    rng = np.random.default_rng(seed)
+    origin = pd.Timestamp("2019-06-01", tz="UTC")
+    start = origin + pd.to_timedelta(rng.integers(0, 5 * 365 * 86400, courses), unit="s")
+    end = start + pd.to_timedelta(rng.integers(-30 * 86400, 400 * 86400, courses), unit="s")
+    df = pd.DataFrame({
+        "value.workflow_state": pd.Categorical(rng.choice(["available", "completed", "deleted", "claimed"], courses)),
+        "value.created_at": start,
+        "value.updated_at": end,
+    })
+    # Courses without dates
+    df.loc[rng.random(courses) < 0.02, "value.created_at"] = pd.NaT
+    df.loc[rng.random(courses) < 0.05, "value.updated_at"] = pd.NaT
+    return df
+
+
+def check_monthly_parity(courses_df, periods, availability_index=None):
+    """
+    Raises an AssertionError if the index and the masks give different counts for a period.
+    """
+    if availability_index is None:
+        availability_index = CourseAvailabilityIndex(courses_df)
+    for year, semester in periods:
+        expected = legacy_monthly_course_availability(courses_df, year, semester)
+        actual = kpi_calculator.calculate_monthly_course_availability(
+            courses_df, year, semester, availability_index=availability_index
+        )
+        if expected != actual:
+            raise AssertionError(f"{semester} {year}: {expected} != {actual}")
+
+
+def check_known_counts():
+    """
+    Raises an AssertionError if the hand-written courses do not give their expected counts.
+    """
+    for name, counts in (
+        ("masks", legacy_monthly_course_availability(KNOWN_COURSES, 2024, "Spring")),
+        ("index", kpi_calculator.calculate_monthly_course_availability(KNOWN_COURSES, 2024, "Spring")),
+    ):
+        if counts != KNOWN_COUNTS:
+            raise AssertionError(f"{name}: {counts} != {KNOWN_COUNTS}")
+
+
+if __name__ == "__main__":
+    check_known_counts()
+    periods = [(year, semester) for year in YEARS for semester in SEMESTERS]
+    check_monthly_parity(synthetic_courses(COURSES), periods)
+    print(f"availability ok: known counts, parity for {COURSES:,} courses over {len(periods)} semesters")
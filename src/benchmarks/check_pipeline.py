@@ -0,0 +1,90 @@
+"""
+Checks of `pipeline` when a stage fails, fast enough to run on every change (a couple of seconds).
+
+`check_failing_stage` runs a pipeline where stage `a` fails while `b` is still running and `c`
+waits for `b`. The error must reach the caller, `b` and `c` must be in the timeline as cancelled
+and the timeline report must still be written, with the failed and cancelled stages. Any
+difference raises an AssertionError.
+
+Usage (from `src/`):
+    python -m benchmarks.check_pipeline
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import pipeline
+from pipeline import Stage
+
+
+class StageError(Exception):
+    pass
+
+
+def failing_stages():
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise StageError("a failed")
+
+    def slow(**_):
+        time.sleep(0.3)
+        return "slow"
+
+    async def slow_async(**_):
+        await asyncio.sleep(0.3)
+        return "slow"
+
+    return [
+        Stage("a", fail),
+        Stage("b", slow_async),
+        Stage("b_thread", slow),
+        Stage("c", slow, deps=["b"]),
+        Stage("d", slow_async, deps=["a"]),
+    ]
+
+
+def check_failing_stage():
+    """
+    Raises an AssertionError if a failing stage does not cancel the others and leave a full report.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        report_path = os.path.join(folder, "timeline.json")
+        try:
+            pipeline.run_stages(failing_stages, report_path)
+        except StageError:
+            pass
+        else:
+            raise AssertionError("the error of stage a was not raised")
+
+        if not os.path.exists(report_path):
+            raise AssertionError("no timeline report written")
+        with open(report_path, encoding="utf-8") as report_file:
+            report = json.load(report_file)
+
+    statuses = {name: entry["status"] for name, entry in report["stages"].items()}
+    expected = {"a": "failed: a failed", "b": "cancelled", "b_thread": "cancelled", "c": "cancelled", "d": "cancelled"}
+    if statuses != expected:
+        raise AssertionError(f"{statuses} != {expected}")
+    if report["failed"] != ["a"] or sorted(report["cancelled"]) != ["b", "b_thread", "c", "d"]:
+        raise AssertionError(f"failed {report['failed']}, cancelled {report['cancelled']}")
+
+
+def check_successful_stages():
+    """
+    Raises an AssertionError if a pipeline without failures does not run every stage.
+    """
+    stages = failing_stages()[1:4]
+    with tempfile.TemporaryDirectory() as folder:
+        report = pipeline.run_stages(lambda: stages, os.path.join(folder, "timeline.json"))
+    if {name: entry["status"] for name, entry in report["stages"].items()} != dict.fromkeys(["b", "b_thread", "c"], "done"):
+        raise AssertionError(f"{report['stages']}")
+    if report["failed"] or report["cancelled"]:
+        raise AssertionError(f"failed {report['failed']}, cancelled {report['cancelled']}")
+
+
+if __name__ == "__main__":
+    check_failing_stage()
+    check_successful_stages()
+    print("pipeline ok: a failing stage cancels the others and the report is written")
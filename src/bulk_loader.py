@@ -0,0 +1,394 @@
+"""
+Bulk loader for DAP snapshot files.
+
+Loads the JSONL snapshots downloaded by `v1/canvas.py` into the tables defined in
+`db/schema.sql` using `COPY ... FROM STDIN`, without going through the DAP service.
+Snapshots are expected under `<snapshots_path>/<table>/**/*.json[l][.gz]`.
+"""
+import glob
+import gzip
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List
+
+from db_config import DatabaseEngineFactory
+from utils import manifest
+from utils.constants import (
+    APP_NAME,
+    COPY_BATCH_SIZE,
+    COPY_WORKERS,
+    NAMESPACE,
+    SCHEMA_PATH,
+    SNAPSHOT_MANIFEST_PATH,
+    SNAPSHOTS_PATH,
+    TABLES_FOR_KPIS_IN_CANVAS,
+)
+
+UNSPECIFIED_ENUM_VALUE = "__dap_unspecified__"
+
+CREATE_TABLE_PATTERN = re.compile(r'^CREATE TABLE "(?P<namespace>\w+)"\."(?P<table>\w+)" \($')
+CREATE_ENUM_PATTERN = re.compile(r'^CREATE TYPE "(?P<namespace>\w+)"\."(?P<name>\w+)" AS ENUM \((?P<values>.*)\);$')
+COLUMN_PATTERN = re.compile(r'^"(?P<column>\w+)" (?P<type>.+?)(?: NOT NULL)?(?: DEFAULT .*)?,?$')
+
+SNAPSHOT_FILE_PATTERNS = ("*.json", "*.jsonl", "*.json.gz", "*.jsonl.gz")
+
+
+# Schema parsing
+def parse_schema(schema_path: str = SCHEMA_PATH, namespace: str = NAMESPACE) -> Dict[str, List[dict]]:
+    """
+    Parses the DAP schema file and returns the loadable columns of every table in a namespace.
+
+    Columns typed with composite types that are not defined in the schema (e.g. `"canvas"."Annotated"`)
+    are left out, so they are loaded as NULL.
+
+    Returns:
+        dict: Table name -> list of column dicts with `name`, `is_array` and `enum_values` keys.
+    """
+    enums = {}
+    tables = {}
+    current_table = None
+
+    with open(schema_path, encoding="utf-8") as schema_file:
+        for line in schema_file:
+            line = line.strip()
+
+            enum_match = CREATE_ENUM_PATTERN.match(line)
+            if enum_match:
+                values = re.findall(r"'((?:[^']|'')*)'", enum_match.group("values"))
+                enums[f'"{enum_match.group("namespace")}"."{enum_match.group("name")}"'] = {
+                    value.replace("''", "'") for value in values
+                }
+                continue
+
+            table_match = CREATE_TABLE_PATTERN.match(line)
+            if table_match:
+                current_table = table_match.group("table") if table_match.group("namespace") == namespace else None
+                if current_table:
+                    tables[current_table] = []
+                continue
+
+            if current_table is None:
+                continue
+            if line.startswith("CONSTRAINT") or line == ");":
+                current_table = None
+                continue
+
+            column_match = COLUMN_PATTERN.match(line)
+            if not column_match:
+                continue
+
+            column_type = column_match.group("type")
+            is_array = column_type.endswith(" ARRAY")
+            base_type = column_type[: -len(" ARRAY")] if is_array else column_type
+            if base_type.startswith('"') and base_type not in enums:
+                continue
+
+            tables[current_table].append({
+                "name": column_match.group("column"),
+                "is_array": is_array,
+                "enum_values": enums.get(base_type),
+            })
+
+    return tables
+
+
+# Record encoding
+def _escape_copy_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _format_array_element(value) -> str:
+    if value is None:
+        return "NULL"
+    text = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _format_value(value, column: dict) -> str:
+    if value is None:
+        return "\\N"
+    if column["is_array"]:
+        return _escape_copy_text("{" + ",".join(_format_array_element(item) for item in value) + "}")
+    if column["enum_values"] is not None and value not in column["enum_values"]:
+        return UNSPECIFIED_ENUM_VALUE
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        return _escape_copy_text(json.dumps(value))
+    return _escape_copy_text(str(value))
+
+
+def snapshot_record_to_row(record: dict, columns: List[dict]) -> str:
+    """
+    Maps a DAP snapshot record (`{"key": {...}, "value": {...}, "meta": {...}}`) to one line
+    of COPY text format following the column order in `columns`.
+    """
+    fields = {**record.get("value", {}), **record.get("key", {})}
+    return "\t".join(_format_value(fields.get(column["name"]), column) for column in columns) + "\n"
+
+
+# Snapshot files
+def find_snapshot_files(table: str, snapshots_path: str = SNAPSHOTS_PATH) -> List[str]:
+    files = []
+    for pattern in SNAPSHOT_FILE_PATTERNS:
+        files.extend(glob.glob(os.path.join(snapshots_path, table, "**", pattern), recursive=True))
+    return sorted(set(files))
+
+
+def _open_snapshot_file(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_copy_batches(path: str, columns: List[dict], batch_size: int = COPY_BATCH_SIZE) -> Iterable[io.StringIO]:
+    """
+    Reads a snapshot file and yields COPY-ready buffers of at most `batch_size` rows.
+    """
+    buffer = io.StringIO()
+    rows_in_buffer = 0
+
+    with _open_snapshot_file(path) as snapshot_file:
+        for line in snapshot_file:
+            if not line.strip():
+                continue
+            buffer.write(snapshot_record_to_row(json.loads(line), columns))
+            rows_in_buffer += 1
+
+            if rows_in_buffer >= batch_size:
+                buffer.seek(0)
+                yield buffer
+                buffer = io.StringIO()
+                rows_in_buffer = 0
+
+    if rows_in_buffer:
+        buffer.seek(0)
+        yield buffer
+
+
+# Index maintenance
+INDEX_DEFINITIONS_QUERY = """
+SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace
+LEFT JOIN pg_constraint c ON c.conindid = i.indexrelid AND c.contype IN ('p', 'u', 'x')
+WHERE n.nspname = %(namespace)s
+  AND t.relname = ANY(%(tables)s)
+  AND c.oid IS NULL;
+"""
+
+CONSTRAINT_DEFINITIONS_QUERY = """
+SELECT c.conrelid::regclass::text, c.conname, c.contype, pg_get_constraintdef(c.oid)
+FROM pg_constraint c
+JOIN pg_class t ON t.oid = c.conrelid
+JOIN pg_class r ON r.oid = COALESCE(NULLIF(c.confrelid, 0), c.conrelid)
+JOIN pg_namespace n ON n.oid = t.relnamespace
+JOIN pg_namespace rn ON rn.oid = r.relnamespace
+WHERE c.contype IN ('p', 'u', 'f')
+  AND (
+      (n.nspname = %(namespace)s AND t.relname = ANY(%(tables)s))
+      OR (c.contype = 'f' AND rn.nspname = %(namespace)s AND r.relname = ANY(%(tables)s))
+  );
+"""
+
+
+def drop_indexes(cursor, tables: List[str], namespace: str = NAMESPACE) -> dict:
+    """
+    Drops foreign keys, primary/unique keys and plain indexes touching `tables` so that COPY
+    does not maintain them row by row. Returns the definitions needed by `rebuild_indexes`.
+    """
+    params = {"namespace": namespace, "tables": list(tables)}
+
+    cursor.execute(INDEX_DEFINITIONS_QUERY, params)
+    indexes = cursor.fetchall()
+    cursor.execute(CONSTRAINT_DEFINITIONS_QUERY, params)
+    constraints = cursor.fetchall()
+
+    # Foreign keys first, they depend on the primary keys they reference
+    foreign_keys = [constraint for constraint in constraints if constraint[2] == "f"]
+    keys = [constraint for constraint in constraints if constraint[2] != "f"]
+
+    for table_name, constraint_name, _, _ in foreign_keys + keys:
+        cursor.execute(f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{constraint_name}"')
+    for index_name, _ in indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+    return {"indexes": indexes, "keys": keys, "foreign_keys": foreign_keys}
+
+
+def rebuild_indexes(cursor, definitions: dict):
+    """
+    Recreates the keys and indexes dropped by `drop_indexes`.
+    """
+    for table_name, constraint_name, _, definition in definitions["keys"]:
+        cursor.execute(f'ALTER TABLE {table_name} ADD CONSTRAINT "{constraint_name}" {definition}')
+    for _, definition in definitions["indexes"]:
+        cursor.execute(definition)
+    for table_name, constraint_name, _, definition in definitions["foreign_keys"]:
+        # NOT VALID skips the full re-check of rows that were just loaded from a consistent snapshot
+        cursor.execute(f'ALTER TABLE {table_name} ADD CONSTRAINT "{constraint_name}" {definition} NOT VALID')
+
+
+def _rebuild_and_clear(connection, cursor, definitions: dict, manifest_path: str):
+    """
+    Rebuilds dropped keys and indexes in one transaction, then removes them from the manifest.
+    When the rebuild fails, they stay in the manifest for the next run.
+    """
+    try:
+        rebuild_indexes(cursor, definitions)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    with manifest.update_manifest(manifest_path) as snapshot_manifest:
+        manifest.set_pending_indexes(snapshot_manifest, None)
+
+
+# Loading
+def _copy_file(engine, table: str, path: str, columns: List[dict], namespace: str, batch_size: int) -> int:
+    column_list = ", ".join(f'"{column["name"]}"' for column in columns)
+    copy_statement = f'COPY "{namespace}"."{table}" ({column_list}) FROM STDIN'
+    rows = 0
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET statement_timeout = 0")
+        cursor.execute("SET synchronous_commit = off")
+        for batch in iter_copy_batches(path, columns, batch_size):
+            cursor.copy_expert(copy_statement, batch)
+            rows += cursor.rowcount
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    return rows
+
+
+def load_tables(
+    tables: List[str] = TABLES_FOR_KPIS_IN_CANVAS,
+    snapshots_path: str = SNAPSHOTS_PATH,
+    namespace: str = NAMESPACE,
+    workers: int = COPY_WORKERS,
+    batch_size: int = COPY_BATCH_SIZE,
+    truncate: bool = True,
+    schema_path: str = SCHEMA_PATH,
+    manifest_path: str = SNAPSHOT_MANIFEST_PATH,
+    force: bool = False,
+) -> Dict[str, int]:
+    """
+    Bulk loads the snapshot files of `tables` into the database.
+
+    Keys and indexes of the tables are dropped before loading and rebuilt at the end, also when
+    a copy fails. Their definitions are kept in the snapshot manifest until they are rebuilt,
+    and a run that finds some there (its previous run was interrupted) restores them first.
+    Snapshot files are copied in parallel by `workers` connections, so large tables split in
+    several part files are loaded concurrently as well.
+
+    Tables whose snapshot content was already loaded (according to the snapshot manifest)
+    are skipped unless `force` is set. Tables are only marked as loaded once their keys and
+    indexes are rebuilt.
+
+    Returns:
+        dict: Table name -> number of rows loaded.
+    """
+    schema = parse_schema(schema_path, namespace)
+    unknown_tables = [table for table in tables if table not in schema]
+    if unknown_tables:
+        raise ValueError(f"Tables not defined in {schema_path}: {', '.join(unknown_tables)}")
+
+    snapshot_manifest = manifest.load_manifest(manifest_path)
+    files_by_table = {}
+    # Content hash of the snapshot each table is loaded from, marked as loaded at the end
+    loaded_hashes = {}
+    for table in tables:
+        entry = manifest.get_table_entry(snapshot_manifest, table)
+        if entry and not force and manifest.is_stage_current(snapshot_manifest, table, "loaded"):
+            print(f"Snapshot of '{table}' already loaded, skipping")
+            continue
+        files = entry["files"] if entry else find_snapshot_files(table, snapshots_path)
+        if not files:
+            print(f"No snapshot files found for table: {table}")
+            continue
+        files_by_table[table] = files
+        loaded_hashes[table] = entry["sha256"] if entry else None
+
+    tables_to_load = list(files_by_table)
+    pending_definitions = manifest.get_pending_indexes(snapshot_manifest)
+    if not tables_to_load and not pending_definitions:
+        return {}
+
+    engine = DatabaseEngineFactory.create(application_name=f"{APP_NAME}-bulk-loader", workload="sync")
+    rows_by_table = {table: 0 for table in tables_to_load}
+    start_time = time.perf_counter()
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET statement_timeout = 0")
+        if pending_definitions:
+            print("Restoring keys and indexes dropped by an interrupted load")
+            _rebuild_and_clear(connection, cursor, pending_definitions, manifest_path)
+        if not tables_to_load:
+            return {}
+
+        definitions = drop_indexes(cursor, tables_to_load, namespace)
+        if truncate:
+            table_list = ", ".join(f'"{namespace}"."{table}"' for table in tables_to_load)
+            cursor.execute(f"TRUNCATE {table_list}")
+        connection.commit()
+        # Kept in the manifest until they are rebuilt, so that a rerun restores them if this run stops
+        with manifest.update_manifest(manifest_path) as snapshot_manifest:
+            manifest.set_pending_indexes(snapshot_manifest, definitions)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(_copy_file, engine, table, path, schema[table], namespace, batch_size): table
+                    for table in tables_to_load
+                    for path in files_by_table[table]
+                }
+                for future in as_completed(futures):
+                    rows_by_table[futures[future]] += future.result()
+        finally:
+            # Also when a copy failed: the tables must never be left without their keys
+            print("Rebuilding keys and indexes")
+            _rebuild_and_clear(connection, cursor, definitions, manifest_path)
+
+        for table in tables_to_load:
+            cursor.execute(f'ANALYZE "{namespace}"."{table}"')
+        connection.commit()
+
+        with manifest.update_manifest(manifest_path) as snapshot_manifest:
+            for table in tables_to_load:
+                manifest.mark_stage_done(snapshot_manifest, table, "loaded", loaded_hashes[table])
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    elapsed = time.perf_counter() - start_time
+    total_rows = sum(rows_by_table.values())
+    for table, rows in rows_by_table.items():
+        print(f"Loaded {rows} rows into {namespace}.{table}")
+    print(f"Loaded {total_rows} rows in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/s)")
+
+    return rows_by_table
+
+
+if __name__ == "__main__":
+    load_tables(tables=TABLES_FOR_KPIS_IN_CANVAS, snapshots_path=SNAPSHOTS_PATH)
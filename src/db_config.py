@@ -1,14 +1,19 @@
+import json
 import logging
 import os
+import threading
 import time
+from collections import deque
 from contextlib import contextmanager
-from typing import Generator, Optional
+from typing import Dict, Generator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.engine import Engine
-from utils.constants import APP_NAME, DEFAULT_STATEMENT_TIMEOUT
+from utils.constants import APP_NAME, DEFAULT_STATEMENT_TIMEOUT, DEFAULT_WORKLOAD, POOL_PROFILES
 from sqlalchemy import text
 from dotenv import load_dotenv
 
@@ -19,16 +24,154 @@ log = logging.getLogger(__name__)
 Base = declarative_base()
 load_dotenv()
 
+class PoolMetrics:
+    """
+    Connection pool instrumentation built on SQLAlchemy pool events.
+
+    Tracks checkout wait time, connections in use, overflow usage and connect latency for one engine.
+    """
+    max_samples = 1000
+
+    def __init__(self, workload: str):
+        self.workload = workload
+        self.pool = None
+        self._lock = threading.Lock()
+        self._connect_started = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.timeouts = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.peak_overflow = 0
+            self.connects = 0
+            self.wait_samples = deque(maxlen=self.max_samples)
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.total_connect_time = 0.0
+            self.max_connect_time = 0.0
+
+    def attach(self, engine: Engine):
+        self.pool = engine.pool
+        engine.pool.metrics = self
+        event.listen(engine, "do_connect", self._on_do_connect)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_do_connect(self, dialect, conn_rec, cargs, cparams):
+        self._connect_started.value = time.perf_counter()
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        started = getattr(self._connect_started, "value", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        self._connect_started.value = None
+        with self._lock:
+            self.connects += 1
+            self.total_connect_time += elapsed
+            self.max_connect_time = max(self.max_connect_time, elapsed)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if self.pool is not None:
+                self.peak_overflow = max(self.peak_overflow, self.pool.overflow())
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_samples.append(seconds)
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self.wait_samples)
+            checkouts = max(self.checkouts, 1)
+            return {
+                "workload": self.workload,
+                "pool_size": self.pool.size() if self.pool is not None else None,
+                "checked_out": self.pool.checkedout() if self.pool is not None else self.in_use,
+                "overflow": max(self.pool.overflow(), 0) if self.pool is not None else 0,
+                "peak_in_use": self.peak_in_use,
+                "peak_overflow": max(self.peak_overflow, 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / checkouts * 1000, 3),
+                "p95_wait_ms": round(waits[int(len(waits) * 0.95) - 1] * 1000, 3) if waits else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "connects": self.connects,
+                "avg_connect_ms": round(self.total_connect_time / max(self.connects, 1) * 1000, 3),
+                "max_connect_ms": round(self.max_connect_time * 1000, 3),
+            }
+
+    def log_snapshot(self, level: int = logging.INFO):
+        log.log(level, "Connection pool metrics: %s", json.dumps(self.snapshot()))
+
+
+_checkout_state = threading.local()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that reports how long each checkout waited for a connection to `metrics`.
+    """
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        # QueuePool._do_get retries recursively, only the outermost call is timed
+        if getattr(_checkout_state, "timing", False):
+            return super()._do_get()
+
+        _checkout_state.timing = True
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            _checkout_state.timing = False
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
 # Database Engine Factory
 class DatabaseEngineFactory:
-    _instance: Optional[create_engine] = None
-    db_uri_env_var: str = None
+    _instances: Dict[str, Engine] = {}
+    _metrics: Dict[str, PoolMetrics] = {}
+    _session_factories: Dict[str, sessionmaker] = {}
+    _statement_timeouts: Dict[str, Optional[float]] = {}
+    _lock = threading.Lock()
+    db_uri_env_var: str = "DATABASE_URL"
     with_composites: bool = False
     default_statement_timeout: Optional[int] = DEFAULT_STATEMENT_TIMEOUT.total_seconds()
+    pool_profiles: Dict[str, dict] = {name: dict(settings) for name, settings in POOL_PROFILES.items()}
 
     @classmethod
     def get_db_uri(cls):
-        db_uri = os.getenv("DATABASE_URL")
+        db_uri = os.getenv(cls.db_uri_env_var)
         if not db_uri:
             raise RuntimeError(f"No {cls.db_uri_env_var} defined")
         return db_uri
@@ -41,63 +184,206 @@ class DatabaseEngineFactory:
     def get_statement_timeout(cls, statement_timeout):
         stmt_timeout = statement_timeout or cls.default_statement_timeout
         if stmt_timeout is not None:
-            return {"options": f"-c statement_timeout={int(stmt_timeout * 1000)}"}
-        return {}
+            return f"-c statement_timeout={int(stmt_timeout * 1000)}"
+        return ""
 
     @classmethod
     def get_search_path(cls): 
-        return {"options": "-c search_path=canvas"}
+        return "-c search_path=canvas"
     
     @classmethod
     def get_connection_args(cls, application_name, statement_timeout):
+        # Both settings travel in the same libpq `options` string
+        options = " ".join(
+            option for option in (cls.get_statement_timeout(statement_timeout), cls.get_search_path()) if option
+        )
         return {
             **cls.get_application_name(application_name),
-            **cls.get_statement_timeout(statement_timeout),
-            **cls.get_search_path(),
+            "options": options,
         }
 
     @classmethod
-    def create(cls, application_name, statement_timeout: Optional[int] = None) -> Engine:
-        if not cls._instance:
-            cls._create_engine(application_name, statement_timeout)
-        return cls._instance
+    def get_pool_settings(cls, workload: str = DEFAULT_WORKLOAD) -> dict:
+        """
+        Pool settings of a workload. Each value can be overridden with an environment
+        variable such as `DB_POOL_SIZE_DASHBOARD` or `DB_MAX_OVERFLOW_SYNC`.
+        """
+        settings = dict(cls.pool_profiles.get(workload, cls.pool_profiles[DEFAULT_WORKLOAD]))
+        for key, env_prefix in (("pool_size", "DB_POOL_SIZE"), ("max_overflow", "DB_MAX_OVERFLOW"), ("pool_timeout", "DB_POOL_TIMEOUT")):
+            env_value = os.getenv(f"{env_prefix}_{workload.upper()}")
+            if env_value is not None:
+                settings[key] = float(env_value) if key == "pool_timeout" else int(env_value)
+        return settings
+
+    @classmethod
+    def configure_pool(cls, workload: str, **settings):
+        """
+        Overrides the pool settings of a workload. Takes effect the next time its engine is created.
+        """
+        profile = dict(cls.pool_profiles.get(workload, cls.pool_profiles[DEFAULT_WORKLOAD]))
+        profile.update(settings)
+        cls.pool_profiles[workload] = profile
+
+    @classmethod
+    def create(cls, application_name, statement_timeout: Optional[int] = None, workload: str = DEFAULT_WORKLOAD) -> Engine:
+        if workload not in cls._instances:
+            with cls._lock:
+                if workload not in cls._instances:
+                    cls._create_engine(application_name, statement_timeout, workload)
+        return cls._instances[workload]
 
     @classmethod
-    def _create_engine(cls, application_name, statement_timeout):
-        cls._instance = create_engine(
+    def _create_engine(cls, application_name, statement_timeout, workload: str = DEFAULT_WORKLOAD):
+        engine = create_engine(
             cls.get_db_uri(),
+            poolclass=InstrumentedQueuePool,
             pool_pre_ping=True,
-            pool_size=4,
-            max_overflow=28,
+            **cls.get_pool_settings(workload),
             connect_args=cls.get_connection_args(application_name, statement_timeout),
         )
+        metrics = PoolMetrics(workload)
+        metrics.attach(engine)
+        cls._metrics[workload] = metrics
+        cls._statement_timeouts[workload] = statement_timeout or cls.default_statement_timeout
+        cls._instances[workload] = engine
         # if cls.with_composites:
         #     register_composites(cls._instance.connect())
 
+    @classmethod
+    def get_pool_metrics(cls, workload: str = DEFAULT_WORKLOAD) -> Optional[PoolMetrics]:
+        return cls._metrics.get(workload)
+
+    @classmethod
+    def pool_snapshots(cls) -> Dict[str, dict]:
+        return {workload: metrics.snapshot() for workload, metrics in cls._metrics.items()}
+
+    @classmethod
+    def dispose(cls, workload: Optional[str] = None):
+        """
+        Closes the engine of a workload (or of all workloads) so it is created again with the current settings.
+        """
+        with cls._lock:
+            for name in [workload] if workload else list(cls._instances):
+                engine = cls._instances.pop(name, None)
+                if engine is not None:
+                    engine.dispose()
+                cls._metrics.pop(name, None)
+                cls._session_factories.pop(name, None)
+                cls._statement_timeouts.pop(name, None)
+
+    @classmethod
+    def get_session_factory(cls, application_name=APP_NAME, statement_timeout: Optional[int] = None, workload: str = DEFAULT_WORKLOAD) -> sessionmaker:
+        """
+        Returns the session factory bound to the engine of `workload`, built once and reused.
+        """
+        factory = cls._session_factories.get(workload)
+        if factory is None:
+            engine = cls.create(application_name=application_name, statement_timeout=statement_timeout, workload=workload)
+            with cls._lock:
+                factory = cls._session_factories.setdefault(
+                    workload, sessionmaker(autocommit=False, expire_on_commit=False, autoflush=False, bind=engine)
+                )
+        return factory
+
+    @classmethod
+    def get_engine_statement_timeout(cls, workload: str = DEFAULT_WORKLOAD) -> Optional[float]:
+        return cls._statement_timeouts.get(workload)
+
     @classmethod
     def generate_session(
-        cls, application_name=APP_NAME, statement_timeout: Optional[int] = DEFAULT_STATEMENT_TIMEOUT.total_seconds()
+        cls,
+        application_name=APP_NAME,
+        statement_timeout: Optional[int] = DEFAULT_STATEMENT_TIMEOUT.total_seconds(),
+        workload: str = DEFAULT_WORKLOAD,
+        read_only: bool = False,
     ) -> Session:
-        engine = cls.create(application_name=application_name, statement_timeout=statement_timeout)
-        return sessionmaker(autocommit=False, expire_on_commit=False, autoflush=False, bind=engine)()
+        session = cls.get_session_factory(application_name, statement_timeout, workload)()
+        configure_session(session, statement_timeout, workload, read_only)
+        return session
+
+
+def configure_session(session: Session, statement_timeout: Optional[float], workload: str = DEFAULT_WORKLOAD, read_only: bool = False):
+    """
+    Stores the per-session settings applied by `_apply_session_settings` at the start of every transaction.
+    """
+    engine_timeout = DatabaseEngineFactory.get_engine_statement_timeout(workload)
+    session.info["statement_timeout"] = statement_timeout if statement_timeout != engine_timeout else None
+    session.info["read_only"] = read_only
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_session_settings(session, transaction, connection):
+    # SET LOCAL only lasts for the current transaction, so the pooled connection keeps the engine defaults
+    if connection.dialect.name != "postgresql":
+        return
+    if session.info.get("read_only"):
+        connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+    statement_timeout = session.info.get("statement_timeout")
+    if statement_timeout is not None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout * 1000)}")
 
 
 def clean_dirty_instances(db):
-    dirty_instances = db.dirty
-    while dirty_instances:
-        if os.getenv("ENVIRONMENT", "local") == "local":
-            instance = dirty_instances.pop()
-            db.expunge(instance)
+    dirty_instances = list(db.dirty)
+    if dirty_instances and os.getenv("ENVIRONMENT", "local") != "local":
+        log.warning(f"Discarding {len(dirty_instances)} dirty instances from session")
+    for instance in dirty_instances:
+        db.expunge(instance)
+
+
+_read_only_sessions = threading.local()
+
+
+def _get_read_only_session(application_name, statement_timeout, workload) -> Session:
+    """
+    Read-only sessions are reused by the thread that opened them. Closing a session releases its
+    connection back to the pool, so keeping the Session object around holds no database resources.
+    """
+    sessions = getattr(_read_only_sessions, "sessions", None)
+    if sessions is None:
+        sessions = _read_only_sessions.sessions = {}
+
+    factory = DatabaseEngineFactory.get_session_factory(application_name, statement_timeout, workload)
+    session = sessions.pop(workload, None)
+    # The engine of the workload may have been disposed and recreated since the session was cached
+    if session is None or session.bind is not factory.kw["bind"]:
+        session = factory()
+    configure_session(session, statement_timeout, workload, read_only=True)
+    return session
+
+
+def _release_read_only_session(session: Session, workload: str):
+    session.close()
+    _read_only_sessions.sessions[workload] = session
+
 
 @contextmanager
 def SessionManager(
-    application_name=APP_NAME, statement_timeout: Optional[int] = DEFAULT_STATEMENT_TIMEOUT.total_seconds()
+    application_name=APP_NAME,
+    statement_timeout: Optional[int] = DEFAULT_STATEMENT_TIMEOUT.total_seconds(),
+    workload: str = DEFAULT_WORKLOAD,
+    read_only: bool = False,
 ) -> Generator[Session, None, None]:  # noqa
-    db = DatabaseEngineFactory.generate_session(application_name=application_name, statement_timeout=statement_timeout)
+    """
+    Provides a session bound to the engine of `workload`.
+
+    `statement_timeout` is applied per transaction, so sessions with different timeouts share
+    the same engine. Read-only sessions (e.g. for KPI queries) run in READ ONLY transactions
+    and are reused within the thread that opened them.
+    """
+    if read_only:
+        db = _get_read_only_session(application_name, statement_timeout, workload)
+    else:
+        db = DatabaseEngineFactory.generate_session(
+            application_name=application_name, statement_timeout=statement_timeout, workload=workload
+        )
     try:
         clean_dirty_instances(db)
         start_time = time.time()
         yield db
-        log.info(f"Session started at {start_time}")
+        log.debug(f"Session started at {start_time}")
     finally:
-        db.close()
\ No newline at end of file
+        if read_only:
+            _release_read_only_session(db, workload)
+        else:
+            db.close()
@@ -1,4 +1,6 @@
-from utils.constants import NAMESPACE, TABLES_FOR_KPIS_IN_CANVAS
+from utils.constants import APP_NAME, NAMESPACE, TABLES_FOR_KPIS_IN_CANVAS
+from utils import course_dimension
+from db_config import DatabaseEngineFactory
 from dap.api import DAPClient
 from dap.integration.database import DatabaseConnection
 from dap.replicator.sql import SQLReplicator
@@ -49,5 +51,7 @@ if __name__ == "__main__":
 
     
     asyncio.run(run_tasks_sequentially(tables=TABLES_FOR_KPIS_IN_CANVAS))
+    # Course names only change with a sync of `courses`
+    course_dimension.refresh_course_dimension(DatabaseEngineFactory.create(application_name=APP_NAME, workload="sync"))
 
     # asyncio.run(main())
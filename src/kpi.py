@@ -1,13 +1,17 @@
 from sqlalchemy import text
 from db_config import SessionManager
 import queries 
-from utils import helpers
+from utils import course_dimension, helpers
 import pandas as pd
 from datetime import datetime
 
 # Helper function to save results to CSV
 def save_to_csv(data, file_name):
     df = pd.DataFrame(data)
+    # The queries return course ids only; names are added from the course dimension once it is built
+    dimension = course_dimension.load_course_dimension()
+    if dimension is not None and "course_id" in df.columns:
+        df = course_dimension.add_course_names(df, dimension)
     df.to_csv(file_name, index=False)
     print(f"Saved {file_name}")
 
@@ -17,7 +21,7 @@ def execute_module_completion_query(start_date: str, end_date: str):
     results = []
     MODULE_COMPLETION_BY_COURSE = queries.get_progress_in_course_requirements_query(start_date, end_date)
 
-    with SessionManager() as session:
+    with SessionManager(workload="dashboard", read_only=True) as session:
         query = session.execute(text(MODULE_COMPLETION_BY_COURSE))
         results = query.fetchall()
 
@@ -28,7 +32,7 @@ def execute_avg_feedback_time_by_course_query(start_date: str, end_date: str):
     results = []
     FEEDBACK_TIME_BY_COURSE =queries.get_feedback_time_by_course_query(start_date, end_date)
 
-    with SessionManager() as session:
+    with SessionManager(workload="dashboard", read_only=True) as session:
         query = session.execute(text(FEEDBACK_TIME_BY_COURSE))
         results = query.fetchall()
 
@@ -39,7 +43,7 @@ def execute_course_completion_rate_query(start_date: str, end_date: str):
     results = []
     COURSE_COMPLETION_RATE = queries.get_course_completion_rate_query(start_date, end_date)
 
-    with SessionManager() as session:
+    with SessionManager(workload="dashboard", read_only=True) as session:
         query = session.execute(text(COURSE_COMPLETION_RATE))
         results = query.fetchall()
 
@@ -50,7 +54,7 @@ def execute_learning_objective_completion_query(start_date: str, end_date: str):
     results = []
     LEARNING_OBJECTIVES_COMPLETION = queries.get_learning_objective_completion_query(start_date, end_date)
 
-    with SessionManager() as session:
+    with SessionManager(workload="dashboard", read_only=True) as session:
         query = session.execute(text(LEARNING_OBJECTIVES_COMPLETION))
         results = query.fetchall()
 
@@ -61,7 +65,7 @@ def execute_student_retention_rate_query(start_date: str, end_date: str, term_na
     results = []
     STUDENT_RETENTION_RATE = queries.get_course_retention_query(start_date, end_date, term_name)
 
-    with SessionManager() as session:
+    with SessionManager(workload="dashboard", read_only=True) as session:
         query = session.execute(text(STUDENT_RETENTION_RATE))
         results = query.fetchall()
 
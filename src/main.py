@@ -1,84 +1,313 @@
 import pandas as pd 
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
 from bokeh.io import save, output_file
 from bokeh.layouts import column, row
-from bokeh.models import ColumnDataSource, Spacer, Div
+from bokeh.models import Spacer, Div
 from datetime import datetime
 from pathlib import Path
+from threading import Lock
 
 import queries 
+from db_config import DatabaseEngineFactory
 import plots
-from utils import helpers
+from utils import course_dimension, document_optimizer, helpers
+from utils.render_cache import RenderCache
+from utils.constants import APP_NAME
 
 load_dotenv() 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
 
 
-def update_data(year, semester):
-    engine = create_engine(DATABASE_URL)
+def get_engine():
+    return DatabaseEngineFactory.create(application_name=APP_NAME, workload="dashboard")
+
+
+# KPI name -> (query builder, tables it reads). The tables drive the pipeline dependencies.
+KPI_QUERIES = {
+    "course_reqs_progress": (
+        queries.get_progress_in_course_requirements_query,
+        ["enrollments", "courses", "context_modules", "context_module_progressions"],
+    ),
+    "feedback": (
+        queries.get_feedback_time_by_course_query,
+        ["submissions", "submission_comments", "courses"],
+    ),
+    "completion_rate": (
+        queries.get_course_completion_rate_query,
+        ["courses", "context_modules", "enrollments", "context_module_progressions"],
+    ),
+    "learning_objective": (
+        queries.get_learning_objective_completion_query,
+        ["learning_outcome_results", "courses"],
+    ),
+    "student_retention": (
+        queries.get_course_retention_query,
+        ["courses", "enrollments", "enrollment_terms"],
+    ),
+}
+
+# KPI name -> ORDER BY of its query over the columns it returns (None when it has none), so that
+# `fetch_kpi_batch` can number every semester's rows in that order
+KPI_ROW_ORDERS = {
+    "course_reqs_progress": "completion_percentage ASC",
+    "feedback": "avg_feedback_days ASC",
+    "completion_rate": None,
+    "learning_objective": "mastery_percentage DESC",
+    "student_retention": "retention_rate_percentage DESC",
+}
+
+# Plot name -> (KPI it is built from, plot function)
+DASHBOARD_PLOTS = {
+    "student_retention": ("student_retention", plots.create_students_retention_rate_plot),
+    "completion_distribution": ("course_reqs_progress", helpers.create_completion_distribution),
+    "completion_table": ("course_reqs_progress", helpers.create_completion_table),
+    "learning_objective": ("learning_objective", plots.plot_learning_objective_completion),
+    "completion_rate": ("completion_rate", plots.create_course_completion_rate),
+    "feedback": ("feedback", plots.create_feedback_bar_chart),
+}
+
+# Plots that switch to level-of-detail mode above a number of courses (see `utils.level_of_detail`)
+LOD_PLOTS = ["student_retention", "learning_objective"]
+
+
+# KPI name -> rows its plot draws, compiled into its query (see `queries.compile_row_spec`) so
+# Postgres only returns those rows. The filters and group sizes match the plot functions.
+# course_reqs_progress also feeds the completion table and histogram, so it is fetched whole.
+KPI_ROW_SPECS = {
+    "completion_rate": {
+        "where": "completion_rate > 0 AND completion_rate < 100 AND total_enrolled > 0",
+        "rank": {"column": "completion_rate", "n": 10, "avg_count": 15},
+    },
+    "feedback": {
+        "rank": {"column": "avg_feedback_days", "n": 10, "avg_count": 10},
+    },
+    "student_retention": {
+        "where": queries.RETENTION_PERCENTILE_FILTER,
+        "percentile": {"column": "retention_rate_percentage", "percentile": plots.RETENTION_PERCENTILE},
+        "order_by": "retention_rate_percentage DESC",
+    },
+}
+
+
+def get_kpi_query(kpi_name, year, semester, row_spec=None):
+    """
+    SQL of a KPI for the given semester. The KPI's entry in `KPI_ROW_SPECS` is compiled into it,
+    unless another `row_spec` is given (an empty dict fetches every row).
+    """
     semester_start_date, semester_end_date = helpers.get_semester_dates(year, semester)
-    
-    course_reqs_progress = queries.get_progress_in_course_requirements_query(semester_start_date, semester_end_date)
-    course_reqs_progress_df = pd.read_sql(course_reqs_progress, engine)
-    
-    feedback_query = queries.get_feedback_time_by_course_query(semester_start_date, semester_end_date)
-    feedback_df = pd.read_sql(feedback_query, engine)
-    feedback_df['circle_size'] = feedback_df['avg_feedback_days'] * 2
-
-    completion_rate_query = queries.get_course_completion_rate_query(semester_start_date, semester_end_date)
-    completion_rate_df = pd.read_sql(completion_rate_query, engine)
-
-    learning_objective_completion_query = queries.get_learning_objective_completion_query(semester_start_date, semester_end_date)
-    learning_objective_df = pd.read_sql(learning_objective_completion_query, engine)
-
-    term = helpers.get_semester_term(semester_start_date)
-    student_retention_query = queries.get_course_retention_query(semester_start_date, semester_end_date, term)
-    student_retention_df = pd.read_sql(student_retention_query, engine)
-    
-    return (
-        ColumnDataSource(course_reqs_progress_df), 
-        ColumnDataSource(feedback_df), 
-        ColumnDataSource(completion_rate_df),
-        ColumnDataSource(learning_objective_df),
-        ColumnDataSource(student_retention_df)
-    )
+    query_builder, _ = KPI_QUERIES[kpi_name]
+
+    if kpi_name == "student_retention":
+        term = helpers.get_semester_term(semester_start_date)
+        query = query_builder(semester_start_date, semester_end_date, term)
+    else:
+        query = query_builder(semester_start_date, semester_end_date)
+
+    row_spec = KPI_ROW_SPECS.get(kpi_name) if row_spec is None else row_spec
+    return queries.compile_row_spec(query, row_spec) if row_spec else query
 
-def save_dashboard(year, semester):
+
+def get_kpi_row_order(kpi_name, row_spec=None):
     """
-    Saves a static version of the dashboard for a specific year and semester.
+    ORDER BY that gives the rows of `get_kpi_query(kpi_name, ..., row_spec)` their order, over the
+    columns it returns. None when the query is unordered.
+    """
+    row_spec = KPI_ROW_SPECS.get(kpi_name) if row_spec is None else row_spec
+    return queries.get_row_spec_order(row_spec or {}, KPI_ROW_ORDERS[kpi_name])
+
+
+_course_dimension_lock = Lock()
+
+
+def get_course_dimension(engine=None):
+    """
+    The persisted course dimension (see `utils.course_dimension`), built on first use when no
+    sync has built it yet.
+    """
+    with _course_dimension_lock:
+        dimension = course_dimension.load_course_dimension()
+        if dimension is None:
+            dimension = course_dimension.refresh_course_dimension(engine or get_engine())
+    return dimension
+
+
+def prepare_kpi_frame(kpi_name, df, engine=None):
+    # KPI queries return course ids only, names come from the course dimension
+    if "course_id" in df.columns:
+        df = course_dimension.add_course_names(df, get_course_dimension(engine))
+    if kpi_name == "feedback":
+        df['circle_size'] = df['avg_feedback_days'] * 2
+    return df
+
+
+def fetch_kpi(kpi_name, year, semester, engine=None, row_spec=None):
     """
-    completion_source, feedback_source, completion_rate_source, learning_objective_source, student_retention_source = update_data(year, semester)
-    
+    Runs the query of a single KPI for the given semester and returns it as a DataFrame.
+    See `get_kpi_query` for `row_spec`.
+    """
+    engine = engine or get_engine()
+    df = pd.read_sql(get_kpi_query(kpi_name, year, semester, row_spec), engine)
+    return prepare_kpi_frame(kpi_name, df, engine)
+
+
+def fetch_kpi_batch(kpi_name, periods, engine=None):
+    """
+    Runs the query of a KPI for several semesters in a single round trip.
+
+    The per-semester queries are combined with UNION ALL, each tagged with its position in
+    `periods` and its row number. Rows are numbered by the KPI's own order (`get_kpi_row_order`),
+    since the order of a subquery is not kept by the query around it, so every semester keeps the
+    row order of its own query.
+
+    Args:
+        kpi_name (str): Key of `KPI_QUERIES`.
+        periods (list): (year, semester) tuples.
+
+    Returns:
+        dict: (year, semester) -> DataFrame, as `fetch_kpi` would return it.
+    """
+    engine = engine or get_engine()
+    row_order = get_kpi_row_order(kpi_name)
+    window = f"ORDER BY {row_order}" if row_order else ""
+    parts = [
+        f"SELECT {index} AS batch_period, ROW_NUMBER() OVER ({window}) AS batch_row, period.*\n"
+        f"FROM ({get_kpi_query(kpi_name, year, semester).strip().rstrip(';')}) AS period"
+        for index, (year, semester) in enumerate(periods)
+    ]
+    query = "\nUNION ALL\n".join(parts) + "\nORDER BY batch_period, batch_row"
+    df = pd.read_sql(query, engine)
+
+    frames = {}
+    for index, period in enumerate(periods):
+        frame = df[df["batch_period"] == index].drop(columns=["batch_period", "batch_row"]).reset_index(drop=True)
+        frames[period] = prepare_kpi_frame(kpi_name, frame, engine)
+    return frames
+
+
+def get_render_cache(optimize=True):
+    # Cached plots are stored as saved, so optimized and raw documents use separate entries
+    return RenderCache(variant="optimized" if optimize else "raw")
+
+
+def build_plot(plot_name, source, render_cache=None, **params):
+    """
+    Builds one dashboard plot, passing `params` to its plot function. With a `render_cache`,
+    plots whose input did not change since the last build are taken from the cache (see
+    `utils.render_cache`).
+    """
+    _, plot_function = DASHBOARD_PLOTS[plot_name]
+    if render_cache is None:
+        return plot_function(source, **params)
+    return render_cache.render(plot_function, source, name=plot_name, **params)
+
+
+def get_dashboard_title(year, semester):
     semester_in_spanish = helpers.get_semester_in_spanish(semester)
-    title = f"Métricas para el CDA - {semester_in_spanish} {year}"
+    return f"Métricas para el CDA - {semester_in_spanish} {year}"
+
 
+def build_layout(title, plots_by_name):
+    """
+    Arranges the plots built by `build_plot` in the dashboard layout.
+    """
     # Create a title as a Bokeh Div element
     dashboard_title = Div(text=f"<h1 style='text-align:center;'>{title}</h1>", width=1200)
 
-    filename = f"course_completion_dashboard_{semester}_{year}.html"
-    
-    layout = column(
+    return column(
         dashboard_title,  # Add the title at the top
         row(
-            plots.create_students_retention_rate_plot(student_retention_source),
+            plots_by_name["student_retention"],
             Spacer(width=50),
-            helpers.create_completion_distribution(completion_source),
+            plots_by_name["completion_distribution"],
             Spacer(width=50),
-            helpers.create_completion_table(completion_source),
+            plots_by_name["completion_table"],
         ),
         row(
-            plots.plot_learning_objective_completion(learning_objective_source),
-            plots.create_course_completion_rate(completion_rate_source), 
-            plots.create_feedback_bar_chart(feedback_source),
+            plots_by_name["learning_objective"],
+            plots_by_name["completion_rate"], 
+            plots_by_name["feedback"],
         ), 
     )
-    
-    output_file(filename, title=title)
-    save(layout)
-    print(f"Dashboard saved as {filename}")
+
+
+def get_dashboard_filename(year, semester):
+    return f"course_completion_dashboard_{semester}_{year}.html"
+
+
+def export_dashboard(layout, plots_by_name, filename, title, optimize=True, render_cache=None):
+    """
+    Saves the layout as a static HTML file. With `optimize`, unused columns are pruned, numeric
+    data is downcast to compact binary arrays and identical sources are shared before saving.
+    With a `render_cache`, new plots are stored and cached plots are spliced into the file.
+    """
+    if optimize:
+        stats = document_optimizer.optimize_document(layout)
+        print(
+            f"Document optimized: {stats['pruned_columns']} columns pruned, "
+            f"{stats['downcast_columns']} columns downcast, {stats['shared_sources']} sources shared"
+        )
+    document_optimizer.report_document_size(plots_by_name, size_of=render_cache.cached_size if render_cache else None)
+
+    if render_cache is None:
+        output_file(filename, title=title)
+        save(layout)
+    else:
+        render_cache.save(layout, filename, title)
+        render_cache.report()
+    print(f"Dashboard saved as {filename} ({os.path.getsize(filename) / 1024:.1f} KB)")
+
+
+def build_dashboard_layout(year, semester, frames, render_cache=None, lod_thresholds=None):
+    """
+    Builds every plot of a semester from its KPI frames (KPI name -> DataFrame) and arranges them.
+
+    Args:
+        lod_thresholds (dict): Name of a `LOD_PLOTS` plot -> its `lod_threshold`, instead of
+            the default `level_of_detail.LOD_THRESHOLD`.
+
+    Returns:
+        tuple: (layout, dict of plot name -> plot)
+    """
+    lod_thresholds = lod_thresholds or {}
+    # Plot builders take the frames as they are and create their own sources (see `utils.data_plane`)
+    plots_by_name = {
+        plot_name: build_plot(
+            plot_name,
+            frames[kpi_name],
+            render_cache,
+            **({"lod_threshold": lod_thresholds[plot_name]} if plot_name in lod_thresholds else {}),
+        )
+        for plot_name, (kpi_name, _) in DASHBOARD_PLOTS.items()
+    }
+    return build_layout(get_dashboard_title(year, semester), plots_by_name), plots_by_name
+
+
+def render_dashboard(year, semester, frames, filename=None, optimize=True, use_cache=True):
+    """
+    Builds and saves the dashboard of a semester from its KPI frames (KPI name -> DataFrame).
+
+    Returns:
+        str: Path of the saved HTML file.
+    """
+    title = get_dashboard_title(year, semester)
+    filename = filename or get_dashboard_filename(year, semester)
+
+    render_cache = get_render_cache(optimize) if use_cache else None
+    layout, plots_by_name = build_dashboard_layout(year, semester, frames, render_cache)
+    export_dashboard(layout, plots_by_name, filename, title, optimize=optimize, render_cache=render_cache)
+    return filename
+
+
+def save_dashboard(year, semester, optimize=True, use_cache=True):
+    """
+    Saves a static version of the dashboard for a specific year and semester.
+    """
+    engine = get_engine()
+    frames = {kpi_name: fetch_kpi(kpi_name, year, semester, engine) for kpi_name in KPI_QUERIES}
+    render_dashboard(year, semester, frames, optimize=optimize, use_cache=use_cache)
+    DatabaseEngineFactory.get_pool_metrics("dashboard").log_snapshot()
 
 
 def main():
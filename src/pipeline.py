@@ -0,0 +1,292 @@
+"""
+Nightly pipeline: sync -> KPI extraction -> dashboard rendering, modeled as a DAG of stages.
+
+Every stage starts as soon as the stages it depends on are done, so the KPI queries of a
+table group start when its tables finish syncing and plots are rendered while other KPIs
+are still computing. A timeline report with the critical path is written at the end, also when
+a stage fails: the other stages are then cancelled and the report lists them.
+
+Usage (from `src/`):
+    python pipeline.py --year 2023 --semester Spring [--skip-sync]
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import main
+from db_config import DatabaseEngineFactory
+from utils import course_dimension, helpers
+from utils.constants import TABLES_FOR_KPIS_IN_CANVAS
+
+SYNC_CONCURRENCY = 2
+KPI_WORKERS = 5
+
+
+class Stage:
+    """
+    A unit of work in the pipeline.
+
+    `func` receives the results of its dependencies as keyword arguments (by stage name) and
+    may be a coroutine function or a regular function. Regular functions run in `executor`.
+    """
+
+    def __init__(self, name: str, func: Callable, deps: Optional[List[str]] = None, executor: str = "io"):
+        self.name = name
+        self.func = func
+        self.deps = deps or []
+        self.executor = executor
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], executors: Dict[str, ThreadPoolExecutor]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.executors = executors
+        self.timeline = {}
+        self.results = {}
+
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(missing)}")
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task], origin: float):
+        # Stays "cancelled" when the stage is cancelled, or never starts because a dependency failed
+        status = "cancelled"
+        start = None
+        try:
+            if stage.deps:
+                await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+            inputs = {dep: self.results[dep] for dep in stage.deps}
+
+            start = time.perf_counter()
+            if inspect.iscoroutinefunction(stage.func):
+                result = await stage.func(**inputs)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executors[stage.executor], lambda: stage.func(**inputs))
+            status = "done"
+        except Exception as e:
+            if start is not None:
+                status = f"failed: {e}"
+            raise
+        finally:
+            end = time.perf_counter()
+            start = end if start is None else start
+            self.timeline[stage.name] = {
+                "start": round(start - origin, 3),
+                "end": round(end - origin, 3),
+                "duration": round(end - start, 3),
+                "deps": stage.deps,
+                "status": status,
+            }
+
+        self.results[stage.name] = result
+        return result
+
+    async def run(self):
+        """
+        Runs every stage. On the first failure the other stages are cancelled (and awaited, so
+        they are all in the timeline) before the error is raised.
+        """
+        origin = time.perf_counter()
+        tasks = {}
+        # Stages are created in dependency order so every dependency already has a task
+        for stage in self._topological_order():
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks, origin))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return self.results
+
+    def _topological_order(self) -> List[Stage]:
+        ordered, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            ordered.append(self.stages[name])
+
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def critical_path(self):
+        """
+        Longest chain of dependent stages by measured duration.
+
+        Returns:
+            tuple: (list of stage names, total seconds)
+        """
+        longest = {}
+        for stage in self._topological_order():
+            duration = self.timeline.get(stage.name, {}).get("duration", 0.0)
+            best_dep = max(stage.deps, key=lambda dep: longest[dep][1], default=None)
+            path, total = longest[best_dep] if best_dep else ([], 0.0)
+            longest[stage.name] = (path + [stage.name], total + duration)
+        return max(longest.values(), key=lambda item: item[1], default=([], 0.0))
+
+    def report(self):
+        wall_time = max((entry["end"] for entry in self.timeline.values()), default=0.0)
+        path, path_time = self.critical_path()
+        return {
+            "wall_time": round(wall_time, 3),
+            "critical_path": path,
+            "critical_path_time": round(path_time, 3),
+            "failed": [name for name, entry in self.timeline.items() if entry["status"].startswith("failed")],
+            "cancelled": [name for name, entry in self.timeline.items() if entry["status"] == "cancelled"],
+            "stages": dict(sorted(self.timeline.items(), key=lambda item: item[1]["start"])),
+        }
+
+
+def build_dashboard_pipeline(year, semester, sync=True, engine=None, use_cache=True):
+    """
+    Builds the stages for one dashboard:
+
+    - `sync:<table>` replicates a table from DAP (skipped with `sync=False`)
+    - `course_dimension` rebuilds the course names once `courses` is synced
+    - `kpi:<name>` runs a KPI query once all the tables it reads are synced
+    - `plot:<name>` builds a figure as soon as its KPI is available (or loads it from the render cache)
+    - `render` assembles the layout and saves the HTML file
+    """
+    engine = engine or main.get_engine()
+    render_cache = main.get_render_cache() if use_cache else None
+    stages = []
+
+    if sync:
+        import db_operations
+
+        sync_semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+        for table in TABLES_FOR_KPIS_IN_CANVAS:
+            async def sync_table(table=table):
+                async with sync_semaphore:
+                    await db_operations.synchronize_data_in_db(table)
+            stages.append(Stage(f"sync:{table}", sync_table))
+
+    # Course names are read and normalized once per sync, before the KPIs that need them
+    if sync:
+        stages.append(Stage(
+            "course_dimension",
+            lambda **_: course_dimension.refresh_course_dimension(engine),
+            deps=["sync:courses"],
+        ))
+    else:
+        stages.append(Stage("course_dimension", lambda: main.get_course_dimension(engine)))
+
+    for kpi_name, (_, tables) in main.KPI_QUERIES.items():
+        deps = [f"sync:{table}" for table in tables] if sync else []
+        deps.append("course_dimension")
+        stages.append(Stage(
+            f"kpi:{kpi_name}",
+            lambda kpi_name=kpi_name, **_: main.fetch_kpi(kpi_name, year, semester, engine),
+            deps=deps,
+        ))
+
+    for plot_name, (kpi_name, _) in main.DASHBOARD_PLOTS.items():
+        stages.append(Stage(
+            f"plot:{plot_name}",
+            lambda plot_name=plot_name, kpi_name=kpi_name, **inputs: main.build_plot(
+                plot_name, inputs[f"kpi:{kpi_name}"], render_cache
+            ),
+            deps=[f"kpi:{kpi_name}"],
+            executor="render",
+        ))
+
+    def render(**inputs):
+        title = main.get_dashboard_title(year, semester)
+        filename = main.get_dashboard_filename(year, semester)
+        plots_by_name = {name.split(":", 1)[1]: plot for name, plot in inputs.items()}
+        layout = main.build_layout(title, plots_by_name)
+        main.export_dashboard(layout, plots_by_name, filename, title, render_cache=render_cache)
+        return filename
+
+    stages.append(Stage("render", render, deps=[f"plot:{plot_name}" for plot_name in main.DASHBOARD_PLOTS], executor="render"))
+    return stages
+
+
+def run_pipeline(year, semester, sync=True, report_path=None):
+    """
+    Runs sync, KPI extraction and rendering for one semester and writes the timeline report.
+    """
+    return run_stages(
+        lambda: build_dashboard_pipeline(year, semester, sync=sync),
+        report_path or f"pipeline_timeline_{semester}_{year}.json",
+    )
+
+
+def run_stages(build_stages: Callable[[], List[Stage]], report_path: str):
+    """
+    Runs the stages returned by `build_stages` and writes the timeline report to `report_path`.
+
+    The report is also written when a stage fails, with the failed and cancelled stages, before
+    the error is raised.
+    """
+    executors = {
+        "io": ThreadPoolExecutor(max_workers=KPI_WORKERS, thread_name_prefix="kpi"),
+        # Bokeh models are built on a single thread, overlapping with the KPI queries
+        "render": ThreadPoolExecutor(max_workers=1, thread_name_prefix="render"),
+    }
+    pipelines = []
+
+    async def run():
+        pipelines.append(Pipeline(build_stages(), executors))
+        await pipelines[0].run()
+
+    try:
+        asyncio.run(run())
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+        report = pipelines[0].report() if pipelines else None
+        if report is not None:
+            write_report(report, report_path)
+    return report
+
+
+def write_report(report, report_path):
+    report["generated_at"] = datetime.now().isoformat()
+    report["connection_pools"] = DatabaseEngineFactory.pool_snapshots()
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+
+    print_timeline(report)
+    if report["failed"]:
+        print(f"Failed: {', '.join(report['failed'])}; cancelled: {', '.join(report['cancelled']) or 'none'}")
+    print(f"Timeline report saved as {report_path}")
+
+
+def print_timeline(report, width=50):
+    wall_time = report["wall_time"] or 1.0
+    for name, entry in report["stages"].items():
+        offset = int(entry["start"] / wall_time * width)
+        length = max(1, int(entry["duration"] / wall_time * width))
+        bar = " " * offset + "#" * length
+        print(f"{name:<32} {entry['start']:>8.2f}s {entry['duration']:>8.2f}s |{bar:<{width}}|")
+    print(f"Wall time: {report['wall_time']:.2f}s")
+    print(f"Critical path: {report['critical_path_time']:.2f}s ({' -> '.join(report['critical_path'])})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run sync, KPI extraction and dashboard rendering as one pipeline.")
+    parser.add_argument("--year", type=int, default=datetime.now().year)
+    parser.add_argument("--semester", default=helpers.get_latest_semester(), choices=list(helpers.translation_map))
+    parser.add_argument("--skip-sync", action="store_true", help="Use the data already in the database")
+    parser.add_argument("--report", default=None, help="Path of the timeline report (JSON)")
+    args = parser.parse_args()
+
+    run_pipeline(args.year, args.semester, sync=not args.skip_sync, report_path=args.report)
@@ -10,9 +10,11 @@ from bokeh.transform import factor_cmap, dodge
 from bokeh.palettes import Blues8
 
 import math
-import pandas as pd
 import numpy as np 
 
+import queries
+from utils import data_plane, level_of_detail, selection
+
 ITAM_COLOR = "#019B7A"
 LIGHTER_ITAM_COLOR = "#9FE1CC"
 DARKER_ITAM_COLOR = "#014D3E"
@@ -24,6 +26,10 @@ COLOR_FOR_BEST = "#4CAF50"
 TEXT_FONT_SIZE = "12pt"
 HEIGHT = 500 
 
+# Retention plot shows the courses above this percentile of retention
+RETENTION_PERCENTILE = 25
+
+
 def create_progress_in_course_requirements(source, N=10, avg_count=10):
     """
     Creates a line plot showing progress in course requirements for:
@@ -32,18 +38,12 @@ def create_progress_in_course_requirements(source, N=10, avg_count=10):
     - Average N courses closest to the overall average completion percentage.
     """
     # Data preparation
-    df = source.to_df()
+    df = data_plane.as_frame(source)
     df = df[df["completion_percentage"] < 100]
 
-    sorted_df = df.sort_values(by="completion_percentage", ascending=False)
-    top_n = sorted_df.head(N)
-    bottom_n = sorted_df.tail(N)
-
-    avg_completion = df["completion_percentage"].mean()
-    df["avg_diff"] = abs(df["completion_percentage"] - avg_completion)
-    avg_courses = df.nsmallest(avg_count, "avg_diff")
-
-    selected_df = pd.concat([top_n, bottom_n, avg_courses])
+    selected_df, category_slices, avg_completion = selection.select_frame(
+        df, "completion_percentage", N, avg_count, labels=("Top", "Bottom", "Average")
+    )
     selected_df["course_id_str"] = selected_df["course_id"].astype(str)
     
     # Calculate y-axis range with padding
@@ -53,13 +53,6 @@ def create_progress_in_course_requirements(source, N=10, avg_count=10):
     y_max = min(max_rate + y_padding, 100)
     y_min = max(min_rate - y_padding, 0)
 
-    # Assign categories
-    selected_df["category"] = (
-        ["Top"] * len(top_n) +
-        ["Bottom"] * len(bottom_n) +
-        ["Average"] * len(avg_courses)
-    )
-
     # Create figure
     p = figure(
         x_range=selected_df["course_id_str"],
@@ -110,9 +103,7 @@ def create_progress_in_course_requirements(source, N=10, avg_count=10):
     p.add_tools(hover)
 
     for category, color in colors.items():
-        category_source = ColumnDataSource(
-            selected_df[selected_df["category"] == category]
-        )
+        category_source = data_plane.make_source(selected_df.iloc[category_slices[category]])
         
         # Add line
         p.line(
@@ -272,38 +263,19 @@ def create_feedback_bar_chart(source, N=10, avg_count=10):
     N: Number of top and bottom courses to display
     avg_count: Number of average courses closest to the overall average feedback time
     """
-    df = source.to_df()
-
-    # Sort by feedback time (descending)
-    sorted_df = df.sort_values(by="avg_feedback_days", ascending=False)
-
-    # Calculate the average feedback time
-    avg_feedback = df["avg_feedback_days"].mean()
-
-    # Select top N, bottom N, and average N courses
-    top_n = sorted_df.head(N)
-    bottom_n = sorted_df.tail(N)
-
-    # Find the avg_count courses closest to the overall average feedback time
-    sorted_df['avg_diff'] = abs(sorted_df['avg_feedback_days'] - avg_feedback)
-    avg_courses = sorted_df.nsmallest(avg_count, 'avg_diff')
+    df = data_plane.as_frame(source)
 
-    # Combine top, bottom, and average courses
-    selected_df = pd.concat([top_n, bottom_n, avg_courses])
-
-    # Assign categories for color distinction
-    selected_df['category'] = (
-    ['Peores'] * len(top_n) +
-    ['Mejores'] * len(bottom_n) +
-    ['Promedio'] * len(avg_courses)
-)
+    # Longest feedback times are the worst, shortest the best, plus the ones closest to the average
+    selected_df, _, avg_feedback = selection.select_frame(
+        df, "avg_feedback_days", N, avg_count, labels=("Peores", "Mejores", "Promedio")
+    )
 
     # Convert course_id to string for x-axis
     selected_df['course_id_str'] = selected_df['course_id'].astype(str)
     selected_df['course_label'] = selected_df['course_name'] + " (" + selected_df['course_id'].astype(str) + ")"
 
     # Prepare the data source
-    source = ColumnDataSource(selected_df)
+    source = data_plane.make_source(selected_df)
 
     # Color map for categories
     color_map = factor_cmap('category', palette=[DARKER_ITAM_COLOR, ITAM_COLOR, LIGHTER_ITAM_COLOR], factors=['Peores', 'Promedio', 'Mejores'])
@@ -381,32 +353,29 @@ def create_course_completion_rate(source, N=10, avg_count=15):
     """
     Creates a line plot showing completion rates with zone annotations and labels.
     """
-    df_source = source.to_df() if hasattr(source, 'to_df') else source
+    df_source = data_plane.as_frame(source)
 
     df = df_source[
         (df_source['completion_rate'] > 0) &
         (df_source['completion_rate'] < 100) &
         (df_source['total_enrolled'] > 0)
-    ].copy()
+    ]
 
     if "completion_rate" not in df.columns:
         raise ValueError("The source must contain a 'completion_rate' column.")
 
-    sorted_df = df.sort_values(by="completion_rate", ascending=False)
-    top_n = sorted_df.head(N)
-    bottom_n = sorted_df.tail(N)
-
-    avg_completion = df["completion_rate"].mean()
-    std_dev_completion = df["completion_rate"].std()
+    selected_df, category_slices, avg_completion = selection.select_frame(
+        df, "completion_rate", N, avg_count, labels=("Mejores", "Peores", "Promedio")
+    )
+    # Over every course, also when only the selected rows were fetched
+    if "completion_rate_std" in df.columns and len(df):
+        std_dev_completion = df["completion_rate_std"].iloc[0]
+    else:
+        std_dev_completion = df["completion_rate"].std()
 
     low_range = max(0, avg_completion - std_dev_completion)
     mid_range_upper = min(100, avg_completion + std_dev_completion)
 
-    df["avg_diff"] = abs(df["completion_rate"] - avg_completion)
-    avg_courses = df.nsmallest(avg_count, "avg_diff")
-
-    selected_df = pd.concat([top_n, bottom_n, avg_courses])
-    selected_df["category"] = (["Top"] * len(top_n) + ["Bottom"] * len(bottom_n) + ["Average"] * len(avg_courses))
     selected_df["course_id_str"] = selected_df["course_id"].astype(str)
 
     p = figure(
@@ -493,16 +462,10 @@ def create_course_completion_rate(source, N=10, avg_count=15):
     )
     p.add_layout(avg_label)
 
-    selected_df["category"] = (
-    ["Mejores"] * len(top_n) +
-    ["Peores"] * len(bottom_n) +
-    ["Promedio"] * len(avg_courses)
-    )
-
     # Updated colors for Spanish labels
     colors = {"Mejores": COLOR_FOR_BEST, "Peores": COLOR_FOR_WORST, "Promedio": COLOR_FOR_AVERAGE}
     for category, color in colors.items():
-        category_source = ColumnDataSource(selected_df[selected_df["category"] == category])
+        category_source = data_plane.make_source(selected_df.iloc[category_slices[category]])
         p.line(x="course_id_str", y="completion_rate", color=color, legend_label=category, source=category_source, line_width=2)
         p.scatter(x="course_id_str", y="completion_rate", size=6, color=color, legend_label=category, source=category_source)
 
@@ -517,17 +480,43 @@ def create_course_completion_rate(source, N=10, avg_count=15):
     return p
 
 
-def plot_learning_objective_completion(source):
-    # Convert ColumnDataSource to DataFrame
-    df = source.to_df()
-    df['course_id'] = df['course_id'].astype(str)
+def plot_learning_objective_completion(source, lod_threshold=level_of_detail.LOD_THRESHOLD):
+    """
+    Bars of achievement and mastery per course. Above `lod_threshold` courses (None disables it),
+    courses are grouped in a histogram with the per-course values in a paged table.
+    """
+    # Course ids are categorical factors of the x-axis
+    df = data_plane.as_frame(source).assign(course_id=lambda courses: courses['course_id'].astype(str))
 
     # Calculate averages
     avg_achievement_avg = df['avg_achievement_percentage'].mean()
     mastery_percentage_avg = df['mastery_percentage'].mean()
 
-    # Recreate ColumnDataSource with updated DataFrame
-    source = ColumnDataSource(df)
+    if level_of_detail.exceeds_threshold(df, lod_threshold):
+        return level_of_detail.create_binned_overview(
+            df,
+            {
+                'avg_achievement_percentage': ("Porcentaje de logro", ITAM_COLOR),
+                'mastery_percentage': ("Porcentaje de dominio", LIGHTER_ITAM_COLOR),
+            },
+            title="Cumplimiento de los objetivos de aprendizaje por curso",
+            x_axis_label='Porcentaje',
+            table_columns=[
+                ('course_id', 'ID del curso', None),
+                ('course_name', 'Curso', None),
+                ('avg_achievement_percentage', 'Logro (%)', '0.0'),
+                ('mastery_percentage', 'Dominio (%)', '0.0'),
+            ],
+            reference_lines={
+                "Promedio de logro": (avg_achievement_avg, "blue"),
+                "Promedio de dominio": (mastery_percentage_avg, "green"),
+            },
+            bin_range=(0, 100),
+            width=900,
+            height=HEIGHT,
+        )
+
+    source = data_plane.make_source(df)
     course_ids = df['course_id'].tolist()
 
     # Define hover tool
@@ -617,29 +606,55 @@ def plot_learning_objective_completion(source):
 
 
 
-def create_students_retention_rate_plot(source, percentile=25):
+def create_students_retention_rate_plot(source, percentile=RETENTION_PERCENTILE, lod_threshold=level_of_detail.LOD_THRESHOLD):
     """
     Creates a retention rate plot filtered by specified percentile
     Args:
-        source: ColumnDataSource with the data
+        source: KPI DataFrame (or ColumnDataSource), read-only (see `utils.data_plane`)
         percentile: The percentile threshold for filtering (e.g., 75 for top 25%)
+        lod_threshold: Above this many courses they are grouped in a histogram with a
+            paged per-course table (None disables it)
     """
-    # Convert source to DataFrame for filtering
-    df = pd.DataFrame(source.data)
+    df = data_plane.as_frame(source)
     
     # Apply filters
     df = df[~((df['total_enrollments'] > 8) & (df['active_enrollments'] == 1))]
     df = df[df['total_enrollments'] >= 5]
     
-    # Filter by specified percentile
-    threshold = np.percentile(df['retention_rate_percentage'], percentile)
+    # Filter by specified percentile, computed by the query when it was pushed down
+    threshold_column = queries.percentile_threshold_column('retention_rate_percentage', percentile)
+    if threshold_column in df.columns and df[threshold_column].notna().any():
+        threshold = df[threshold_column].iloc[0]
+    else:
+        threshold = np.percentile(df['retention_rate_percentage'], percentile)
     df = df[df['retention_rate_percentage'] >= threshold]
     
     # Convert course_id to string for x-axis
-    df['course_id_str'] = df['course_id'].astype(str)
+    df = df.assign(course_id_str=df['course_id'].astype(str))
+
+    if level_of_detail.exceeds_threshold(df, lod_threshold):
+        return level_of_detail.create_binned_overview(
+            df,
+            {'retention_rate_percentage': ("Tasa de retención", ITAM_COLOR)},
+            title=f"Tasa de retención de estudiantes por curso (Percentil {100-percentile}%)",
+            x_axis_label="Tasa de retención (%)",
+            table_columns=[
+                ('course_id_str', 'ID del curso', None),
+                ('course_name', 'Curso', None),
+                ('retention_rate_percentage', 'Retención (%)', '0.0'),
+                ('total_enrollments', 'Inscritos', None),
+                ('active_enrollments', 'Activos', None),
+            ],
+            reference_lines={
+                "Promedio": (df['retention_rate_percentage'].mean(), "gray"),
+                "Mediana": (df['retention_rate_percentage'].median(), "black"),
+            },
+            width=900,
+            height=HEIGHT,
+        )
     
     # Create new source with filtered data
-    filtered_source = ColumnDataSource(df)
+    filtered_source = data_plane.make_source(df)
     
     # Create figure
     p = figure(
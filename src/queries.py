@@ -1,3 +1,5 @@
+# Course names are not joined into the KPI queries, they come from `utils.course_dimension`.
+
 def get_progress_in_course_requirements_query(semester_start_date, semester_end_date):
     return f"""
     WITH enrolled_students AS (
@@ -30,7 +32,6 @@ def get_progress_in_course_requirements_query(semester_start_date, semester_end_
     course_completion AS (
         SELECT 
             c.id as course_id,
-            c.name as course_name,
             ROUND(
                 COUNT(CASE WHEN mp.workflow_state = 'completed' THEN 1 END) * 100.0 
                 / NULLIF(COUNT(*), 0),
@@ -38,7 +39,7 @@ def get_progress_in_course_requirements_query(semester_start_date, semester_end_
             ) AS completion_percentage
         FROM canvas.courses c
         LEFT JOIN module_progress mp ON mp.course_id = c.id
-        GROUP BY c.id, c.name
+        GROUP BY c.id
     )
     SELECT *
     FROM course_completion
@@ -75,12 +76,10 @@ def get_feedback_time_by_course_query(semester_start_date: str, semester_end_dat
     )
     SELECT 
       fa.course_id,
-      c.name AS course_name,
       ROUND(AVG(fa.feedback_time_in_days), 2) AS avg_feedback_days
     FROM feedback_analysis fa
-    JOIN canvas.courses c ON fa.course_id = c.id
     WHERE fa.feedback_time_in_days IS NOT NULL
-    GROUP BY fa.course_id, c.name
+    GROUP BY fa.course_id
     ORDER BY avg_feedback_days ASC;
     """
 
@@ -171,11 +170,9 @@ course_aggregates AS (
 )
 SELECT
     ca.course_id,
-    c.name AS course_name,
     ca.avg_achievement_percentage,
     ca.mastery_percentage
 FROM course_aggregates ca
-JOIN canvas.courses c ON ca.course_id = c.id
 ORDER BY ca.mastery_percentage DESC;
 """
 
@@ -185,7 +182,6 @@ def get_course_retention_query(semester_start_date, semester_end_date, enrollmen
 WITH EnrollmentCounts AS (
     SELECT 
         c.id AS course_id,
-        c.name AS course_name,
         et.name AS term_name,
         -- Total enrollments
         COUNT(DISTINCT CASE 
@@ -208,11 +204,10 @@ WITH EnrollmentCounts AS (
       ON c.enrollment_term_id = et.id
     WHERE e.type = 'StudentEnrollment'
     AND et.name ILIKE '%%{enrollment_term_name}%%'
-    GROUP BY c.id, c.name, et.name
+    GROUP BY c.id, et.name
 )
 SELECT 
     course_id,
-    course_name,
     term_name,
     total_enrollments,
     active_enrollments,
@@ -225,3 +220,139 @@ WHERE total_enrollments > 0
 AND active_enrollments > 0
 ORDER BY retention_rate_percentage DESC;
 """
+
+
+# Row pushdown: wrappers around the KPI queries above that compute the percentile thresholds and
+# keep only the rows the plots draw in Postgres, instead of fetching every course row.
+
+def _as_subquery(kpi_query: str) -> str:
+    return kpi_query.strip().rstrip(';')
+
+
+def percentile_threshold_column(column: str, percentile: float) -> str:
+    return f"p{percentile:g}_{column}".replace(".", "_")
+
+
+# Courses the retention percentile is computed over (same filters as `plots.create_students_retention_rate_plot`)
+RETENTION_PERCENTILE_FILTER = "total_enrollments >= 5 AND NOT (total_enrollments > 8 AND active_enrollments = 1)"
+
+
+def get_percentile_threshold_query(kpi_query: str, column: str, percentile: float, where: str = "TRUE", order_by: str = None) -> str:
+    """
+    Adds the `percentile` of `column` over the rows matching `where` to every row of a KPI query,
+    in the column named by `percentile_threshold_column`. `PERCENTILE_CONT` interpolates linearly
+    between the closest ranks, like `np.percentile`.
+    """
+    threshold_column = percentile_threshold_column(column, percentile)
+    order_clause = f"\nORDER BY {order_by}" if order_by else ""
+    return f"""
+WITH kpi AS (
+{_as_subquery(kpi_query)}
+),
+threshold AS (
+    SELECT PERCENTILE_CONT({percentile / 100}) WITHIN GROUP (ORDER BY {column}) AS {threshold_column}
+    FROM kpi
+    WHERE {where}
+)
+SELECT kpi.*, threshold.{threshold_column}
+FROM kpi
+CROSS JOIN threshold{order_clause};
+"""
+
+
+def get_ranked_rows_query(kpi_query: str, column: str, n: int, avg_count: int) -> str:
+    """
+    Keeps only the rows of a KPI query that a top / bottom / average plot draws: the `n` highest
+    and `n` lowest values of `column` and the `avg_count` values closest to its mean, like
+    `utils.selection.select_top_bottom_average`. NULL values are never selected.
+
+    Every row gets its `row_group` ('top', 'bottom' or 'average') plus the mean and sample standard
+    deviation of `column` over all rows (`{column}_mean`, `{column}_std`). Rows come grouped, in the
+    order the plots show them.
+    """
+    return f"""
+WITH kpi AS (
+{_as_subquery(kpi_query)}
+),
+stats AS (
+    SELECT AVG({column})::float8 AS mean, STDDEV_SAMP({column})::float8 AS std
+    FROM kpi
+    WHERE {column} IS NOT NULL
+),
+ranked AS (
+    SELECT
+        kpi AS course,
+        ROW_NUMBER() OVER (ORDER BY kpi.{column} DESC) AS rank_desc,
+        ROW_NUMBER() OVER (ORDER BY kpi.{column} ASC) AS rank_asc,
+        ROW_NUMBER() OVER (ORDER BY ABS(kpi.{column} - stats.mean)) AS rank_average
+    FROM kpi
+    CROSS JOIN stats
+    WHERE kpi.{column} IS NOT NULL
+),
+selected AS (
+    SELECT course, 'top' AS row_group, 1 AS group_order, rank_desc AS group_position
+    FROM ranked WHERE rank_desc <= {n}
+    UNION ALL
+    -- Lowest values, ordered like the tail of a descending sort
+    SELECT course, 'bottom', 2, {n} + 1 - rank_asc
+    FROM ranked WHERE rank_asc <= {n}
+    UNION ALL
+    SELECT course, 'average', 3, rank_average
+    FROM ranked WHERE rank_average <= {avg_count}
+)
+SELECT (selected.course).*, selected.row_group, stats.mean AS {column}_mean, stats.std AS {column}_std
+FROM selected
+CROSS JOIN stats
+ORDER BY selected.group_order, selected.group_position;
+"""
+
+
+def compile_row_spec(kpi_query: str, spec: dict) -> str:
+    """
+    Compiles the rows a plot draws into its KPI query, so Postgres returns only those rows.
+
+    `spec` keys, applied in this order (all optional):
+        where (str): SQL condition over the KPI columns.
+        percentile (dict): {"column", "percentile"}; keeps the rows at or above that percentile
+            of the column and adds the threshold (see `get_percentile_threshold_query`).
+        rank (dict): {"column", "n", "avg_count"}; keeps the top / bottom / average rows
+            (see `get_ranked_rows_query`).
+        order_by (str): Row order when there is no `rank`.
+    """
+    query = _as_subquery(kpi_query)
+
+    if spec.get("where"):
+        query = f"SELECT * FROM (\n{query}\n) AS kpi\nWHERE {spec['where']}"
+
+    if spec.get("percentile"):
+        column, percentile = spec["percentile"]["column"], spec["percentile"]["percentile"]
+        threshold_column = percentile_threshold_column(column, percentile)
+        query = (
+            f"SELECT * FROM (\n{_as_subquery(get_percentile_threshold_query(query, column, percentile))}\n) AS kpi\n"
+            f"WHERE {column} >= {threshold_column}"
+        )
+
+    if spec.get("rank"):
+        rank = spec["rank"]
+        return get_ranked_rows_query(query, rank["column"], rank["n"], rank["avg_count"])
+
+    if spec.get("order_by"):
+        query = f"SELECT * FROM (\n{query}\n) AS kpi\nORDER BY {spec['order_by']}"
+    return query + ";"
+
+
+def get_row_spec_order(spec: dict, kpi_order: str = None) -> str:
+    """
+    The row order of `compile_row_spec(kpi_query, spec)` as an ORDER BY over the columns it
+    returns, for wrappers that cannot rely on the order of a subquery. `kpi_order` is the order
+    of the KPI query itself, kept when `spec` does not reorder the rows. None when unordered.
+    """
+    if spec.get("rank"):
+        # Groups as `get_ranked_rows_query` returns them: top and bottom by descending value,
+        # average by distance to the mean
+        column = spec["rank"]["column"]
+        return (
+            f"CASE row_group WHEN 'top' THEN 1 WHEN 'bottom' THEN 2 ELSE 3 END, "
+            f"CASE WHEN row_group = 'average' THEN ABS({column} - {column}_mean) ELSE -{column} END"
+        )
+    return spec.get("order_by") or kpi_order
@@ -1,9 +1,46 @@
+import os
 from datetime import timedelta
 
 NAMESPACE="canvas"
 APP_NAME="thesis-canvas"
 DEFAULT_STATEMENT_TIMEOUT = timedelta(seconds=90)   # 1.5 mins 
 
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(SRC_PATH, "db", "schema.sql")
+SNAPSHOTS_PATH = os.path.join(SRC_PATH, "snapshots")
+TABLE_SCHEMAS_PATH = os.path.join(SRC_PATH, "table_schemas")
+SNAPSHOT_MANIFEST_PATH = os.path.join(SNAPSHOTS_PATH, "manifest.json")
+# Downloaded snapshots younger than this are reused without running a DAP snapshot job, unless
+# the schema version of their table changed
+SNAPSHOT_MAX_AGE = timedelta(hours=6)
+CSV_FOLDER_PATH = os.path.join(SRC_PATH, "csv_files")
+# DAP CSV exports read by the v1 pandas dashboard
+COURSES_PATH = os.path.join(CSV_FOLDER_PATH, "courses.csv")
+ENROLLMENTS_PATH = os.path.join(CSV_FOLDER_PATH, "enrollments.csv")
+ASSIGNMENTS_PATH = os.path.join(CSV_FOLDER_PATH, "assignments.csv")
+SUBMISSIONS_PATH = os.path.join(CSV_FOLDER_PATH, "submissions.csv")
+SCORES_PATH = os.path.join(CSV_FOLDER_PATH, "scores.csv")
+# Memory-mapped Arrow copies of those datasets, shared by the dashboard sessions and processes
+SHARED_DATA_PATH = os.path.join(SRC_PATH, "shared_data")
+# Precomputed per-semester results of the v1 dashboard, per dataset version
+RESULT_STORE_PATH = os.path.join(SRC_PATH, "result_store")
+RENDER_CACHE_PATH = os.path.join(SRC_PATH, "render_cache")
+COURSE_DIMENSION_PATH = os.path.join(SRC_PATH, "course_dimension", "courses.csv")
+
+# Connection pool settings per workload, used by `DatabaseEngineFactory`
+DEFAULT_WORKLOAD = "default"
+POOL_PROFILES = {
+    "default": {"pool_size": 4, "max_overflow": 28, "pool_timeout": 30},
+    # bulk loads and replication: few long-lived connections
+    "sync": {"pool_size": 4, "max_overflow": 0, "pool_timeout": 300},
+    # KPI queries of the static dashboards and the pipeline: one connection per concurrent KPI
+    "dashboard": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 30},
+}
+
+# Bulk loading of DAP snapshots with COPY
+COPY_BATCH_SIZE = 50_000
+COPY_WORKERS = 4
+
 TABLE_NAMES = []
 TABLES_FOR_KPIS_IN_CANVAS_LOGS = ["web_logs"]
 
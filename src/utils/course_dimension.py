@@ -0,0 +1,110 @@
+"""
+Course dimension: course_id -> course name, normalized display name and flags.
+
+Course names only change when `canvas.courses` is synced, so they are read and normalized once
+per sync and persisted to `COURSE_DIMENSION_PATH` instead of being joined into every KPI query
+and normalized on every render. KPI frames get their names with `add_course_names`.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.constants import COURSE_DIMENSION_PATH
+
+COURSE_DIMENSION_QUERY = "SELECT id AS course_id, name AS course_name FROM canvas.courses;"
+COURSE_DIMENSION_COLUMNS = ["course_name", "display_name", "is_lesson"]
+
+# Loaded dimension and the mtime of the file it was read from
+_loaded = {"path": None, "mtime": None, "dimension": None}
+
+
+def normalize_course_names(names: pd.Series) -> pd.Series:
+    """
+    Display form of course names: trimmed, without accents and in title case.
+    """
+    names = names.str.strip()
+    names = names.str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('utf-8')
+    return names.str.title()
+
+
+def is_lesson(display_names: pd.Series) -> pd.Series:
+    """
+    Lessons are Canvas courses used as single lessons, left out of the course tables.
+    """
+    return display_names.str.contains('Leccion', case=False, na=False)
+
+
+def build_course_dimension(engine) -> pd.DataFrame:
+    """
+    Reads every course name from the database and computes its display name and flags.
+
+    Returns:
+        pd.DataFrame: Indexed by course_id, with the `COURSE_DIMENSION_COLUMNS`.
+    """
+    dimension = pd.read_sql(COURSE_DIMENSION_QUERY, engine)
+    dimension["display_name"] = normalize_course_names(dimension["course_name"])
+    dimension["is_lesson"] = is_lesson(dimension["display_name"])
+    return dimension.set_index("course_id").sort_index()
+
+
+def save_course_dimension(dimension: pd.DataFrame, path: str = COURSE_DIMENSION_PATH):
+    """
+    Writes the dimension atomically, so readers never see a half written file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dimension.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_course_dimension(path: str = COURSE_DIMENSION_PATH):
+    """
+    Reads the persisted dimension, once per process until the file changes.
+
+    Returns:
+        pd.DataFrame or None: The dimension, or None when it has not been built yet.
+    """
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if _loaded["path"] != path or _loaded["mtime"] != mtime:
+        dimension = pd.read_csv(
+            path,
+            index_col="course_id",
+            dtype={"course_name": "string", "display_name": "string", "is_lesson": bool},
+            keep_default_na=False,
+        )
+        _loaded.update(path=path, mtime=mtime, dimension=dimension)
+    return _loaded["dimension"]
+
+
+def refresh_course_dimension(engine, path: str = COURSE_DIMENSION_PATH) -> pd.DataFrame:
+    """
+    Rebuilds and persists the dimension. Called after `canvas.courses` is synced.
+    """
+    dimension = build_course_dimension(engine)
+    save_course_dimension(dimension, path)
+    print(f"Course dimension refreshed: {len(dimension)} courses")
+    return load_course_dimension(path)
+
+
+def add_course_names(df: pd.DataFrame, dimension: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the `COURSE_DIMENSION_COLUMNS` of every course in `df` (by its `course_id`), right after
+    `course_id`. Courses missing from the dimension get an empty name and are not lessons.
+    """
+    positions = dimension.index.get_indexer(df["course_id"])
+    found = positions >= 0
+    positions = np.where(found, positions, 0)
+
+    df = df.drop(columns=[name for name in COURSE_DIMENSION_COLUMNS if name in df.columns])
+    insert_at = df.columns.get_loc("course_id") + 1
+    for offset, name in enumerate(COURSE_DIMENSION_COLUMNS):
+        values = dimension[name].to_numpy()[positions] if len(dimension) else np.empty(len(df), dtype=object)
+        if name == "is_lesson":
+            values = np.where(found, values, False).astype(bool)
+        else:
+            values = np.where(found, values, "")
+        df.insert(insert_at + offset, name, values)
+    return df
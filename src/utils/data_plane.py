@@ -0,0 +1,49 @@
+"""
+Data handed from the KPI frames to the plot builders.
+
+Plot builders take the KPI DataFrame itself (a ColumnDataSource is still accepted) and treat it
+as read-only: derived columns go into new frames (`DataFrame.assign`), never into the input.
+Each ColumnDataSource in the document is created once, with `make_source`, from the column
+arrays of the frame it draws.
+"""
+import numpy as np
+import pandas as pd
+from bokeh.models import ColumnDataSource
+
+
+def as_frame(data) -> pd.DataFrame:
+    """
+    The DataFrame behind a plot input: a DataFrame as is, or the columns of a ColumnDataSource.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, ColumnDataSource):
+        data = data.data
+    return pd.DataFrame(dict(data))
+
+
+def make_source(df: pd.DataFrame, columns=None) -> ColumnDataSource:
+    """
+    Creates the ColumnDataSource of a glyph or table from the column arrays of `df`.
+
+    Unlike `ColumnDataSource(df)` the frame is not reset or copied and no `index` column is
+    added. Extension arrays (nullable and string dtypes) are converted to NumPy arrays.
+
+    Args:
+        df (pd.DataFrame): Rows to draw.
+        columns (list): Columns to include, defaults to all of them.
+
+    Returns:
+        ColumnDataSource
+    """
+    columns = df.columns if columns is None else columns
+    return ColumnDataSource({str(column): _column_array(df[column]) for column in columns})
+
+
+def _column_array(series: pd.Series) -> np.ndarray:
+    if isinstance(series.dtype, pd.CategoricalDtype) or not isinstance(series.dtype, np.dtype):
+        # Strings, nullable numbers and categoricals: plain object/float arrays Bokeh can serialize
+        na_value = np.nan if pd.api.types.is_numeric_dtype(series.dtype) else None
+        dtype = np.float64 if pd.api.types.is_numeric_dtype(series.dtype) else object
+        return series.to_numpy(dtype=dtype, na_value=na_value)
+    return series.to_numpy()
@@ -0,0 +1,259 @@
+"""
+Size optimizations for the static dashboard export.
+
+Before saving, the Bokeh document is compacted by:
+- pruning `ColumnDataSource` columns that no glyph, legend, hover tooltip or table uses
+- downcasting numeric columns to float32/int32 so they are embedded as compact binary arrays
+- sharing identical data sources between plots
+"""
+import hashlib
+import json
+import re
+from collections import defaultdict
+
+import numpy as np
+from bokeh.core.serialization import Serializer
+from bokeh.models import (
+    ColumnDataSource,
+    DataTable,
+    GlyphRenderer,
+    HoverTool,
+    HTMLTemplateFormatter,
+    LegendItem,
+    Plot,
+)
+
+TOOLTIP_FIELD_PATTERN = re.compile(r"@\{([^}]+)\}|@([\w.]+)")
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+# Integers above this lose precision as float32 (e.g. Canvas ids stored as floats because of NaNs)
+FLOAT32_EXACT_INT_LIMIT = 2 ** 24
+GLYPH_ATTRIBUTES = ("glyph", "selection_glyph", "nonselection_glyph", "hover_glyph", "muted_glyph")
+
+
+def _encode(model) -> dict:
+    return Serializer(deferred=False).encode(model)
+
+
+def _collect_fields(encoded, fields: set):
+    """
+    Collects column names from `{"type": "field", "field": ...}` entries and filter `column_name`s.
+    """
+    if isinstance(encoded, dict):
+        if encoded.get("type") == "field" and isinstance(encoded.get("field"), str):
+            fields.add(encoded["field"])
+        column_name = encoded.get("attributes", {}).get("column_name") if isinstance(encoded.get("attributes"), dict) else None
+        if isinstance(column_name, str):
+            fields.add(column_name)
+        for value in encoded.values():
+            _collect_fields(value, fields)
+    elif isinstance(encoded, list):
+        for value in encoded:
+            _collect_fields(value, fields)
+
+
+def _tooltip_fields(tooltips):
+    """
+    Column names used in hover tooltips, or None when they cannot be determined.
+    """
+    if tooltips is None:
+        return set()
+    if isinstance(tooltips, str):
+        texts = [tooltips]
+    elif isinstance(tooltips, (list, tuple)):
+        texts = [value for _, value in tooltips]
+    else:
+        return None
+    return {braced or plain for text in texts for braced, plain in TOOLTIP_FIELD_PATTERN.findall(text)}
+
+
+def _find_referrers(models):
+    """
+    Maps every ColumnDataSource id to the (model, attribute) pairs that reference it.
+    """
+    referrers = defaultdict(list)
+    for model in models:
+        for attribute in model.properties_with_refs():
+            value = getattr(model, attribute, None)
+            values = value if isinstance(value, (list, tuple)) else (value.values() if isinstance(value, dict) else [value])
+            for item in values:
+                if isinstance(item, ColumnDataSource):
+                    referrers[item.id].append((model, attribute))
+    return referrers
+
+
+def _renderer_fields(renderer, plots, legend_items):
+    fields = set()
+    for attribute in GLYPH_ATTRIBUTES:
+        glyph = getattr(renderer, attribute, None)
+        if glyph is not None and glyph != "auto":
+            _collect_fields(_encode(glyph), fields)
+    _collect_fields(_encode(renderer.view), fields)
+
+    for item in legend_items:
+        if renderer in item.renderers:
+            _collect_fields(_encode(item.label), fields)
+
+    for plot in plots:
+        if renderer not in plot.renderers:
+            continue
+        for tool in plot.tools:
+            if not isinstance(tool, HoverTool):
+                continue
+            if tool.renderers != "auto" and renderer not in tool.renderers:
+                continue
+            tooltip_fields = _tooltip_fields(tool.tooltips)
+            if tooltip_fields is None:
+                return None
+            fields |= tooltip_fields
+    return fields
+
+
+def _table_fields(table, columns):
+    fields = set()
+    for table_column in table.columns:
+        fields.add(table_column.field)
+        formatter = table_column.formatter
+        if isinstance(formatter, HTMLTemplateFormatter):
+            # Templates can read other columns of the row by name
+            fields |= {column for column in columns if re.search(rf"\b{re.escape(column)}\b", formatter.template)}
+    return fields
+
+
+def used_columns(source, referrers, plots, legend_items):
+    """
+    Columns of `source` read by the document, or None if some referrer is not understood
+    (e.g. a CustomJS callback), in which case every column is kept.
+    """
+    fields = set()
+    for model, attribute in referrers:
+        if isinstance(model, GlyphRenderer) and attribute == "data_source":
+            renderer_fields = _renderer_fields(model, plots, legend_items)
+        elif isinstance(model, DataTable) and attribute == "source":
+            renderer_fields = _table_fields(model, source.data.keys())
+        else:
+            renderer_fields = None
+        if renderer_fields is None:
+            return None
+        fields |= renderer_fields
+    return fields
+
+
+def downcast_column(values):
+    """
+    Converts numeric columns to float32/int32 numpy arrays, which Bokeh embeds as binary data.
+    Non numeric columns, and those that would lose precision, are returned unchanged.
+    """
+    if isinstance(values, (list, tuple)):
+        if not values or not all(isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)) for value in values):
+            return values
+        values = np.asarray(values)
+
+    if not isinstance(values, np.ndarray) or values.ndim != 1:
+        return values
+
+    if np.issubdtype(values.dtype, np.integer):
+        if values.size and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+            return values
+        return values.astype(np.int32, copy=False)
+
+    if np.issubdtype(values.dtype, np.floating) and values.dtype != np.float32:
+        finite = values[np.isfinite(values)]
+        if finite.size:
+            largest = np.abs(finite).max()
+            if largest > FLOAT32_MAX:
+                return values
+            if largest > FLOAT32_EXACT_INT_LIMIT and np.all(finite == np.round(finite)):
+                return values
+        return values.astype(np.float32)
+
+    return values
+
+
+def _source_fingerprint(source) -> str:
+    digest = hashlib.sha256()
+    for column in sorted(source.data):
+        values = source.data[column]
+        digest.update(column.encode())
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            digest.update(str(values.dtype).encode())
+            digest.update(values.tobytes())
+        else:
+            digest.update(json.dumps(list(values), default=str).encode())
+    return digest.hexdigest()
+
+
+def optimize_document(root, share_sources: bool = True) -> dict:
+    """
+    Compacts the data sources reachable from `root` in place.
+
+    Args:
+        root: Layout or model to optimize.
+        share_sources (bool): Point renderers with identical data to a single source. Disable it
+            when the structure of the document must not depend on the data (semester switching).
+
+    Returns:
+        dict: Counts of pruned columns, downcast columns and shared sources.
+    """
+    models = list(root.references())
+    plots = [model for model in models if isinstance(model, Plot)]
+    legend_items = [model for model in models if isinstance(model, LegendItem)]
+    sources = [model for model in models if isinstance(model, ColumnDataSource)]
+    referrers = _find_referrers(models)
+    stats = {"sources": len(sources), "pruned_columns": 0, "downcast_columns": 0, "shared_sources": 0}
+
+    for source in sources:
+        keep = used_columns(source, referrers[source.id], plots, legend_items)
+        data = {}
+        for column, values in source.data.items():
+            if keep is not None and column not in keep:
+                stats["pruned_columns"] += 1
+                continue
+            compact = downcast_column(values)
+            if compact is not values:
+                stats["downcast_columns"] += 1
+            data[column] = compact
+        source.data = data
+
+    if not share_sources:
+        return stats
+
+    # Share identical sources. Only plain renderer/table references are rewired.
+    canonical = {}
+    for source in sources:
+        if not all(
+            (isinstance(model, GlyphRenderer) and attribute == "data_source") or (isinstance(model, DataTable) and attribute == "source")
+            for model, attribute in referrers[source.id]
+        ):
+            continue
+        fingerprint = _source_fingerprint(source)
+        if fingerprint not in canonical:
+            canonical[fingerprint] = source
+            continue
+        for model, attribute in referrers[source.id]:
+            setattr(model, attribute, canonical[fingerprint])
+        stats["shared_sources"] += 1
+
+    return stats
+
+
+def model_size(model) -> int:
+    """
+    Size in bytes of the JSON representation of a model and everything it references.
+    """
+    return len(json.dumps(_encode(model), separators=(",", ":")))
+
+
+def report_document_size(plots_by_name: dict, title: str = "Document size per plot", size_of=None) -> dict:
+    """
+    Prints the JSON size of every plot. `size_of(plot)` can provide the size of plots that are
+    not regular models (e.g. render cache placeholders) and returns None for the others.
+    """
+    sizes = {}
+    for name, plot in plots_by_name.items():
+        size = size_of(plot) if size_of else None
+        sizes[name] = size if size is not None else model_size(plot)
+    print(title)
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        print(f"  {name:<28} {size / 1024:>8.1f} KB")
+    print(f"  {'total':<28} {sum(sizes.values()) / 1024:>8.1f} KB")
+    return sizes
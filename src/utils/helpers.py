@@ -5,6 +5,8 @@ import pandas as pd
 from bokeh.models import ColumnDataSource, DataTable, TableColumn, Label, Span, HoverTool, HTMLTemplateFormatter
 from bokeh.plotting import figure
 
+from utils import course_dimension, data_plane
+
 TEXT_FONT_SIZE = "12pt"
 HEIGHT = 500 
 
@@ -82,6 +84,19 @@ def get_current_semester():
         raise ValueError("Invalid month for semester calculation.")
 
 
+def get_latest_semester(today=None):
+    """
+    The semester (as `get_semester_dates` names them) that started most recently: the current
+    one, or the last one that ended when `today` falls between two. Spring before it starts.
+    """
+    today = today or date.today()
+    started = [
+        semester for semester in translation_map
+        if date.fromisoformat(get_semester_dates(today.year, semester)[0]) <= today
+    ]
+    return started[-1] if started else "Spring"
+
+
 def create_summary_table(
     source,
     col_name: str,
@@ -92,7 +107,7 @@ def create_summary_table(
     """
     Creates a summary statistics table for a given column in the source.
     
-    :param source: ColumnDataSource containing your data
+    :param source: KPI DataFrame (or ColumnDataSource) containing your data
     :param col_name: The name of the numeric column to compute stats on
     :param label: A short label used in the row titles. 
                   E.g. 'Completion' or 'Feedback Time'
@@ -102,7 +117,7 @@ def create_summary_table(
     
     :return: DataTable object
     """
-    df = source.to_df()
+    df = data_plane.as_frame(source)
 
     if df.empty or col_name not in df.columns or df[col_name].dropna().empty:
         # If no data or the column doesn't exist or all nulls
@@ -128,7 +143,7 @@ def create_summary_table(
             ]
         })
 
-    table_source = ColumnDataSource(stats_df)
+    table_source = data_plane.make_source(stats_df)
 
     columns = [
         TableColumn(field='Metric', title='Metric'),
@@ -162,7 +177,7 @@ def create_histogram(
     """
     Creates a generic histogram for any numeric column in the source DataFrame.
 
-    :param source: Bokeh ColumnDataSource containing your data
+    :param source: KPI DataFrame (or Bokeh ColumnDataSource) containing your data
     :param col_name: Name of the numeric column to histogram
     :param title: Plot title
     :param bins: Number of bins in the histogram
@@ -176,7 +191,7 @@ def create_histogram(
     :param label_text: Text displayed as a label inside the plot
     :return: A Bokeh figure object
     """
-    df = source.to_df()
+    df = data_plane.as_frame(source)
 
     if df.empty or col_name not in df.columns or df[col_name].dropna().empty:
         p_empty = figure(width=width, height=height, title=f'No Data for {col_name}')
@@ -321,17 +336,17 @@ def create_completion_table(source):
     """
     Creates a Bokeh DataTable showing course completion percentages with color indicators
     """
-    df = source.to_df()
+    df = data_plane.as_frame(source)
 
-    # Standardize and clean the 'course_name' column
-    df['course_name'] = df['course_name'].str.strip()  # Remove leading/trailing spaces
-    df['course_name'] = df['course_name'].str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('utf-8')  # Remove accents
-    df['course_name'] = df['course_name'].str.title()  # Convert to title case
-    df = df[~df['course_name'].str.contains('Leccion', case=False, na=False)]
+    # Display names (trimmed, without accents, title case) come from the course dimension
+    if 'display_name' not in df.columns:
+        display_names = course_dimension.normalize_course_names(df['course_name'])
+        df = df.assign(display_name=display_names, is_lesson=course_dimension.is_lesson(display_names))
+    df = df[~df['is_lesson'].astype(bool)]
 
     df = df.sort_values('completion_percentage', ascending=True)
 
-    source = ColumnDataSource(df)
+    source = data_plane.make_source(df, ['display_name', 'course_id', 'completion_percentage'])
 
     # Create HTML template for color-coded completion percentage
     template = """
@@ -346,7 +361,7 @@ def create_completion_table(source):
 
     # Define the columns for the table
     columns = [
-        TableColumn(field="course_name", title="Nombre del curso", width=250),
+        TableColumn(field="display_name", title="Nombre del curso", width=250),
         TableColumn(field="course_id", title="ID del curso", width=100),
         TableColumn(
             field="completion_percentage",
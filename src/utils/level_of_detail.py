@@ -0,0 +1,214 @@
+"""
+Level-of-detail rendering for the per-course bar charts.
+
+A categorical bar per course stalls the browser and inflates the HTML once there are thousands
+of courses. Above `LOD_THRESHOLD` courses the plots show a histogram of courses per value bin
+instead (drawn with WebGL), and the per-course values move to a paged `DataTable` below it.
+Selecting bars in the histogram narrows the table to the courses in those bins.
+"""
+import numpy as np
+import pandas as pd
+from bokeh.layouts import column, row
+from bokeh.models import (
+    Button,
+    ColumnDataSource,
+    CustomJS,
+    DataTable,
+    Div,
+    HoverTool,
+    NumberFormatter,
+    TableColumn,
+    TapTool,
+)
+from bokeh.plotting import figure
+
+LOD_THRESHOLD = 150
+# Threshold that draws every plot in level-of-detail mode, whatever its number of courses
+ALWAYS_LOD = -1
+LOD_BINS = 20
+PAGE_SIZE = 25
+TEXT_FONT_SIZE = "12pt"
+
+PAGER_CODE = """
+const data = full_source.data;
+const selected_bins = new Set(bins.selected.indices);
+const rows = [];
+for (let i = 0; i < data.bin.length; i++) {
+    if (selected_bins.size === 0 || selected_bins.has(data.bin[i])) {
+        rows.push(i);
+    }
+}
+
+const pages = Math.max(1, Math.ceil(rows.length / page_size));
+const current = status.tags.length ? status.tags[0] : 0;
+const page = step === 0 ? 0 : Math.min(Math.max(current + step, 0), pages - 1);
+const page_rows = rows.slice(page * page_size, (page + 1) * page_size);
+
+const page_data = {};
+for (const name of Object.keys(data)) {
+    page_data[name] = page_rows.map((i) => data[name][i]);
+}
+page_source.data = page_data;
+status.tags = [page];
+status.text = `Página ${page + 1} de ${pages} (${rows.length} cursos)`;
+"""
+
+
+def exceeds_threshold(df: pd.DataFrame, threshold=LOD_THRESHOLD) -> bool:
+    """
+    Whether a plot of `df` should be drawn in level-of-detail mode. A `threshold` of None disables
+    it and `ALWAYS_LOD` forces it.
+    """
+    return threshold is not None and len(df) > threshold
+
+
+def _page_status(rows: int, page_size: int) -> str:
+    return f"Página 1 de {max(1, -(-rows // page_size))} ({rows} cursos)"
+
+
+def create_paged_table(df: pd.DataFrame, table_columns, bins_source, width: int, page_size: int = PAGE_SIZE):
+    """
+    Creates a DataTable that shows `df` one page at a time, filtered by the bins selected in `bins_source`.
+
+    Args:
+        df (pd.DataFrame): One row per course, with a `bin` column (position in `bins_source`).
+        table_columns (list): (field, title, number format or None) tuples.
+        bins_source (ColumnDataSource): Source of the histogram bars.
+        width (int): Width of the table.
+        page_size (int): Rows per page.
+
+    Returns:
+        A Bokeh layout with the table and its pager.
+    """
+    fields = [field for field, _, _ in table_columns] + ["bin"]
+    full_data = {field: df[field].to_numpy() for field in fields}
+    full_source = ColumnDataSource(full_data)
+    page_source = ColumnDataSource({field: values[:page_size] for field, values in full_data.items()})
+
+    table = DataTable(
+        source=page_source,
+        columns=[
+            TableColumn(field=field, title=title, formatter=NumberFormatter(format=number_format))
+            if number_format else TableColumn(field=field, title=title)
+            for field, title, number_format in table_columns
+        ],
+        width=width,
+        height=min(page_size, 25) * 25 + 30,
+        index_position=None,
+    )
+
+    status = Div(text=_page_status(len(df), page_size), tags=[0])
+    previous_button = Button(label="Anterior", width=100)
+    next_button = Button(label="Siguiente", width=100)
+
+    args = {"full_source": full_source, "page_source": page_source, "bins": bins_source, "status": status, "page_size": page_size}
+    previous_button.js_on_event("button_click", CustomJS(args={**args, "step": -1}, code=PAGER_CODE))
+    next_button.js_on_event("button_click", CustomJS(args={**args, "step": 1}, code=PAGER_CODE))
+    bins_source.selected.js_on_change("indices", CustomJS(args={**args, "step": 0}, code=PAGER_CODE))
+
+    return column(table, row(previous_button, status, next_button))
+
+
+def create_binned_overview(
+    df: pd.DataFrame,
+    value_columns: dict,
+    title: str,
+    x_axis_label: str,
+    table_columns,
+    reference_lines: dict = None,
+    bins: int = LOD_BINS,
+    bin_range: tuple = None,
+    width: int = 900,
+    height: int = 500,
+    page_size: int = PAGE_SIZE,
+):
+    """
+    Histogram of courses per value bin with a paged per-course table, used instead of one bar per course.
+
+    Args:
+        df (pd.DataFrame): One row per course.
+        value_columns (dict): Column -> (legend label, color). Every column is binned with the same
+            edges and drawn side by side; the first one drives the table filtering.
+        title (str): Plot title.
+        x_axis_label (str): Label of the value axis.
+        table_columns (list): (field, title, number format or None) tuples shown in the table.
+        reference_lines (dict): Legend label -> (value, color) vertical lines (e.g. mean, median).
+        bins (int): Number of bins.
+        bin_range (tuple): (min, max) of the bins, defaults to the range of the data.
+        width (int): Width of the plot and the table.
+        height (int): Height of the plot.
+        page_size (int): Rows per table page.
+
+    Returns:
+        A Bokeh layout with the histogram and the table.
+    """
+    columns = list(value_columns)
+    values = df[columns].to_numpy(dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    if bin_range is None:
+        bin_range = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+    edges = np.histogram_bin_edges(finite, bins=bins, range=bin_range)
+
+    # Columns are drawn side by side inside each bin
+    bar_width = (edges[1] - edges[0]) / len(columns)
+    bins_data = {"left": edges[:-1], "right": edges[1:]}
+    for position, column_name in enumerate(columns):
+        bins_data[column_name], _ = np.histogram(df[column_name].dropna(), bins=edges)
+        bins_data[f"{column_name}_left"] = edges[:-1] + position * bar_width
+        bins_data[f"{column_name}_right"] = edges[:-1] + (position + 1) * bar_width
+    bins_source = ColumnDataSource(bins_data)
+
+    p = figure(
+        width=width,
+        height=height,
+        title=f"{title} ({len(df)} cursos agrupados)",
+        toolbar_location="right",
+        tools="pan,box_zoom,reset,save",
+        x_axis_label=x_axis_label,
+        y_axis_label="Número de cursos",
+        output_backend="webgl",
+    )
+
+    renderers = []
+    for column_name, (legend_label, color) in value_columns.items():
+        renderers.append(p.quad(
+            left=f"{column_name}_left",
+            right=f"{column_name}_right",
+            top=column_name,
+            bottom=0,
+            source=bins_source,
+            fill_color=color,
+            line_color="white",
+            legend_label=legend_label,
+        ))
+
+    p.add_tools(HoverTool(
+        renderers=renderers,
+        tooltips=[("Rango", "@left{0.0} - @right{0.0}")] + [
+            (legend_label, f"@{column_name} cursos") for column_name, (legend_label, _) in value_columns.items()
+        ],
+    ))
+    p.add_tools(TapTool(renderers=renderers[:1]))
+
+    highest_bin = max(int(bins_data[column_name].max()) for column_name in columns) if len(edges) > 1 else 0
+    for legend_label, (value, color) in (reference_lines or {}).items():
+        p.line(
+            x=[value, value],
+            y=[0, highest_bin],
+            line_color=color,
+            line_dash="dashed",
+            line_width=2,
+            legend_label=f"{legend_label}: {value:.1f}",
+        )
+
+    p.y_range.start = 0
+    p.xgrid.grid_line_color = None
+    p.title.text_font_size = TEXT_FONT_SIZE
+    p.legend.location = "top_left"
+    p.legend.click_policy = "hide"
+
+    first_values = df[columns[0]].to_numpy(dtype=np.float64)
+    bin_positions = np.clip(np.searchsorted(edges, first_values, side="right") - 1, 0, len(edges) - 2)
+    table_df = df.assign(bin=np.where(np.isnan(first_values), -1, bin_positions))
+    table = create_paged_table(table_df, table_columns, bins_source, width=width, page_size=page_size)
+    return column(p, table)
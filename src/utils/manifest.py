@@ -0,0 +1,194 @@
+"""
+Local manifest of downloaded DAP table snapshots.
+
+For every table it keeps the snapshot version reported by DAP, the files that were downloaded,
+their content hash and row count, and the hash each downstream stage (conversion, load) last
+processed. Stages compare their recorded hash against the current one to skip unchanged data.
+
+It also keeps the keys and indexes `bulk_loader` dropped until it has rebuilt them, so a load
+that is interrupted leaves them to be restored by the next run.
+
+Stages run concurrently (see `pipeline`), so they change the manifest through `update_manifest`,
+which holds a lock on it from load to save. Reading it with `load_manifest` needs no lock: it is
+always replaced whole.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from utils.constants import SNAPSHOT_MANIFEST_PATH
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Not a table name: DAP table names never start with an underscore
+PENDING_INDEXES_KEY = "_pending_indexes"
+
+
+def load_manifest(manifest_path: str = SNAPSHOT_MANIFEST_PATH) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest: dict, manifest_path: str = SNAPSHOT_MANIFEST_PATH):
+    """
+    Writes the manifest atomically, so an interrupted run never leaves a half written file.
+    Use `update_manifest` when other stages may change it at the same time.
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+# Threads of one process; flock (below) only orders the processes
+_update_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def update_manifest(manifest_path: str = SNAPSHOT_MANIFEST_PATH):
+    """
+    Loads the manifest to change it and saves it on exit, holding a lock on it (a lock file next
+    to it, shared with other processes) meanwhile, so that concurrent stages never overwrite
+    each other's changes. Nothing is saved when the block raises. Must not be nested.
+
+    Usage:
+        with update_manifest(manifest_path) as manifest:
+            mark_stage_done(manifest, table, "loaded")
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with _update_lock, open(f"{manifest_path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = load_manifest(manifest_path)
+        yield manifest
+        save_manifest(manifest, manifest_path)
+
+
+def hash_snapshot_files(files: List[str]) -> Tuple[str, int]:
+    """
+    Computes a single SHA-256 over the content of `files` (in sorted order) and counts their rows.
+
+    Returns:
+        tuple: Hex digest and number of non-empty lines.
+    """
+    digest = hashlib.sha256()
+    rows = 0
+    for path in sorted(files):
+        with open(path, "rb") as snapshot_file:
+            remainder = b""
+            for chunk in iter(lambda: snapshot_file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                lines = (remainder + chunk).split(b"\n")
+                remainder = lines.pop()
+                rows += sum(1 for line in lines if line.strip())
+            if remainder.strip():
+                rows += 1
+    return digest.hexdigest(), rows
+
+
+def get_table_entry(manifest: dict, table: str) -> Optional[dict]:
+    return manifest.get(table)
+
+
+def is_same_version(entry: Optional[dict], schema_version: int, timestamp: datetime) -> bool:
+    """
+    True when the snapshot reported by DAP is the one already downloaded and its files are still on disk.
+    """
+    if not entry:
+        return False
+    return (
+        entry.get("schema_version") == schema_version
+        and entry.get("timestamp") == timestamp.isoformat()
+        and all(os.path.exists(path) for path in entry.get("files", []))
+    )
+
+
+def is_recent_snapshot(entry: Optional[dict], schema_version: int, max_age: timedelta) -> bool:
+    """
+    True when the downloaded snapshot has the current schema version, its files are still on
+    disk and it is less than `max_age` old, so it is reused without asking DAP for a new one.
+    """
+    if not entry or entry.get("schema_version") != schema_version:
+        return False
+    if not all(os.path.exists(path) for path in entry.get("files", [])):
+        return False
+    timestamp = datetime.fromisoformat(entry["timestamp"])
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - timestamp < max_age
+
+
+def record_snapshot(
+    manifest: dict,
+    table: str,
+    schema_version: int,
+    timestamp: datetime,
+    job_id: str,
+    files: List[str],
+) -> dict:
+    """
+    Records a freshly downloaded snapshot. Stage markers are kept, so downstream stages
+    still skip the table when the new files have the same content as the previous ones.
+    """
+    sha256, rows = hash_snapshot_files(files)
+    previous = manifest.get(table, {})
+    manifest[table] = {
+        "schema_version": schema_version,
+        "timestamp": timestamp.isoformat(),
+        "job_id": str(job_id),
+        "files": sorted(files),
+        "sha256": sha256,
+        "rows": rows,
+        "downloaded_at": datetime.now(timezone.utc).isoformat(),
+        "stages": previous.get("stages", {}),
+    }
+    return manifest[table]
+
+
+def is_stage_current(manifest: dict, table: str, stage: str) -> bool:
+    """
+    True when `stage` already processed the current content of `table`.
+    """
+    entry = manifest.get(table)
+    if not entry:
+        return False
+    return entry.get("stages", {}).get(stage) == entry.get("sha256")
+
+
+def mark_stage_done(manifest: dict, table: str, stage: str, sha256: str = None):
+    """
+    Records that `stage` processed the content of `table` with hash `sha256` (by default the
+    current one; pass the one read when the stage started if a new snapshot may have been
+    recorded meanwhile).
+    """
+    entry = manifest.get(table)
+    if entry:
+        entry.setdefault("stages", {})[stage] = sha256 or entry.get("sha256")
+
+
+def get_pending_indexes(manifest: dict) -> Optional[dict]:
+    """
+    Definitions of the keys and indexes dropped by a load that did not rebuild them, if any.
+    """
+    return manifest.get(PENDING_INDEXES_KEY)
+
+
+def set_pending_indexes(manifest: dict, definitions: Optional[dict]):
+    """
+    Records the definitions returned by `bulk_loader.drop_indexes`, or clears them with None.
+    """
+    if definitions:
+        manifest[PENDING_INDEXES_KEY] = definitions
+    else:
+        manifest.pop(PENDING_INDEXES_KEY, None)
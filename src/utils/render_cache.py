@@ -0,0 +1,313 @@
+"""
+Disk cache of rendered Bokeh plots.
+
+Each plot is stored as serialized Bokeh JSON under a key built from the plot function (name and
+source code), its parameters, a hash of the input data and a fingerprint of the code every plot
+goes through (the `RENDER_MODULES` and the Bokeh version). When a later build calls the same
+function with identical data, a lightweight placeholder is put in the layout and the stored JSON
+is spliced into the document when the HTML file is written. Rebuilding the Bokeh models from JSON
+costs about as much as building the plot again, so cached plots never go back to Python models.
+"""
+import functools
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import time
+
+import bokeh
+import pandas as pd
+from bokeh.core.serialization import Serializer
+from bokeh.document import Document
+from bokeh.embed.bundle import bundle_for_objs_and_resources
+from bokeh.embed.elements import html_page_for_render_items
+from bokeh.embed.util import standalone_docs_json_and_render_items
+from bokeh.models import DataTable, Div, Plot, Spacer
+from bokeh.models.widgets import TableWidget, Widget
+from bokeh.resources import CDN
+from bokeh.util.serialization import make_id
+
+from utils import data_plane
+from utils.constants import RENDER_CACHE_PATH
+
+MAX_CACHE_ENTRIES = 500
+# Modules of the helpers the plot functions call and of the document optimizations applied
+# before plots are stored: a change in any of them changes the cached output
+RENDER_MODULES = (
+    "plots",
+    "queries",
+    "utils.helpers",
+    "utils.selection",
+    "utils.level_of_detail",
+    "utils.data_plane",
+    "utils.document_optimizer",
+)
+
+
+def hash_frame(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame, including its column names and dtypes.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode())
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True)
+        digest.update(row_hashes.to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cells (lists, dicts) fall back to their JSON representation
+        digest.update(df.to_json(orient="split", date_format="iso", default_handler=str).encode())
+    return digest.hexdigest()
+
+
+def _function_fingerprint(plot_function) -> str:
+    name = f"{plot_function.__module__}.{plot_function.__qualname__}"
+    try:
+        code = inspect.getsource(plot_function)
+    except (OSError, TypeError):
+        code = ""
+    return hashlib.sha256(f"{name}\n{code}".encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint(modules: tuple = RENDER_MODULES) -> str:
+    """
+    Hash of the source of `modules` and of the Bokeh version, computed once per process.
+    """
+    digest = hashlib.sha256(f"bokeh {bokeh.__version__}".encode())
+    for name in modules:
+        digest.update(f"\n{name}\n".encode())
+        digest.update(inspect.getsource(importlib.import_module(name)).encode())
+    return digest.hexdigest()
+
+
+def _remap_ids(encoded):
+    """
+    Gives every model of a cached plot a fresh id, so plots cached by different runs never
+    collide with each other or with the live models of the layout.
+    """
+    ids = {}
+
+    def collect(value):
+        if isinstance(value, dict):
+            if value.get("type") == "object" and "id" in value:
+                ids.setdefault(value["id"], make_id())
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    def replace(value):
+        if isinstance(value, dict):
+            return {
+                key: ids.get(item, item) if key == "id" and isinstance(item, str) else replace(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [replace(item) for item in value]
+        return value
+
+    collect(encoded)
+    return replace(encoded)
+
+
+def _bundle_requirements(plot) -> dict:
+    """
+    BokehJS bundles a plot needs. Cached plots are not Python models anymore, so this is
+    recorded when they are stored.
+    """
+    models = list(plot.references())
+    return {
+        "tables": any(isinstance(model, TableWidget) for model in models),
+        "widgets": any(isinstance(model, Widget) for model in models),
+        "webgl": any(isinstance(model, Plot) and model.output_backend == "webgl" for model in models),
+    }
+
+
+class RenderCache:
+    """
+    Builds plots through the cache and keeps hit/miss statistics for the current build.
+
+    Usage:
+        plot = render_cache.render(plot_function, source)   # live figure or placeholder
+        ...                                                  # layout, document optimizations
+        render_cache.save(layout, filename, title)           # stores new plots, splices cached ones
+    """
+
+    def __init__(self, cache_dir: str = RENDER_CACHE_PATH, enabled: bool = True, variant: str = ""):
+        """
+        Args:
+            cache_dir (str): Folder of the cached plots.
+            enabled (bool): When False every plot is built and nothing is stored.
+            variant (str): Part of every key, for output that depends on more than the plot
+                function (e.g. whether the document is optimized before saving).
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.variant = variant
+        self.reset()
+
+    def reset(self):
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "build_seconds": 0.0, "load_seconds": 0.0}
+        self.entries = {}
+        self._pending = {}
+        self._cached = {}
+
+    def cache_key(self, plot_function, df: pd.DataFrame, params: dict) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.variant.encode())
+        digest.update(code_fingerprint().encode())
+        digest.update(_function_fingerprint(plot_function).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(hash_frame(df).encode())
+        return digest.hexdigest()
+
+    def _path(self, plot_function, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{plot_function.__name__}-{key[:32]}.json")
+
+    def _load(self, path: str) -> dict:
+        with open(path, encoding="utf-8") as cache_file:
+            entry = json.load(cache_file)
+        entry["model"] = _remap_ids(entry["model"])
+        os.utime(path)
+        return entry
+
+    def render(self, plot_function, source, name: str = None, **params):
+        """
+        Returns the figure built by `plot_function(source, **params)`, or a placeholder standing
+        in for the cached figure when the input data did not change.
+
+        Args:
+            plot_function: One of the `plots` / `helpers` plot builders.
+            source: ColumnDataSource (or DataFrame) with the plot input.
+            name (str): Name reported in the statistics, defaults to the function name.
+
+        Returns:
+            Bokeh model to place in the layout.
+        """
+        name = name or plot_function.__name__
+        if not self.enabled:
+            return plot_function(source, **params)
+
+        df = data_plane.as_frame(source)
+        path = self._path(plot_function, self.cache_key(plot_function, df, params))
+
+        if os.path.exists(path):
+            start = time.perf_counter()
+            try:
+                entry = self._load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Discarding unreadable render cache entry {path}: {e}")
+                self.stats["errors"] += 1
+                os.remove(path)
+            else:
+                elapsed = time.perf_counter() - start
+                placeholder = Spacer(name=f"render-cache:{name}")
+                self._cached[placeholder.id] = entry
+                self.stats["hits"] += 1
+                self.stats["load_seconds"] += elapsed
+                self.entries[name] = {"status": "hit", "seconds": round(elapsed, 3), "size": entry["size"]}
+                return placeholder
+
+        start = time.perf_counter()
+        plot = plot_function(source, **params)
+        elapsed = time.perf_counter() - start
+        self._pending[name] = (path, plot)
+        self.stats["misses"] += 1
+        self.stats["build_seconds"] += elapsed
+        self.entries[name] = {"status": "miss", "seconds": round(elapsed, 3)}
+        return plot
+
+    def cached_size(self, model):
+        """
+        Size in bytes of the cached JSON behind a placeholder, or None for live models.
+        """
+        entry = self._cached.get(model.id)
+        return entry["size"] if entry else None
+
+    def store_pending(self):
+        """
+        Writes the plots built in this run to the cache, in their current (optimized) state.
+        """
+        for name, (path, plot) in self._pending.items():
+            encoded = Serializer(deferred=False).encode(plot)
+            entry = {"model": encoded, "bundle": _bundle_requirements(plot)}
+            entry["size"] = len(json.dumps(encoded, separators=(",", ":")))
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Unique per process: batch builds render dashboards in parallel
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                    json.dump(entry, cache_file, separators=(",", ":"))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Could not store {name} in the render cache: {e}")
+                self.stats["errors"] += 1
+            self.entries[name]["size"] = entry["size"]
+        self._pending = {}
+        if os.path.isdir(self.cache_dir):
+            self._evict()
+
+    def _evict(self):
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        if len(entries) <= MAX_CACHE_ENTRIES:
+            return
+        entries.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in entries[: len(entries) - MAX_CACHE_ENTRIES]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _splice(self, encoded):
+        if isinstance(encoded, dict):
+            if encoded.get("type") == "object" and encoded.get("id") in self._cached:
+                return self._cached[encoded["id"]]["model"]
+            return {key: self._splice(value) for key, value in encoded.items()}
+        if isinstance(encoded, list):
+            return [self._splice(value) for value in encoded]
+        return encoded
+
+    def _bundle_models(self):
+        """
+        Stand-in models so the page loads the BokehJS bundles the cached plots need.
+        """
+        needs = {requirement for entry in self._cached.values() for requirement, used in entry["bundle"].items() if used}
+        models = []
+        if "tables" in needs:
+            models.append(DataTable())
+        if "widgets" in needs:
+            models.append(Div())
+        if "webgl" in needs:
+            models.append(Plot(output_backend="webgl"))
+        return models
+
+    def save(self, layout, filename: str, title: str, resources=CDN):
+        """
+        Stores the newly built plots and writes the layout as a standalone HTML file,
+        with the cached plots spliced in place of their placeholders.
+        """
+        self.store_pending()
+
+        doc = Document(title=title)
+        doc.add_root(layout)
+        docs_json, render_items = standalone_docs_json_and_render_items([layout])
+        docs_json = {doc_id: self._splice(doc_json) for doc_id, doc_json in docs_json.items()}
+        bundle = bundle_for_objs_and_resources([doc, *self._bundle_models()], resources)
+        html = html_page_for_render_items(bundle, docs_json, render_items, title=title)
+        doc.remove_root(layout)
+
+        with open(filename, "w", encoding="utf-8") as html_file:
+            html_file.write(html)
+
+    def report(self) -> dict:
+        total = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / total if total else 0.0
+        print(
+            f"Render cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({hit_rate:.0%} hit rate), "
+            f"{self.stats['build_seconds']:.2f}s building, {self.stats['load_seconds']:.2f}s loading"
+        )
+        for name, entry in self.entries.items():
+            print(f"  {name:<28} {entry['status']:<5} {entry['seconds']:>7.3f}s")
+        return {**self.stats, "hit_rate": round(hit_rate, 3), "plots": dict(self.entries)}
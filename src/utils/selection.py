@@ -0,0 +1,115 @@
+"""
+Top / bottom / closest-to-average course selection used by the comparison plots.
+
+The selection runs in O(n) with `np.argpartition` over the values column; only the selected
+rows are sorted. Rows are gathered from the frame once, in the final order. Frames fetched with
+the selection already pushed down to Postgres (`queries.get_ranked_rows_query`) are only labeled.
+"""
+import numpy as np
+import pandas as pd
+
+# Groups of a pushed-down selection, in the order `queries.get_ranked_rows_query` returns them
+ROW_GROUP_COLUMN = "row_group"
+ROW_GROUPS = ("top", "bottom", "average")
+
+
+def _largest(values: np.ndarray, candidates: np.ndarray, count: int) -> np.ndarray:
+    """
+    Positions (from `candidates`) of the `count` largest values, in descending order.
+    """
+    if count <= 0:
+        return candidates[:0]
+    if count < len(candidates):
+        candidates = candidates[np.argpartition(values[candidates], len(candidates) - count)[-count:]]
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+def _smallest_by(keys: np.ndarray, candidates: np.ndarray, count: int) -> np.ndarray:
+    """
+    Positions (from `candidates`) of the `count` smallest keys, in ascending order.
+    """
+    if count <= 0:
+        return candidates[:0]
+    if count < len(candidates):
+        candidates = candidates[np.argpartition(keys[candidates], count - 1)[:count]]
+    return candidates[np.argsort(keys[candidates], kind="stable")]
+
+
+def select_top_bottom_average(values, n: int = 10, avg_count: int = 10):
+    """
+    Selects the positions of the `n` highest values, the `n` lowest values and the
+    `avg_count` values closest to the mean. NaN values are never selected.
+
+    The groups keep the order the plots show them in: highest first for the top group, the
+    lowest group as the tail of a descending sort, and the average group by distance to the mean.
+    A value can be part of more than one group when there are few courses.
+
+    Args:
+        values (array-like): One value per course.
+        n (int): Size of the top and bottom groups.
+        avg_count (int): Size of the average group.
+
+    Returns:
+        tuple: (top positions, bottom positions, average positions, mean of the values)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    candidates = np.flatnonzero(~np.isnan(values))
+    if len(candidates) == 0:
+        empty = candidates[:0]
+        return empty, empty, empty, float("nan")
+
+    mean = float(values[candidates].mean())
+    top = _largest(values, candidates, n)
+    # Lowest values, ordered like the tail of a descending sort
+    bottom = _smallest_by(values, candidates, n)[::-1]
+    average = _smallest_by(np.abs(values - mean), candidates, avg_count)
+    return top, bottom, average, mean
+
+
+def select_frame(df: pd.DataFrame, column: str, n: int = 10, avg_count: int = 10, labels=("Top", "Bottom", "Average")):
+    """
+    Gathers the top, bottom and average rows of `df` by `column` into one frame with a
+    `category` column. When `df` already holds only those rows (with a `row_group` column), the
+    groups are kept as selected by the query and the mean comes from its `{column}_mean` column.
+
+    Args:
+        df (pd.DataFrame): One row per course.
+        column (str): Column the courses are ranked by.
+        n (int): Size of the top and bottom groups.
+        avg_count (int): Size of the average group.
+        labels (tuple): Category names of the top, bottom and average groups.
+
+    Returns:
+        tuple: (selected frame, dict of category -> slice of its rows, mean of `column`)
+    """
+    if ROW_GROUP_COLUMN in df.columns:
+        return _label_preselected_frame(df, column, labels)
+
+    top, bottom, average, mean = select_top_bottom_average(df[column].to_numpy(), n, avg_count)
+    groups = (top, bottom, average)
+
+    selected_df = df.iloc[np.concatenate(groups)]
+    selected_df["category"] = np.repeat(np.asarray(labels, dtype=object), [len(group) for group in groups])
+
+    slices, start = {}, 0
+    for label, group in zip(labels, groups):
+        slices[label] = slice(start, start + len(group))
+        start += len(group)
+    return selected_df, slices, mean
+
+
+def _label_preselected_frame(df: pd.DataFrame, column: str, labels):
+    groups = df[ROW_GROUP_COLUMN].to_numpy()
+    counts = [int(np.count_nonzero(groups == group)) for group in ROW_GROUPS]
+
+    selected_df = df.drop(columns=[ROW_GROUP_COLUMN])
+    selected_df["category"] = np.repeat(np.asarray(labels, dtype=object), counts)
+
+    slices, start = {}, 0
+    for label, count in zip(labels, counts):
+        slices[label] = slice(start, start + count)
+        start += count
+
+    mean_column = f"{column}_mean"
+    mean = float(df[mean_column].iloc[0]) if len(df) and mean_column in df.columns else float(df[column].mean())
+    return selected_df, slices, mean
@@ -0,0 +1,264 @@
+"""
+Client-side semester switching for the static dashboard.
+
+The dashboard of every semester is built in Python and paired model by model with the one
+that is embedded in the page (the base). Properties that differ between semesters (data
+sources, factor ranges, label texts, ...) are turned into Bokeh JSON patches, one per semester.
+A `Select` widget loads the patch of a semester the first time it is chosen and applies it to
+the document, so switching needs no server-side code and the initial page only parses the base
+semester.
+
+The patches are gzip-compressed and by default embedded base64-encoded in the page, decoded
+the first time their semester is selected: the dashboard stays one file that also opens from
+`file://`, at the cost of a page that grows with every semester. With a patch folder they are
+written next to the page instead, one file per semester fetched on first selection, which keeps
+the page (and its parse time) the size of one semester whatever the range, but `fetch` needs
+the page to be served over HTTP.
+"""
+import base64
+import gzip
+import json
+import os
+import re
+
+from bokeh.core.serialization import Serializer
+from bokeh.layouts import column
+from bokeh.model import Model
+from bokeh.models import CustomJS, Select
+
+SWITCH_CALLBACK_CODE = """
+const label = cb_obj.value;
+const doc = cb_obj.document;
+const cache = (window._semesterPatches = window._semesterPatches || {});
+
+async function load(label) {
+    if (!(label in cache)) {
+        let stream;
+        if (label in payloads) {
+            const bytes = Uint8Array.from(atob(payloads[label]), (c) => c.charCodeAt(0));
+            stream = new Blob([bytes]).stream();
+        } else {
+            const response = await fetch(urls[label]);
+            if (!response.ok) {
+                throw new Error(`Could not load ${urls[label]}: ${response.status}`);
+            }
+            stream = response.body;
+        }
+        stream = stream.pipeThrough(new DecompressionStream("gzip"));
+        cache[label] = JSON.parse(await new Response(stream).text());
+    }
+    return cache[label];
+}
+
+load(label).then((patch) => {
+    // Ignore patches that finish loading after another semester was selected
+    if (cb_obj.value === label) {
+        doc.apply_json_patch(patch);
+    }
+});
+"""
+
+
+class StructureMismatch(ValueError):
+    """
+    Raised when the dashboard of a semester does not have the same models as the base one.
+    """
+
+
+def _collect_models(value, models):
+    if isinstance(value, Model):
+        models.append(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_models(item, models)
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            _collect_models(value[key], models)
+
+
+def _child_models(model):
+    children = []
+    for attribute in sorted(model.properties_with_refs()):
+        _collect_models(getattr(model, attribute), children)
+    return children
+
+
+def pair_models(base_root, other_root):
+    """
+    Walks both model graphs in the same deterministic order and pairs their models.
+
+    Returns:
+        list: (base model, other model) tuples.
+
+    Raises:
+        StructureMismatch: If the graphs differ in model types or number of references.
+    """
+    pairs, base_to_other, other_to_base = [], {}, {}
+    stack = [(base_root, other_root)]
+    while stack:
+        base, other = stack.pop()
+        if base.id in base_to_other or other.id in other_to_base:
+            if base_to_other.get(base.id) is not other:
+                raise StructureMismatch(f"{type(base).__name__} {base.id} is shared differently")
+            continue
+        if type(base) is not type(other):
+            raise StructureMismatch(f"{type(base).__name__} paired with {type(other).__name__}")
+        base_to_other[base.id] = other
+        other_to_base[other.id] = base
+        pairs.append((base, other))
+
+        base_children, other_children = _child_models(base), _child_models(other)
+        if len(base_children) != len(other_children):
+            raise StructureMismatch(f"{type(base).__name__} references {len(base_children)} vs {len(other_children)} models")
+        stack.extend(reversed(list(zip(base_children, other_children))))
+    return pairs
+
+
+def _encode(value):
+    return Serializer(deferred=False).encode(value)
+
+
+def _property_values(model) -> dict:
+    """
+    Serializable properties of a model whose current value does not reference other models.
+    Properties holding models are compared through `pair_models` instead.
+    """
+    values = {}
+    for attribute, value in model.properties_with_values(include_defaults=True).items():
+        models = []
+        _collect_models(value, models)
+        if not models:
+            values[attribute] = value
+    return values
+
+
+def check_structure(base_layout, layout):
+    """
+    Raises StructureMismatch unless a patch can turn `base_layout` into `layout`.
+    """
+    for base, other in pair_models(base_layout, layout):
+        if _property_values(base).keys() != _property_values(other).keys():
+            raise StructureMismatch(f"{type(base).__name__} {base.id} holds models in different properties")
+
+
+def build_patches(base_layout, layouts_by_label: dict) -> dict:
+    """
+    Builds, for every label, the Bokeh JSON patch that turns the base layout into that layout.
+
+    Every patch sets all the properties that differ in any semester, so a patch can be
+    applied on top of any other one (including the base semester's, to go back to it).
+
+    Args:
+        base_layout: Layout embedded in the page.
+        layouts_by_label (dict): Label -> layout built the same way for another semester.
+            The base layout itself should be included under its own label.
+
+    Returns:
+        dict: Label -> patch (`{"events": [...]}`).
+    """
+    base_values = {}
+    values_by_label = {}
+    changed = {}
+
+    for label, layout in layouts_by_label.items():
+        values = values_by_label[label] = {}
+        for base, other in pair_models(base_layout, layout):
+            if base.id not in base_values:
+                base_values[base.id] = {attribute: _encode(value) for attribute, value in _property_values(base).items()}
+            other_values = base_values[base.id] if other is base else {
+                attribute: _encode(value) for attribute, value in _property_values(other).items()
+            }
+            if other_values.keys() != base_values[base.id].keys():
+                raise StructureMismatch(f"{type(base).__name__} {base.id} holds models in different properties")
+            for attribute, value in other_values.items():
+                key = (base.id, attribute)
+                values[key] = value
+                if key not in changed and json.dumps(value, sort_keys=True) != json.dumps(base_values[base.id][attribute], sort_keys=True):
+                    changed[key] = True
+
+    return {
+        label: {
+            "events": [
+                {"kind": "ModelChanged", "model": {"id": model_id}, "attr": attribute, "new": values[(model_id, attribute)]}
+                for model_id, attribute in changed
+            ]
+        }
+        for label, values in values_by_label.items()
+    }
+
+
+PATCH_SUFFIX = ".patch.gz"
+
+
+def _gzip_patch(patch: dict) -> bytes:
+    return gzip.compress(json.dumps(patch, separators=(",", ":")).encode(), mtime=0)
+
+
+def compress_patch(patch: dict) -> str:
+    return base64.b64encode(_gzip_patch(patch)).decode("ascii")
+
+
+def get_patch_filename(label: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", label.lower()).strip("_") + PATCH_SUFFIX
+
+
+def write_patch_files(patches: dict, patch_folder: str) -> dict:
+    """
+    Writes every patch gzip-compressed to its own file in `patch_folder`, replacing the patch
+    files of a previous export.
+
+    Returns:
+        dict: Label -> file name.
+    """
+    os.makedirs(patch_folder, exist_ok=True)
+    for name in os.listdir(patch_folder):
+        if name.endswith(PATCH_SUFFIX):
+            os.remove(os.path.join(patch_folder, name))
+
+    filenames = {}
+    for label, patch in patches.items():
+        filenames[label] = get_patch_filename(label)
+        with open(os.path.join(patch_folder, filenames[label]), "wb") as patch_file:
+            patch_file.write(_gzip_patch(patch))
+    return filenames
+
+
+def add_semester_selector(base_layout, base_label: str, layouts_by_label: dict, title: str = "Semestre",
+                          patch_folder: str = None, patch_url: str = None):
+    """
+    Adds a `Select` above `base_layout` that switches the dashboard between the given layouts.
+
+    Layouts whose models do not match the base layout are left out and reported.
+
+    Args:
+        patch_folder (str): Folder the patches are written to, one file per semester fetched
+            when it is first selected. Without it, the patches are embedded in the page.
+        patch_url (str): URL of `patch_folder` as seen from the page, e.g. a path relative to
+            it. Defaults to `patch_folder`.
+
+    Returns:
+        tuple: (new root layout, dict of label -> compressed patch size in bytes)
+    """
+    matching = {}
+    for label, layout in layouts_by_label.items():
+        try:
+            check_structure(base_layout, layout)
+        except StructureMismatch as e:
+            print(f"Leaving {label} out of the semester selector: {e}")
+            continue
+        matching[label] = layout
+    matching[base_label] = base_layout
+
+    patches = build_patches(base_layout, matching)
+    if patch_folder is None:
+        payloads, urls = {label: compress_patch(patch) for label, patch in patches.items()}, {}
+        sizes = {label: len(payload) for label, payload in payloads.items()}
+    else:
+        filenames = write_patch_files(patches, patch_folder)
+        base_url = (patch_url if patch_url is not None else patch_folder).replace(os.sep, "/").rstrip("/")
+        payloads, urls = {}, {label: f"{base_url}/{filename}" for label, filename in filenames.items()}
+        sizes = {label: os.path.getsize(os.path.join(patch_folder, filename)) for label, filename in filenames.items()}
+
+    select = Select(title=title, value=base_label, options=list(matching))
+    select.js_on_change("value", CustomJS(args={"payloads": payloads, "urls": urls}, code=SWITCH_CALLBACK_CODE))
+    return column(select, base_layout), sizes
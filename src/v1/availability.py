@@ -0,0 +1,90 @@
+"""
+Active / inactive course counts for any set of periods, by interval counting.
+
+A course is active in a period when it is available, started before the period ended and did
+not end before the period started. It is inactive when it is not available and ended before
+the period started. For a course whose end is not before its start, "ended before the period
+started" already implies "started before the period ended", so both counts reduce to
+`searchsorted` over the sorted end dates of each group. The (rare) courses whose end is before
+their start are counted directly.
+"""
+import numpy as np
+import pandas as pd
+
+from v1.time_index import NAT, utc_nanoseconds
+
+
+class CourseAvailabilityIndex:
+    """
+    Sorted course end dates per group, built once per courses frame.
+
+    Args:
+        courses_df (pd.DataFrame): Courses with `value.workflow_state`, `value.created_at` (start)
+            and `value.updated_at` (end).
+    """
+
+    def __init__(self, courses_df: pd.DataFrame):
+        start = utc_nanoseconds(courses_df['value.created_at'])
+        end = utc_nanoseconds(courses_df['value.updated_at'])
+        start_known = start != NAT
+        end_known = end != NAT
+        available = (courses_df['value.workflow_state'] == 'available').to_numpy(dtype=bool)
+
+        regular = start_known & ~(end_known & (end < start))
+        # Active: available courses that started before the period ended, minus the ones that ended before it
+        self.available_starts = np.sort(start[regular & available])
+        self.available_ends = np.sort(end[regular & end_known & available])
+        self.unavailable_ends = np.sort(end[regular & end_known & ~available])
+
+        # Ended before they started: compared against every period
+        anomalous = start_known & end_known & (end < start)
+        self.anomalous_start = start[anomalous]
+        self.anomalous_end = end[anomalous]
+        self.anomalous_available = available[anomalous]
+
+    def counts(self, period_starts, period_ends):
+        """
+        Active and inactive courses for each period (inclusive boundaries).
+
+        Args:
+            period_starts (array-like): Start of each period.
+            period_ends (array-like): End of each period, not before its start.
+
+        Returns:
+            tuple: (active counts, inactive counts) as int64 arrays.
+        """
+        starts, ends = utc_nanoseconds(period_starts), utc_nanoseconds(period_ends)
+
+        ended_before = np.searchsorted(self.available_ends, starts, side='left')
+        active = np.searchsorted(self.available_starts, ends, side='right') - ended_before
+        inactive = np.searchsorted(self.unavailable_ends, starts, side='left')
+
+        if len(self.anomalous_start):
+            started = self.anomalous_start[:, None] <= ends[None, :]
+            ended = self.anomalous_end[:, None] < starts[None, :]
+            is_available = self.anomalous_available[:, None]
+            active = active + np.count_nonzero(is_available & started & ~ended, axis=0)
+            inactive = inactive + np.count_nonzero(~is_available & started & ended, axis=0)
+        return active.astype(np.int64), inactive.astype(np.int64)
+
+    def timeline(self, start, end, freq: str = 'MS'):
+        """
+        Active and inactive courses for consecutive periods between `start` and `end`.
+
+        Args:
+            start: First day of the timeline.
+            end: Last day of the timeline.
+            freq (str): Pandas frequency of the period starts, e.g. 'MS' (months), 'W-MON' (weeks), 'D'.
+
+        Returns:
+            pd.DataFrame: One row per period with `period_start`, `period_end`, `active` and `inactive`.
+        """
+        period_starts = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq=freq, tz='UTC')
+        if len(period_starts) == 0:
+            return pd.DataFrame({'period_start': period_starts, 'period_end': period_starts, 'active': [], 'inactive': []})
+        # Each period lasts until the next one starts
+        next_starts = period_starts + pd.tseries.frequencies.to_offset(freq)
+        period_ends = next_starts - pd.Timedelta(1, unit='ns')
+
+        active, inactive = self.counts(period_starts, period_ends)
+        return pd.DataFrame({'period_start': period_starts, 'period_end': period_ends, 'active': active, 'inactive': inactive})
@@ -0,0 +1,93 @@
+"""
+Background computation for the callbacks of the v1 Bokeh server dashboard.
+
+A `Select` callback runs with the document locked on the server's event loop, so pandas work
+done there freezes every session of the server. `BackgroundUpdates.request` instead submits the
+computation to an executor shared by all sessions and waits for it in a `without_document_lock`
+callback. The result is applied to the document in a next-tick callback (with the lock), and only
+if no newer request was made for the same document in the meantime.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from functools import partial
+
+from bokeh.document import without_document_lock
+
+log = logging.getLogger(__name__)
+
+# Threads, not processes: the KPI calculators read the frames in memory, and pandas releases the
+# GIL in most of the work they do
+BACKGROUND_WORKERS = min(4, os.cpu_count() or 1)
+
+# Shared by every session: the module is imported once per server process
+EXECUTOR = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="dashboard-update")
+
+
+class BackgroundUpdates:
+    """
+    Latest-only background updates of one document.
+
+    Args:
+        doc (Document): Document of the session (`curdoc()`).
+        executor (Executor): Where the computations run.
+    """
+
+    def __init__(self, doc, executor=EXECUTOR):
+        self.doc = doc
+        self.executor = executor
+        self.generation = 0
+        self.pending = None
+        self.stats = {"requested": 0, "applied": 0, "cancelled": 0, "superseded": 0, "failed": 0}
+
+    def request(self, compute, apply, on_error=None):
+        """
+        Runs `compute()` in the executor, then `apply(result)` with the document locked.
+        Call it from a document callback; an earlier request that has not been applied yet is
+        cancelled (if it has not started) or its result is discarded.
+
+        Args:
+            compute (callable): Work to do without the document; must not touch Bokeh models.
+            apply (callable): Updates the models with the result.
+            on_error (callable): Called with the exception, with the document locked, when
+                `compute` fails.
+        """
+        self.cancel()
+        self.stats["requested"] += 1
+        generation = self.generation
+        future = self.pending = self.executor.submit(compute)
+
+        @without_document_lock
+        async def wait_for_result():
+            try:
+                result = await asyncio.wrap_future(future)
+            except (CancelledError, asyncio.CancelledError):
+                return
+            except Exception as e:
+                log.exception("Background update failed")
+                if on_error is not None:
+                    self.doc.add_next_tick_callback(partial(self._finish, generation, on_error, e, "failed"))
+                return
+            self.doc.add_next_tick_callback(partial(self._finish, generation, apply, result, "applied"))
+
+        self.doc.add_next_tick_callback(wait_for_result)
+
+    def cancel(self):
+        """
+        Drops the pending request, if any: it is cancelled when it has not started yet and its
+        result is discarded otherwise.
+        """
+        self.generation += 1
+        if self.pending is not None and self.pending.cancel():
+            self.stats["cancelled"] += 1
+        self.pending = None
+
+    def _finish(self, generation, callback, value, outcome):
+        if generation != self.generation:
+            # The selection changed while this one was computed
+            self.stats["superseded"] += 1
+            return
+        self.pending = None
+        self.stats[outcome] += 1
+        callback(value)
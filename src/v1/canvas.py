@@ -1,9 +1,23 @@
 import asyncio
+import json
 import os
+import shutil
+from datetime import timedelta
+
+import pandas as pd
 from dap.api import DAPClient
 from dap.dap_types import Credentials, Format, SnapshotQuery
 from dotenv import load_dotenv
-from utils.constants import NAMESPACE, TABLE_SCHEMAS_PATH, TABLES_FOR_KPIS_IN_CANVAS
+from utils import manifest
+from utils.constants import (
+    CSV_FOLDER_PATH,
+    NAMESPACE,
+    SNAPSHOT_MANIFEST_PATH,
+    SNAPSHOT_MAX_AGE,
+    SNAPSHOTS_PATH,
+    TABLE_SCHEMAS_PATH,
+    TABLES_FOR_KPIS_IN_CANVAS,
+)
 
 # Load environment variables from .env file
 def load_env_vars() -> tuple[str, str, str]:
@@ -108,26 +122,119 @@ async def download_table_data(namespace: str, table: str, output_directory: str,
         )
 
 # Download data for given tables 
-async def download_tables_data(namespace: str, tables: list, output_directory: str, credentials: Credentials = None):
+async def download_tables_data(
+    namespace: str,
+    tables: list,
+    output_directory: str,
+    credentials: Credentials = None,
+    manifest_path: str = SNAPSHOT_MANIFEST_PATH,
+    force: bool = False,
+    max_age: timedelta = SNAPSHOT_MAX_AGE,
+):
     """
     Downloads data for a list of tables in the specified namespace to the output directory.
 
+    Starting a snapshot job costs as much as preparing the whole table, so it is only started
+    when the table's schema version (a metadata request) differs from the downloaded snapshot's,
+    or that snapshot is older than `max_age`. Tables whose snapshot version (schema version and
+    timestamp reported by the job) matches the one recorded in the manifest are then not
+    downloaded again. Each table is saved in its own folder so that `bulk_loader` can map the
+    files to their table.
+
     Args:
         namespace (str): The namespace of the tables.
         tables (List[str]): A list of table names to download data for.
         output_directory (str): The directory to save downloaded data.
         credentials (Credentials, optional): Optional credentials object. Defaults to None.
+        manifest_path (str, optional): Path of the snapshot manifest.
+        force (bool, optional): Download every table even if its snapshot did not change.
+        max_age (timedelta, optional): Age up to which a snapshot with the current schema
+            version is reused without a snapshot job.
+
+    Returns:
+        dict: The updated manifest.
     """
     if credentials is None:
         credentials = create_credentials()
     if tables is None:
-        tables = get_tables(namespace)
+        tables = await get_tables(namespace)
+
     async with DAPClient() as session:
         query = SnapshotQuery(format=Format.JSONL, mode=None)
         for table in tables:
-            await session.download_table_data(
-                namespace=namespace, table=table, query=query, output_directory=output_directory, decompress=True
-            )
+            entry = manifest.get_table_entry(manifest.load_manifest(manifest_path), table)
+            schema = await session.get_table_schema(namespace, table)
+            if not force and manifest.is_recent_snapshot(entry, schema.version, max_age):
+                print(f"Snapshot of '{table}' from {entry['timestamp']} is recent, skipping snapshot job")
+                continue
+
+            # Only runs the snapshot job, objects are not downloaded yet
+            table_data = await session.get_table_data(namespace=namespace, table=table, query=query)
+            if not force and manifest.is_same_version(entry, table_data.schema_version, table_data.timestamp):
+                print(f"Snapshot of '{table}' unchanged since {table_data.timestamp.isoformat()}, skipping download")
+                continue
+
+            directory = os.path.join(output_directory, table, f"job_{table_data.job_id}")
+            downloaded_files = await session.download_objects(table_data.objects, directory, True)
+
+            with manifest.update_manifest(manifest_path) as snapshot_manifest:
+                previous_directories = {
+                    os.path.dirname(path) for path in (manifest.get_table_entry(snapshot_manifest, table) or {}).get("files", [])
+                }
+                entry = manifest.record_snapshot(
+                    snapshot_manifest,
+                    table,
+                    schema_version=table_data.schema_version,
+                    timestamp=table_data.timestamp,
+                    job_id=table_data.job_id,
+                    files=downloaded_files,
+                )
+
+            # Older jobs would be picked up again by the loader and converter
+            for previous_directory in previous_directories - {directory}:
+                shutil.rmtree(previous_directory, ignore_errors=True)
+
+            print(f"Downloaded snapshot of '{table}' ({entry['rows']} rows)")
+
+    return manifest.load_manifest(manifest_path)
+
+
+def convert_table_data_to_csv(
+    table: str,
+    output_directory: str = CSV_FOLDER_PATH,
+    manifest_path: str = SNAPSHOT_MANIFEST_PATH,
+    force: bool = False,
+) -> str:
+    """
+    Flattens the downloaded JSONL snapshot of a table into `<output_directory>/<table>.csv`,
+    with the `key.*`, `value.*` and `meta.*` columns used by the v1 dashboard.
+
+    The conversion is skipped when the snapshot content did not change since the last conversion.
+
+    Returns:
+        str: Path of the CSV file.
+    """
+    output_file = os.path.join(output_directory, f"{table}.csv")
+    snapshot_manifest = manifest.load_manifest(manifest_path)
+    entry = manifest.get_table_entry(snapshot_manifest, table)
+    if entry is None:
+        raise ValueError(f"No snapshot of '{table}' recorded in {manifest_path}")
+
+    if not force and os.path.exists(output_file) and manifest.is_stage_current(snapshot_manifest, table, "converted"):
+        print(f"CSV for '{table}' is up to date, skipping conversion")
+        return output_file
+
+    records = []
+    for path in entry["files"]:
+        with open(path, encoding="utf-8") as snapshot_file:
+            records.extend(json.loads(line) for line in snapshot_file if line.strip())
+    os.makedirs(output_directory, exist_ok=True)
+    pd.json_normalize(records).to_csv(output_file, index=False)
+
+    with manifest.update_manifest(manifest_path) as snapshot_manifest:
+        manifest.mark_stage_done(snapshot_manifest, table, "converted", entry["sha256"])
+    print(f"Converted '{table}' to {output_file}")
+    return output_file
 
 # Example usage:
 if __name__ == "__main__":
@@ -136,4 +243,6 @@ if __name__ == "__main__":
     # asyncio.run(download_all_table_schemas(namespace=NAMESPACE))
     # asyncio.run(get_tables(namespace=NAMESPACE))
     # asyncio.run(download_table_data(namespace=NAMESPACE, table="access_tokens", output_directory=CSV_FOLDER_PATH))
-    asyncio.run(download_tables_data(namespace=NAMESPACE, tables=TABLES_FOR_KPIS_IN_CANVAS, output_directory=os.getcwd()))
\ No newline at end of file
+    asyncio.run(download_tables_data(namespace=NAMESPACE, tables=TABLES_FOR_KPIS_IN_CANVAS, output_directory=SNAPSHOTS_PATH))
+    for table in TABLES_FOR_KPIS_IN_CANVAS:
+        convert_table_data_to_csv(table)
\ No newline at end of file
@@ -6,64 +6,77 @@ from bokeh.plotting import figure, show
 from bokeh.transform import linear_cmap
 from bokeh.palettes import Viridis256
 import pandas as pd
-import numpy as np
 
 from plots import create_average_score_plot
 
-from v1.kpi_calculator import (
-    create_ratio_of_course_availability_and_activity_for_semester,
-    create_student_retention_rate,
-    calculate_tasks_completion_rate,
-    calculate_average_score,
-    calculate_score_distribution, 
-    calculate_feedback_time_vs_assignment_count,
-    calculate_monthly_course_availability,
-    calculate_average_assignment_score,
+from v1.kpi_calculator import calculate_average_assignment_score
+from v1.background import BackgroundUpdates
+from v1.precompute import (
+    SEMESTERS,
+    YEARS,
+    compute_semester_results,
+    get_semester_key,
+    start_warm_up,
 )
-from utils import constants
+from v1.shared_data import get_shared_datasets
 
 
-courses_df = pd.read_csv(constants.COURSES_PATH)
-enrollments_df = pd.read_csv(constants.ENROLLMENTS_PATH)
-assignments_df = pd.read_csv(constants.ASSIGNMENTS_PATH)
-submissions_df =  pd.read_csv(constants.SUBMISSIONS_PATH)
-scores_df = pd.read_csv(constants.SCORES_PATH)
+# Typed, time-indexed datasets loaded once per server process and shared, read-only, by every
+# session (memory-mapped Arrow); a session only holds its own models and selection
+shared_datasets = get_shared_datasets()
+dataset_version = shared_datasets.version
+datasets = shared_datasets.frames
+assignments_df = datasets["assignments"]
+submissions_df = datasets["submissions"]
+
+# Precomputes every year and semester offered, once per server process, from the persisted
+# result store when it is up to date; refreshed in the background when the CSVs change
+start_warm_up()
 
 # Initial plot data for Spring 2024
 year = 2024
 semester = 'Spring'
 AVG_LINE_COLOR = "#FFA07A"
 
-active_count, inactive_count, ratio = create_ratio_of_course_availability_and_activity_for_semester(courses_df, year, semester)
-monthly_data = calculate_monthly_course_availability(courses_df, year, semester)
-retention_rate = create_student_retention_rate(enrollments_df, year, semester)
-completion_rate = calculate_tasks_completion_rate(assignments_df, submissions_df, year, semester)
-avg_score = calculate_average_score(scores_df, year, semester)
-average_scores_df = calculate_average_assignment_score(assignments_df, submissions_df)
+average_scores_df = shared_datasets.derived(
+    'average_assignment_scores', lambda: calculate_average_assignment_score(assignments_df, submissions_df)
+)
+
+# Results of the semesters already shown or precomputed, so selecting one only swaps the source data
+semester_results_cache = shared_datasets.result_cache
+
+
+def get_semester_results(year, semester):
+    return semester_results_cache.get(
+        get_semester_key(year, semester, dataset_version), lambda: compute_semester_results(shared_datasets, year, semester)
+    )
+
 
-# Calculate initial score distribution for the histogram
-scores = calculate_score_distribution(scores_df, year, semester)
-hist, edges = np.histogram(scores, bins=20, range=[0, 100])
+results = get_semester_results(year, semester)
+monthly_data = results['monthly']
+retention_rate = results['retention_rate']
+completion_rate = results['completion_rate']
+avg_score = results['avg_score']
 
 # Data sources for the plots
-course_source = ColumnDataSource(data=dict(categories=['Active', 'Inactive'], counts=[active_count, inactive_count]))
+course_source = ColumnDataSource(data=results['course'])
 
 monthly_course_source = ColumnDataSource(monthly_data)
 
-retention_source = ColumnDataSource(data=dict(start=[0], end=[retention_rate / 100 * 2 * 3.14159], retention=[retention_rate]))
-retention_text_source = ColumnDataSource(data=dict(rate_text=[f"{retention_rate:.1f}%"]))
+retention_source = ColumnDataSource(data=results['retention'])
+retention_text_source = ColumnDataSource(data=results['retention_text'])
 
-completion_source = ColumnDataSource(data=dict(start=[0], end=[completion_rate / 100 * 2 * 3.14159], completion=[completion_rate]))
-completion_text_source = ColumnDataSource(data=dict(rate_text=[f"{completion_rate:.1f}%"]))
+completion_source = ColumnDataSource(data=results['completion'])
+completion_text_source = ColumnDataSource(data=results['completion_text'])
 
-avg_score_source = ColumnDataSource(data=dict(start=[0], end=[avg_score / 100 * 2 * 3.14159], avg_score=[avg_score]))
-avg_score_text_source = ColumnDataSource(data=dict(rate_text=[f"{avg_score:.1f}%"]))
+avg_score_source = ColumnDataSource(data=results['avg_score_arc'])
+avg_score_text_source = ColumnDataSource(data=results['avg_score_text'])
 
-hist_source = ColumnDataSource(data=dict(top=hist, left=edges[:-1], right=edges[1:]))
+hist_source = ColumnDataSource(data=results['hist'])
 
 
 # Create a data source for the average score line
-avg_score_line_source = ColumnDataSource(data=dict(x=[avg_score, avg_score], y=[0, max(hist)]))
+avg_score_line_source = ColumnDataSource(data=results['avg_score_line'])
 
 # Create Course Availability plot
 course_plot = figure(x_range=['Active', 'Inactive'], y_axis_label="Number of courses", height=350, width=700, title="Course Availability", toolbar_location=None)
@@ -116,23 +129,15 @@ histogram_plot.line(
 )
 
 # Optional: Add label to the line
-avg_score_label = Label(x=avg_score, y=max(hist), text=f"Avg Score: {avg_score:.1f}",
+avg_score_label = Label(x=avg_score, y=results['max_hist'], text=f"Avg Score: {avg_score:.1f}",
                         text_align="center", text_baseline="bottom", text_color=AVG_LINE_COLOR)
 histogram_plot.add_layout(avg_score_label)
 
 
 
-# Function to calculate feedback data for scatter plot
-def get_feedback_data(year, semester):
-    data = calculate_feedback_time_vs_assignment_count(submissions_df, year=year, semester=semester)
-    data['average_feedback_time'] = data['average_feedback_time'].clip(upper=1000)
-    data['size'] = (data['assignment_count'] / data['assignment_count'].max() * 40).clip(lower=5)
-    data['course_id'] = data['value.course_id'].astype(str)
-    return data
-
 # Initialize scatter plot data
-feedback_data = get_feedback_data(year, semester)
-feedback_time_source = ColumnDataSource(feedback_data)
+feedback_data = pd.DataFrame(results['feedback_time'])
+feedback_time_source = ColumnDataSource(data=results['feedback_time'])
 
 # Create scatter plot
 color_mapper = LinearColorMapper(palette=Viridis256, low=feedback_data['average_feedback_time'].min(), high=feedback_data['average_feedback_time'].max())
@@ -169,67 +174,87 @@ histogram_plot.add_tools(hover_histogram)
 
 
 # Dropdown widgets for year and semester
-semester_select = Select(title="Semester", value="Spring", options=["Spring", "Summer", "Winter"])
-year_select = Select(title="Year", value="2024", options=[str(x) for x in range(2020, 2025)])
+semester_select = Select(title="Semester", value="Spring", options=SEMESTERS)
+year_select = Select(title="Year", value="2024", options=[str(x) for x in YEARS])
+
+# Loading state of the selection being computed in the background
+status_div = Div(text="", width=300)
+
+# Semesters are computed off the server's event loop; only the latest selection is applied
+background_updates = BackgroundUpdates(curdoc())
 
-def update_monthly_plot(selected_year, selected_semester):
-    updated_data = calculate_monthly_course_availability(courses_df, selected_year, selected_semester)
+def update_monthly_plot(updated_data):
     # Update the ColumnDataSource with the new data
-    monthly_course_source.data = ColumnDataSource.from_df(pd.DataFrame(updated_data))
+    monthly_course_source.data = updated_data
     # Dynamically adjust the x_range based on the new months in the selected semester
     monthly_plot.x_range.factors = updated_data['month']
 
 
-# Update function for all plots
-def update_plots(attr, old, new):
-    selected_year = int(year_select.value)
-    selected_semester = semester_select.value
-
+# Update function for all plots, with the results of the selected semester
+def apply_semester_results(results):
     # Update course availability data
-    active_count, inactive_count, ratio = create_ratio_of_course_availability_and_activity_for_semester(courses_df, selected_year, selected_semester)
-    course_source.data = dict(categories=['Active', 'Inactive'], counts=[active_count, inactive_count])
+    course_source.data = results['course']
 
     # Update student retention rate data
-    retention_rate = create_student_retention_rate(enrollments_df, selected_year, selected_semester)
-    retention_source.data = dict(start=[0], end=[retention_rate / 100 * 2 * 3.14159], retention=[retention_rate])
-    retention_text_source.data = dict(rate_text=[f"{retention_rate:.1f}%"])
+    retention_source.data = results['retention']
+    retention_text_source.data = results['retention_text']
 
     # Update monthly availability plot 
-    update_monthly_plot(selected_year, selected_semester)
+    update_monthly_plot(results['monthly'])
+    monthly_plot.title.text = f"Monthly Course Availability for {results['semester']} {results['year']}"
 
     # Update assignment completion rate data
-    completion_rate = calculate_tasks_completion_rate(assignments_df, submissions_df, selected_year, selected_semester)
     completion_rate_div.text = f"""
     <div style="text-align: center;">
-        <h1 style="font-size: 72px; color: #4CAF50;">{completion_rate:.1f}%</h1>
+        <h1 style="font-size: 72px; color: #4CAF50;">{results['completion_rate']:.1f}%</h1>
         <p style="font-size: 24px;">Overall Course Completion Rate</p>
     </div>
     """
 
-    retention_rate = create_student_retention_rate(enrollments_df, selected_year, selected_semester)
     retention_rate_div.text = f"""
     <div style="text-align: center;">
-        <h1 style="font-size: 72px; color: #4CAF50;">{retention_rate:.1f}%</h1>
+        <h1 style="font-size: 72px; color: #4CAF50;">{results['retention_rate']:.1f}%</h1>
         <p style="font-size: 24px;">Overall student's retention rate</p>
     </div>
     """
 
     # Update feedback time
-    feedback_time = get_feedback_data(selected_year, selected_semester)
-    feedback_time_source.data = ColumnDataSource.from_df(feedback_time)
+    feedback_time_source.data = results['feedback_time']
 
     # Update score distribution histogram
-    scores = calculate_score_distribution(scores_df, selected_year, selected_semester)
-    hist, edges = np.histogram(scores, bins=20, range=[0, 100])
-    hist_source.data = dict(top=hist, left=edges[:-1], right=edges[1:])
+    hist_source.data = results['hist']
 
     # Recalculate average score
-    avg_score = calculate_average_score(scores_df, selected_year, selected_semester)
-    avg_score_line_source.data = dict(x=[avg_score, avg_score], y=[0, max(hist)])
+    avg_score = results['avg_score']
+    avg_score_line_source.data = results['avg_score_line']
     avg_score_label.x = avg_score
-    avg_score_label.y = max(hist)
+    avg_score_label.y = results['max_hist']
     avg_score_label.text = f"Avg Score: {avg_score:.1f}"
 
+    status_div.text = ""
+
+
+def show_update_error(error):
+    status_div.text = f'<span style="color: #B22222;">Could not load the semester: {error}</span>'
+
+
+def update_plots(attr, old, new):
+    selected_year = int(year_select.value)
+    selected_semester = semester_select.value
+
+    # Semesters already shown are applied right away, others are computed in the background
+    results = semester_results_cache.cached(get_semester_key(selected_year, selected_semester, dataset_version))
+    if results is not None:
+        background_updates.cancel()
+        apply_semester_results(results)
+        return
+
+    status_div.text = f"<i>Loading {selected_semester} {selected_year}…</i>"
+    background_updates.request(
+        lambda: get_semester_results(selected_year, selected_semester),
+        apply_semester_results,
+        on_error=show_update_error,
+    )
 
 
 # Add callback for dropdowns
@@ -238,7 +263,7 @@ year_select.on_change('value', update_plots)
 
 # Layout for the dashboard with plot labels
 dashboard_layout = column(
-    row(year_select, semester_select, sizing_mode='stretch_width'),
+    row(year_select, semester_select, status_div, sizing_mode='stretch_width'),
     row(
         monthly_plot,
         horizontal_spacer,
@@ -0,0 +1,137 @@
+"""
+Typed loader for the DAP CSV exports used by the v1 pandas dashboard.
+
+Each dataset reads only the columns the KPI calculators use, with explicit dtypes: ids as
+nullable integers, `workflow_state` as a categorical and timestamps parsed once, as UTC. The
+parsed frame is cached as Feather next to its CSV (`<name>.csv.<spec hash>.feather`) and the
+cache is used while its mtime matches the CSV's. Without pyarrow the CSV is parsed every time.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from utils import constants
+
+# Dataset name -> CSV path, column dtypes and timestamp columns (parsed as UTC)
+DATASETS = {
+    "courses": {
+        "path": constants.COURSES_PATH,
+        "dtypes": {"key.id": "Int64", "value.workflow_state": "category"},
+        "timestamps": ["value.created_at", "value.updated_at"],
+    },
+    "enrollments": {
+        "path": constants.ENROLLMENTS_PATH,
+        "dtypes": {"key.id": "Int64", "value.course_id": "Int64", "value.workflow_state": "category"},
+        "timestamps": ["value.created_at", "value.updated_at"],
+    },
+    "assignments": {
+        "path": constants.ASSIGNMENTS_PATH,
+        "dtypes": {"key.id": "Int64", "value.context_id": "Int64"},
+        "timestamps": ["value.created_at"],
+    },
+    "submissions": {
+        "path": constants.SUBMISSIONS_PATH,
+        "dtypes": {
+            "value.assignment_id": "Int64",
+            "value.course_id": "Int64",
+            "value.score": "float64",
+            "value.workflow_state": "category",
+        },
+        "timestamps": ["value.created_at", "value.updated_at", "value.submitted_at"],
+    },
+    "scores": {
+        "path": constants.SCORES_PATH,
+        "dtypes": {
+            "value.enrollment_id": "Int64",
+            "value.current_score": "float64",
+            "value.final_score": "float64",
+            "value.workflow_state": "category",
+        },
+        "timestamps": ["value.created_at", "value.updated_at"],
+    },
+}
+
+
+def _spec_hash(spec: dict) -> str:
+    return hashlib.sha256(json.dumps([spec["dtypes"], spec["timestamps"]], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def get_cache_path(name: str, csv_path: str = None) -> str:
+    spec = DATASETS[name]
+    return f"{csv_path or spec['path']}.{_spec_hash(spec)}.feather"
+
+
+def read_dataset_csv(name: str, csv_path: str = None) -> pd.DataFrame:
+    """
+    Parses the CSV of a dataset: only its columns, with its dtypes and UTC timestamps.
+    """
+    spec = DATASETS[name]
+    df = pd.read_csv(
+        csv_path or spec["path"],
+        usecols=[*spec["dtypes"], *spec["timestamps"]],
+        dtype=spec["dtypes"],
+    )
+    for column in spec["timestamps"]:
+        df[column] = pd.to_datetime(df[column], utc=True, errors="coerce", format="ISO8601")
+    return df
+
+
+def load_dataset(name: str, csv_path: str = None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Loads a dataset from its Feather cache when it is up to date, otherwise from the CSV
+    (refreshing the cache).
+
+    Args:
+        name (str): Key of `DATASETS`.
+        csv_path (str): CSV to read instead of the configured one.
+        use_cache (bool): Read and write the Feather cache.
+
+    Returns:
+        pd.DataFrame: The typed dataset. Callers must not modify it in place.
+    """
+    csv_path = csv_path or DATASETS[name]["path"]
+    cache_path = get_cache_path(name, csv_path)
+    csv_mtime = os.stat(csv_path).st_mtime_ns
+
+    if use_cache and os.path.exists(cache_path) and os.stat(cache_path).st_mtime_ns == csv_mtime:
+        try:
+            return pd.read_feather(cache_path)
+        except ImportError:
+            use_cache = False
+
+    df = read_dataset_csv(name, csv_path)
+    if use_cache:
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            df.to_feather(tmp_path)
+        except ImportError:
+            # pyarrow is not installed: no cache
+            return df
+        # The cache carries the mtime of the CSV it was built from
+        os.utime(tmp_path, ns=(csv_mtime, csv_mtime))
+        os.replace(tmp_path, cache_path)
+    return df
+
+
+def get_dataset_version(names=None) -> str:
+    """
+    Identifies the current contents of the datasets (all of them by default), from the size and
+    mtime of their CSVs and the column specs. It changes whenever a CSV is exported again.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(names or DATASETS):
+        csv_stat = os.stat(DATASETS[name]["path"])
+        digest.update(f"{name}:{csv_stat.st_size}:{csv_stat.st_mtime_ns}:{_spec_hash(DATASETS[name])};".encode())
+    return digest.hexdigest()[:12]
+
+
+def load_datasets(names=None, use_cache: bool = True) -> dict:
+    """
+    Loads several datasets (all of them by default).
+
+    Returns:
+        dict: Dataset name -> DataFrame.
+    """
+    return {name: load_dataset(name, use_cache=use_cache) for name in (names or DATASETS)}
@@ -0,0 +1,161 @@
+"""
+Rows of a frame grouped by one integer key column, for joins by position.
+
+A `KeyIndex` sorts the keys of a column once (rows without a key are left out) and keeps, for
+each sorted key, the position of its row in the frame. The rows of a set of keys are then two
+`searchsorted` calls and a gather of positions, and the inner join of two indexed columns is a
+pair of position arrays (`join_positions`): the KPI calculators gather the columns they need by
+those positions instead of hashing both sides with `pd.merge` on every call.
+
+`get_key_index` keeps one index per (frame, column) for as long as the frame is alive, like
+`v1.time_index.get_time_index`. The indexed frames must not be modified in place.
+"""
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# (id of the frame, column) -> (weak reference to the frame, KeyIndex)
+_indexes = {}
+
+
+def join_keys(series: pd.Series):
+    """
+    Keys of a join column as int64, and the mask of the rows that have one.
+    """
+    valid = series.notna().to_numpy()
+    return series.to_numpy(dtype=np.int64, na_value=0), valid
+
+
+def ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    The concatenation of `arange(start, start + count)` for every start and count.
+    """
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+class KeyIndex:
+    """
+    The keys of an integer column, sorted, with the positions of their rows.
+
+    Args:
+        df (pd.DataFrame): Rows to index; only the positions of its rows are kept.
+        column (str): Integer key column (missing keys are left out).
+
+    Attributes:
+        keys (np.ndarray): Sorted int64 keys.
+        positions (np.ndarray): Position in `df` of the row of each key; rows with the same key
+            keep their order.
+    """
+
+    def __init__(self, df: pd.DataFrame, column: str):
+        keys, valid = join_keys(df[column])
+        rows = np.flatnonzero(valid)
+        order = np.argsort(keys[rows], kind='stable')
+        self.column = column
+        self.keys = keys[rows][order]
+        self.positions = rows[order]
+
+    @classmethod
+    def from_arrays(cls, column: str, keys: np.ndarray, positions: np.ndarray) -> "KeyIndex":
+        """
+        An index from the `keys` and `positions` of another one (e.g. memory-mapped), without a copy.
+        """
+        index = cls.__new__(cls)
+        index.column = column
+        index.keys = keys
+        index.positions = positions
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def ranges(self, keys: np.ndarray):
+        """
+        Where each of `keys` is in the index.
+
+        Returns:
+            tuple: (starts, counts) such that `positions[starts[i]:starts[i] + counts[i]]` are the
+                rows of `keys[i]` (none when its count is 0).
+        """
+        # Sorted lookups walk the index once instead of jumping around it
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        starts, counts = np.empty(len(keys), dtype=np.intp), np.empty(len(keys), dtype=np.intp)
+        starts[order] = np.searchsorted(self.keys, sorted_keys, side='left')
+        counts[order] = np.searchsorted(self.keys, sorted_keys, side='right') - starts[order]
+        return starts, counts
+
+    def rows(self, keys: np.ndarray):
+        """
+        Rows of each of `keys`.
+
+        Returns:
+            tuple: (key positions, row positions): `keys[i]` has the row at `positions[j]` for
+                every pair (i, j), grouped by `i` in the order of `keys`.
+        """
+        starts, counts = self.ranges(keys)
+        return np.repeat(np.arange(len(keys)), counts), self.positions[ranges(starts, counts)]
+
+
+def join_positions(left: KeyIndex, right: KeyIndex):
+    """
+    The inner join of two indexed columns, as the positions of the matching rows of each frame.
+
+    Returns:
+        tuple: (left positions, right positions) of every pair of rows with equal keys, by key.
+    """
+    # Runs of equal keys on the left, looked up once per distinct key on the right
+    run_starts = np.flatnonzero(np.r_[True, left.keys[1:] != left.keys[:-1]]) if len(left) else np.empty(0, dtype=np.intp)
+    run_counts = np.diff(np.r_[run_starts, len(left)])
+    right_starts, right_counts = right.ranges(left.keys[run_starts])
+    matched = right_counts > 0
+
+    if np.all(right_counts[matched] == 1):
+        # One row per key on the right (e.g. a primary key): each matched left row pairs with it
+        left_positions = left.positions[np.repeat(matched, run_counts)]
+        right_positions = np.repeat(right.positions[right_starts[matched]], run_counts[matched])
+        return left_positions, right_positions
+
+    # Every left row of a run pairs with every right row of its key
+    run_starts, run_counts = run_starts[matched], run_counts[matched]
+    right_starts, right_counts = right_starts[matched], right_counts[matched]
+    pairs = np.repeat(right_counts, run_counts)
+    left_positions = left.positions[np.repeat(ranges(run_starts, run_counts), pairs)]
+    right_positions = right.positions[ranges(np.repeat(right_starts, run_counts), pairs)]
+    return left_positions, right_positions
+
+
+def get_key_index(df: pd.DataFrame, column: str) -> KeyIndex:
+    """
+    The `KeyIndex` of `df` by `column`, built on first use and kept while `df` is alive.
+    """
+    entry = _indexes.get((id(df), column))
+    if entry is None or entry[0]() is not df:
+        return register_key_index(df, KeyIndex(df, column))
+    return entry[1]
+
+
+def register_key_index(df: pd.DataFrame, index: KeyIndex) -> KeyIndex:
+    """
+    Makes `get_key_index(df, index.column)` return `index`, e.g. one built with `KeyIndex.from_arrays`.
+    """
+    key = (id(df), index.column)
+    reference = weakref.ref(df, lambda _, key=key: _indexes.pop(key, None))
+    _indexes[key] = (reference, index)
+    return index
+
+
+def build_key_indexes(frames: dict, columns: dict):
+    """
+    Builds the key indexes up front, e.g. when the datasets are loaded.
+
+    Args:
+        frames (dict): Dataset name -> DataFrame.
+        columns (dict): Dataset name -> key columns to index.
+    """
+    for name, names in columns.items():
+        if name in frames:
+            for column in names:
+                get_key_index(frames[name], column)
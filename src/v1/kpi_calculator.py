@@ -1,27 +1,56 @@
 from utils.helpers import get_semester_dates
+from v1.availability import CourseAvailabilityIndex
+from v1.key_index import get_key_index, join_keys, join_positions
+from v1.out_of_core import JOIN_MEMORY_BUDGET, KeyPartitions, estimate_join_memory, iter_chunks, partition_count
+from v1.time_index import get_time_index
+import numpy as np
 import pandas as pd
 
+# Timestamp columns the calculators slice by, per dataset (see `v1.time_index.build_time_indexes`)
+TIME_INDEX_COLUMNS = {
+    'enrollments': ['value.created_at', 'value.updated_at'],
+    'assignments': ['value.created_at'],
+    'submissions': ['value.created_at', 'value.submitted_at'],
+    'scores': ['value.created_at', 'value.updated_at'],
+}
+
+# Integer key columns the calculators join on, per dataset (see `v1.key_index.build_key_indexes`)
+KEY_INDEX_COLUMNS = {
+    'assignments': ['key.id'],
+    'submissions': ['value.assignment_id'],
+    'scores': ['value.enrollment_id'],
+}
+
+
+def _timestamps(series, utc=True, errors='raise'):
+    """
+    Timestamps of a column, parsed only when it was not already loaded as datetimes (see `v1.datasets`).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, utc=utc, errors=errors)
+
 
 def create_ratio_of_course_availability_and_activity_for_semester(courses_df, year, semester):
     start_semester, end_semester = get_semester_dates(year, semester)
 
-    # Convert course dates to UTC
-    courses_df['start_at'] =  pd.to_datetime(courses_df['value.created_at'], utc=True)
-    courses_df['end_at'] = pd.to_datetime(courses_df['value.updated_at'], utc=True)
+    # Course dates in UTC
+    start_at = _timestamps(courses_df['value.created_at'])
+    end_at = _timestamps(courses_df['value.updated_at'])
 
     # Filter active courses within the semester
     active_courses = courses_df[
         (courses_df['value.workflow_state'] == 'available') &
-        (courses_df['start_at'] <= end_semester) &
-        ((courses_df['end_at'] >= start_semester) | courses_df['end_at'].isna())
+        (start_at <= end_semester) &
+        ((end_at >= start_semester) | end_at.isna())
     ]
 
     # Filter inactive courses within the semester
     inactive_courses = courses_df[
         (courses_df['value.workflow_state'] != 'available') &
-        (courses_df['start_at'] <= end_semester) &
-        (courses_df['end_at'] < start_semester) & 
-        courses_df['end_at'].notna()  # Ensure the course has ended
+        (start_at <= end_semester) &
+        (end_at < start_semester) & 
+        end_at.notna()  # Ensure the course has ended
     ]
 
     # Calculate counts
@@ -38,7 +67,7 @@ def create_ratio_of_course_availability_and_activity_for_semester(courses_df, ye
 
 
 
-def calculate_monthly_course_availability(courses_df, year, semester):
+def calculate_monthly_course_availability(courses_df, year, semester, availability_index=None):
     """
     Calculates the monthly counts of active and inactive courses for a given semester.
 
@@ -46,15 +75,14 @@ def calculate_monthly_course_availability(courses_df, year, semester):
         courses_df (pd.DataFrame): DataFrame containing course information.
         year (int): Year of the semester.
         semester (str): Semester name ('spring', 'summer', or 'winter').
+        availability_index (CourseAvailabilityIndex): Index of `courses_df` built beforehand, to
+            reuse it across semesters.
 
     Returns:
         dict: Dictionary with months as keys and two lists, 'active' and 'inactive', containing monthly counts.
     """
-    start_semester, end_semester = get_semester_dates(year, semester)
-
-    # Convert course dates to UTC
-    courses_df['start_at'] = pd.to_datetime(courses_df['value.created_at'], utc=True)
-    courses_df['end_at'] = pd.to_datetime(courses_df['value.updated_at'], utc=True)
+    if availability_index is None:
+        availability_index = CourseAvailabilityIndex(courses_df)
 
     # Define months based on semester
     if semester.lower() == 'spring':
@@ -64,52 +92,33 @@ def calculate_monthly_course_availability(courses_df, year, semester):
     elif semester.lower() == 'winter':
         months = ['August', 'September', 'October', 'November', 'December']
 
-    active_counts = []
-    inactive_counts = []
-
-    # Calculate active and inactive course counts for each month
-    for month in months:
-        month_start = pd.Timestamp(f"{year}-{month}-01", tz='UTC')
-        month_end = month_start + pd.offsets.MonthEnd(1)
-
-        # Active courses for the month
-        active_courses = courses_df[
-            (courses_df['value.workflow_state'] == 'available') &
-            (courses_df['start_at'] <= month_end) &
-            ((courses_df['end_at'] >= month_start) | courses_df['end_at'].isna())
-        ]
+    month_starts = pd.DatetimeIndex([pd.Timestamp(f"{year}-{month}-01", tz='UTC') for month in months])
+    month_ends = month_starts + pd.offsets.MonthEnd(1)
+    active_counts, inactive_counts = availability_index.counts(month_starts, month_ends)
 
-        # Inactive courses for the month
-        inactive_courses = courses_df[
-            (courses_df['value.workflow_state'] != 'available') &
-            (courses_df['start_at'] <= month_end) &
-            (courses_df['end_at'] < month_start) &
-            courses_df['end_at'].notna()
-        ]
+    return {'month': months, 'active': active_counts.tolist(), 'inactive': inactive_counts.tolist()}
 
-        active_counts.append(active_courses.shape[0])
-        inactive_counts.append(inactive_courses.shape[0])
 
-    return {'month': months, 'active': active_counts, 'inactive': inactive_counts}
+def calculate_course_availability_timeline(courses_df, start, end, freq='W-MON', availability_index=None):
+    """
+    Active and inactive courses per period (weeks by default) between `start` and `end`.
+    See `CourseAvailabilityIndex.timeline`.
+    """
+    if availability_index is None:
+        availability_index = CourseAvailabilityIndex(courses_df)
+    return availability_index.timeline(start, end, freq)
 
 
 def create_student_retention_rate(enrollments_df, year, semester):
     start_semester, end_semester = get_semester_dates(year, semester)
 
-    enrollments_df['created_at'] = pd.to_datetime(enrollments_df['value.created_at'], utc=True)
-    enrollments_df['updated_at'] = pd.to_datetime(enrollments_df['value.updated_at'],  utc=True)
-    
     # Step 1: Initial Enrollment (students active at the start of the semester)
-    initial_enrollment = enrollments_df[
-        (enrollments_df['created_at'] <= start_semester) & 
-        (enrollments_df['value.workflow_state'] == 'available')  
-    ].shape[0]
+    created_before = get_time_index(enrollments_df, 'value.created_at').between(end=start_semester, columns=['value.workflow_state'])
+    initial_enrollment = int((created_before['value.workflow_state'] == 'available').sum())
 
     # Step 2: Final Enrollment (students still active at the end of the semester)
-    final_enrollment = enrollments_df[
-        (enrollments_df['updated_at'] >= end_semester) & 
-        (enrollments_df['value.workflow_state'] == 'available')
-    ].shape[0]
+    updated_after = get_time_index(enrollments_df, 'value.updated_at').between(start=end_semester, columns=['value.workflow_state'])
+    final_enrollment = int((updated_after['value.workflow_state'] == 'available').sum())
 
     # Step 3: Calculate the Retention Rate
     if initial_enrollment > 0:
@@ -123,21 +132,14 @@ def create_student_retention_rate(enrollments_df, year, semester):
 def calculate_tasks_completion_rate(assignments_df, submissions_df, year, semester):
     start_semester, end_semester = get_semester_dates(year, semester)
 
-    assignments_df['created_at'] = pd.to_datetime(assignments_df['value.created_at'], utc=True)
-    submissions_df['submitted_at'] = pd.to_datetime(submissions_df['value.submitted_at'], utc=True)
-
     # Filter assignments within the semester
-    assignments_in_semester = assignments_df[
-        (assignments_df['created_at'] >= start_semester) &
-        (assignments_df['created_at'] <= end_semester)
-    ]
+    assignments_in_semester = get_time_index(assignments_df, 'value.created_at').between(start_semester, end_semester, columns=['key.id'])
 
     # Filter submissions within the semester
-    submissions_in_semester = submissions_df[
-        (submissions_df['submitted_at'] >= start_semester) &
-        (submissions_df['submitted_at'] <= end_semester) &
-        (submissions_df['value.workflow_state'] == 'graded')
-    ]
+    submitted = get_time_index(submissions_df, 'value.submitted_at').between(
+        start_semester, end_semester, columns=['value.workflow_state', 'value.assignment_id']
+    )
+    submissions_in_semester = submitted[submitted['value.workflow_state'] == 'graded']
 
     # Calculate total number of assignments assigned in the semester
     total_assignments = assignments_in_semester['key.id'].nunique()
@@ -155,13 +157,10 @@ def calculate_tasks_completion_rate(assignments_df, submissions_df, year, semest
 def calculate_average_score(scores_df, year, semester):
     start_semester, end_semester = get_semester_dates(year, semester)
 
-    scores_df['value.updated_at'] = pd.to_datetime(scores_df['value.updated_at'])
-
-    filtered_scores = scores_df[
-        (scores_df['value.updated_at'] >= start_semester) & 
-        (scores_df['value.updated_at'] <= end_semester) & 
-        (scores_df['value.workflow_state'] == 'active')  # Consider only active scores
-    ]
+    updated = get_time_index(scores_df, 'value.updated_at').between(
+        start_semester, end_semester, columns=['value.workflow_state', 'value.current_score']
+    )
+    filtered_scores = updated[updated['value.workflow_state'] == 'active']  # Consider only active scores
 
     if filtered_scores.empty:
         return 0.0
@@ -171,17 +170,14 @@ def calculate_average_score(scores_df, year, semester):
 
 
 def calculate_score_distribution(scores_df, year, semester):
-
-    scores_df['value.created_at'] = pd.to_datetime(scores_df['value.created_at'], errors='coerce')
-    scores_df['value.updated_at'] = pd.to_datetime(scores_df['value.updated_at'], errors='coerce')
-    scores_df = scores_df.dropna(subset=['value.created_at'])
-
     start_date, end_date = get_semester_dates(year, semester)
 
-    filtered_scores = scores_df[
-        (scores_df['value.created_at'] <= end_date) &   
-        ((scores_df['value.updated_at'] >= start_date) |
-         (scores_df['value.updated_at'].isna()))  
+    # Rows without a creation date never match the first condition
+    created = get_time_index(scores_df, 'value.created_at').between(end=end_date, columns=['value.updated_at', 'value.final_score'])
+    updated_at = _timestamps(created['value.updated_at'], errors='coerce')
+    filtered_scores = created[
+        (updated_at >= start_date) |
+        (updated_at.isna())
     ]
 
     scores = filtered_scores['value.final_score'].dropna()
@@ -189,23 +185,22 @@ def calculate_score_distribution(scores_df, year, semester):
     return scores
 
 def calculate_feedback_time_vs_assignment_count(submissions_df, year, semester):
-    # Convert dates to datetime
-    submissions_df['value.created_at'] = pd.to_datetime(submissions_df['value.created_at'], utc=True)
-    submissions_df['value.updated_at'] = pd.to_datetime(submissions_df['value.updated_at'], utc=True)
-
     # Get semester start and end dates
     start_date, end_date = get_semester_dates(year, semester)
 
     # Filter submissions by semester
-    filtered_submissions = submissions_df[
-        (submissions_df['value.created_at'] >= start_date) & 
-        (submissions_df['value.created_at'] <= end_date)
-    ]
+    in_semester = get_time_index(submissions_df, 'value.created_at').between(
+        start_date, end_date, columns=['value.course_id', 'value.created_at', 'value.updated_at']
+    )
+
+    # Dates as datetimes
+    created_at = _timestamps(in_semester['value.created_at'])
+    updated_at = _timestamps(in_semester['value.updated_at'])
 
     # Calculate feedback time in hours
-    filtered_submissions['feedback_time'] = (
-        filtered_submissions['value.updated_at'] - filtered_submissions['value.created_at']
-    ).dt.total_seconds() / 3600
+    filtered_submissions = in_semester[['value.course_id']].assign(
+        feedback_time=(updated_at - created_at).dt.total_seconds() / 3600
+    )
 
     # Remove rows with NaN feedback times
     filtered_submissions = filtered_submissions.dropna(subset=['feedback_time'])
@@ -231,41 +226,43 @@ def courses_with_high_failing_enrollments(
     year,
     semester,
     failing_threshold=60,
-    fail_count_threshold=10  
+    fail_count_threshold=10,
+    memory_budget=JOIN_MEMORY_BUDGET,
 ):
-    # Convert dates to datetime
-    enrollments_df['value.created_at'] = pd.to_datetime(enrollments_df['value.created_at'], utc=True)
-    scores_df['value.created_at'] = pd.to_datetime(scores_df['value.created_at'], utc=True)
-    
+    """
+    Enrollments of a semester with at least `fail_count_threshold` failing scores.
 
+    The scores of the enrollments are gathered by position through the key index of their
+    enrollment ids (see `v1.key_index`), or, when that join is expected to use more than
+    `memory_budget` bytes (None: no limit), by partitions of enrollment ids spilled to disk (see
+    `v1.out_of_core`).
+    """
     # Get semester dates
     start_date, end_date = get_semester_dates(year, semester)
-    semester_start = pd.to_datetime(start_date)
-    semester_end = pd.to_datetime(end_date)
-    
+
     # Filter enrollments during the semester
-    semester_enrollments = enrollments_df[
-        (enrollments_df['value.created_at'] >= semester_start) &
-        (enrollments_df['value.created_at'] <= semester_end) &
-        (enrollments_df['value.workflow_state'] == 'available')
-    ]
-    # Merge enrollments with scores
-    merged_df = semester_enrollments.merge(
-        scores_df[['value.enrollment_id', 'value.final_score']],
-        left_on='key.id',  # Enrollment ID in enrollments_df
-        right_on='value.enrollment_id',  # Enrollment ID in scores_df
-        how='left'
+    created = get_time_index(enrollments_df, 'value.created_at').between(start_date, end_date, columns=['key.id', 'value.workflow_state'])
+    semester_enrollments = created[created['value.workflow_state'] == 'available']
+
+    partitions = partition_count(
+        estimate_join_memory((semester_enrollments, ['key.id']), (scores_df, ['value.enrollment_id', 'value.final_score'])),
+        memory_budget,
     )
+    if partitions > 1:
+        failing_counts = _failing_counts_by_partitions(semester_enrollments, scores_df, failing_threshold, partitions, memory_budget)
+    else:
+        # Scores of each enrollment, gathered by position from the index of their enrollment ids
+        enrollment_ids, has_id = join_keys(semester_enrollments['key.id'])
+        enrollment_ids = enrollment_ids[has_id]
+        enrollments, rows = get_key_index(scores_df, 'value.enrollment_id').rows(enrollment_ids)
+        final_scores = scores_df['value.final_score'].iloc[rows].to_numpy(dtype='float64', na_value=np.nan)
 
-    # Identify failing enrollments
-    failing_enrollments = merged_df[
-        (merged_df['value.final_score'] < failing_threshold) |
-        (merged_df['value.final_score'].isnull())  # Assuming null scores are failing
-    ]
+        # Identify failing enrollments
+        failing = (final_scores < failing_threshold) | np.isnan(final_scores)  # Assuming null scores are failing
+
+        # Count failing enrollments per course
+        failing_counts = _failing_counts_frame(*np.unique(enrollment_ids[enrollments[failing]], return_counts=True), scores_df)
 
-    # Count failing enrollments per course
-    failing_counts = failing_enrollments.groupby('value.enrollment_id').size().reset_index(name='failing_enrollments')
-    
     # Identify courses exceeding the failing enrollment threshold
     flagged_courses = failing_counts[
         failing_counts['failing_enrollments'] >= fail_count_threshold
@@ -274,34 +271,106 @@ def courses_with_high_failing_enrollments(
     return flagged_courses
 
 
+def _failing_counts_by_partitions(semester_enrollments, scores_df, failing_threshold, partitions, memory_budget):
+    # Scores are partitioned by enrollment id: the counts of each partition are final
+    enrollment_ids, has_id = join_keys(semester_enrollments['key.id'])
+    enrollment_ids = enrollment_ids[has_id]
+
+    counts = []
+    with KeyPartitions(partitions, {'value.final_score': 'float64'}, memory_budget // 2) as scores:
+        for chunk in iter_chunks(scores_df):
+            keys, has_key = join_keys(chunk['value.enrollment_id'])
+            final_scores = chunk['value.final_score'].to_numpy(dtype='float64', na_value=np.nan)
+            scores.add(keys[has_key], {'value.final_score': final_scores[has_key]})
+
+        for i in range(partitions):
+            partition = scores.partition(i)
+            # Enrollments without scores have no enrollment id to count by: an inner join is enough
+            merged_df = pd.DataFrame({'key': enrollment_ids[enrollment_ids % partitions == i]}).merge(partition, on='key')
+            failing_enrollments = merged_df[
+                (merged_df['value.final_score'] < failing_threshold) | merged_df['value.final_score'].isnull()
+            ]
+            counts.append(failing_enrollments.groupby('key').size())
+
+    counts = pd.concat(counts).sort_index()
+    return _failing_counts_frame(counts.index.to_numpy(), counts.to_numpy(), scores_df)
+
+
+def _failing_counts_frame(enrollment_ids, counts, scores_df):
+    failing_counts = pd.DataFrame({'value.enrollment_id': enrollment_ids, 'failing_enrollments': counts})
+    # Ids keep the dtype of the scores column when it is a nullable one (see `v1.datasets`)
+    if isinstance(scores_df['value.enrollment_id'].dtype, pd.api.extensions.ExtensionDtype):
+        failing_counts['value.enrollment_id'] = failing_counts['value.enrollment_id'].astype(scores_df['value.enrollment_id'].dtype)
+    return failing_counts
 
-def calculate_average_assignment_score(assignments_df, submissions_df):
+
+def calculate_average_assignment_score(assignments_df, submissions_df, memory_budget=JOIN_MEMORY_BUDGET):
     """
     Calculates the average assignment score per course.
     
-    Handles NaN values by excluding them from the calculation.
+    Handles NaN values by excluding them from the calculation. Submissions and assignments are
+    paired by position through the key indexes of their ids (see `v1.key_index`), or, when that
+    join is expected to use more than `memory_budget` bytes (None: no limit), by partitions of
+    assignment ids spilled to disk (see `v1.out_of_core`).
     """
-    # Ensure correct data types
-    assignments_df['key.id'] = assignments_df['key.id'].astype(int)
-    assignments_df['value.context_id'] = assignments_df['value.context_id'].astype(int)
-    submissions_df['value.assignment_id'] = submissions_df['value.assignment_id'].astype(int)
-    submissions_df['value.score'] = pd.to_numeric(submissions_df['value.score'], errors='coerce')
-    
-    # Merge DataFrames on assignment IDs
-    merged_df = pd.merge(
-        submissions_df,
-        assignments_df[['key.id', 'value.context_id']],
-        left_on='value.assignment_id',
-        right_on='key.id',
-        how='inner'
+    partitions = partition_count(
+        estimate_join_memory((assignments_df, ['key.id', 'value.context_id']), (submissions_df, ['value.assignment_id', 'value.score'])),
+        memory_budget,
     )
-    
-    # Drop rows with NaN scores
-    merged_df = merged_df.dropna(subset=['value.score'])
-    
-    # Calculate average score per course
-    average_scores = merged_df.groupby('value.context_id')['value.score'].mean().reset_index()
+    if partitions > 1:
+        average_scores = _average_assignment_score_by_partitions(assignments_df, submissions_df, partitions, memory_budget)
+    else:
+        # Submissions paired with their assignments by position, from the indexes of both id columns
+        submission_rows, assignment_rows = join_positions(
+            get_key_index(submissions_df, 'value.assignment_id'), get_key_index(assignments_df, 'key.id')
+        )
+        scores = pd.to_numeric(submissions_df['value.score'].iloc[submission_rows], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        # Courses numbered once per assignment, so the submissions are grouped by gathered course numbers
+        assignment_context_ids, has_context = join_keys(assignments_df['value.context_id'])
+        context_ids, numbers = np.unique(assignment_context_ids[has_context], return_inverse=True)
+        course_numbers = np.full(len(assignments_df), -1, dtype=np.intp)
+        course_numbers[has_context] = numbers
+        course_numbers = course_numbers[assignment_rows]
+
+        # Drop rows with NaN scores, and those of assignments without a course
+        has_score = ~np.isnan(scores) & (course_numbers >= 0)
+        scores, course_numbers = scores[has_score], course_numbers[has_score]
+
+        # Calculate average score per course
+        counts = np.bincount(course_numbers, minlength=len(context_ids))
+        sums = np.bincount(course_numbers, weights=scores, minlength=len(context_ids))
+        has_submissions = counts > 0
+        average_scores = pd.DataFrame({
+            'value.context_id': context_ids[has_submissions],
+            'value.score': sums[has_submissions] / counts[has_submissions],
+        })
+
     average_scores['value.context_id'] = average_scores['value.context_id'].astype(str)
     average_scores.rename(columns={'value.context_id': 'course_id'}, inplace=True)
     
-    return average_scores
\ No newline at end of file
+    return average_scores
+
+
+def _average_assignment_score_by_partitions(assignments_df, submissions_df, partitions, memory_budget):
+    # Submissions are partitioned by assignment id; each partition adds up the scores of its courses
+    assignment_ids, has_id = join_keys(assignments_df['key.id'])
+    context_ids, has_context = join_keys(assignments_df['value.context_id'])
+    # Assignments without an id match no submission and those without a course count for none
+    assignment_ids, context_ids = assignment_ids[has_id & has_context], context_ids[has_id & has_context]
+
+    partials = []
+    with KeyPartitions(partitions, {'value.score': 'float64'}, memory_budget // 2) as submissions:
+        for chunk in iter_chunks(submissions_df):
+            keys, has_key = join_keys(chunk['value.assignment_id'])
+            scores = pd.to_numeric(chunk['value.score'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            has_score = has_key & ~np.isnan(scores)
+            submissions.add(keys[has_score], {'value.score': scores[has_score]})
+
+        for i in range(partitions):
+            in_partition = assignment_ids % partitions == i
+            assignments = pd.DataFrame({'key': assignment_ids[in_partition], 'value.context_id': context_ids[in_partition]})
+            merged_df = submissions.partition(i).merge(assignments, on='key')
+            partials.append(merged_df.groupby('value.context_id')['value.score'].agg(['sum', 'count']))
+
+    totals = pd.concat(partials).groupby(level=0).sum()
+    return (totals['sum'] / totals['count']).rename('value.score').reset_index()
@@ -0,0 +1,160 @@
+"""
+Out-of-core execution of the joins of the v1 KPI calculators.
+
+`calculate_average_assignment_score` joins every submission with its assignment and
+`courses_with_high_failing_enrollments` every score with its enrollment. In memory, the casts, the
+merge and its filtered copies hold several copies of the whole large side at once. When the
+estimated memory of such a join exceeds a budget, the calculators run it by partitions instead:
+
+- the large side is read in chunks of CHUNK_ROWS rows, each chunk cast on its own;
+- its rows are hash-partitioned by join key (key modulo the number of partitions) into
+  `KeyPartitions`, which spills its buffers to disk (one raw file per partition and column)
+  whenever they hold more than half the budget;
+- each partition is read back and joined with the rows of the small side that have its keys, and
+  the calculators combine the partial aggregates (sums and counts, or counts of disjoint keys).
+
+The rows of a key always land in the same partition, so every partition joins completely. Peak
+memory is then about the buffers plus the join of one partition, whatever the number of rows.
+"""
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Bytes a calculator may use for one join before it runs by partitions
+JOIN_MEMORY_BUDGET = 1 << 30
+CHUNK_ROWS = 1_000_000
+# Copies of each joined column alive at once in memory: the cast, the hash tables and output of
+# the merge, the filtered rows (a pandas merge measured at about 5 times its key and value columns)
+JOIN_COPIES = 5
+
+
+def estimate_join_memory(*sides) -> int:
+    """
+    Bytes an in-memory join is expected to use.
+
+    Args:
+        sides: (DataFrame, columns) of each side, with the columns the join uses.
+    """
+    return sum(len(df) * len(columns) * 8 * JOIN_COPIES for df, columns in sides)
+
+
+def partition_count(memory: int, memory_budget) -> int:
+    """
+    Partitions a join of `memory` bytes is split into: 1 (in memory) when it fits `memory_budget`
+    (None never splits), otherwise enough for one partition to fit half of it.
+    """
+    if memory_budget is None or memory <= memory_budget:
+        return 1
+    return math.ceil(2 * memory / memory_budget)
+
+
+def iter_chunks(df: pd.DataFrame, rows: int = CHUNK_ROWS):
+    """
+    Consecutive slices of `df` of at most `rows` rows (views, not copies).
+    """
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+
+class KeyPartitions:
+    """
+    Rows split into partitions by an int64 key, buffered in memory and spilled to disk once the
+    buffers hold more than `memory_budget` bytes. Each partition is read once, in the order its
+    rows were added.
+
+    Args:
+        partitions (int): Number of partitions.
+        dtypes (dict): Column name -> numpy dtype of the columns stored with the keys.
+        memory_budget (int): Buffered bytes that trigger a spill; None never spills.
+        spill_folder (str): Folder of the spill files (in a temporary subfolder removed by
+            `close`), the system's temporary folder by default.
+    """
+
+    def __init__(self, partitions: int, dtypes: dict, memory_budget: int = None, spill_folder: str = None):
+        self.partitions = partitions
+        self.dtypes = {"key": np.dtype(np.int64), **{name: np.dtype(dtype) for name, dtype in dtypes.items()}}
+        self.memory_budget = memory_budget
+        self.spill_folder = spill_folder
+        self.buffers = [[] for _ in range(partitions)]
+        self.buffered_bytes = 0
+        self.spilled = [False] * partitions
+        self.stats = {"rows": 0, "spills": 0, "spilled_bytes": 0}
+        self._folder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, keys: np.ndarray, columns: dict):
+        """
+        Adds rows: their join keys and their columns (name -> array of the same length).
+        """
+        columns = {"key": keys, **columns}
+        if self.partitions == 1:
+            pieces = {0: columns}
+        else:
+            partition = np.remainder(keys, self.partitions)
+            order = np.argsort(partition, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(partition, minlength=self.partitions))])
+            pieces = {
+                i: {name: values[order[bounds[i]:bounds[i + 1]]] for name, values in columns.items()}
+                for i in range(self.partitions) if bounds[i + 1] > bounds[i]
+            }
+
+        for i, piece in pieces.items():
+            self.buffers[i].append({name: np.asarray(piece[name], dtype=dtype) for name, dtype in self.dtypes.items()})
+            self.buffered_bytes += sum(values.nbytes for values in self.buffers[i][-1].values())
+        self.stats["rows"] += len(keys)
+        if self.memory_budget is not None and self.buffered_bytes > self.memory_budget:
+            self._spill()
+
+    def _path(self, partition: int, column: int) -> str:
+        return os.path.join(self._folder, f"{partition}.{column}.bin")
+
+    def _spill(self):
+        if self._folder is None:
+            self._folder = tempfile.mkdtemp(prefix="v1-join-", dir=self.spill_folder)
+        for i, buffer in enumerate(self.buffers):
+            if not buffer:
+                continue
+            for column, name in enumerate(self.dtypes):
+                with open(self._path(i, column), "ab") as spill_file:
+                    for piece in buffer:
+                        piece[name].tofile(spill_file)
+            self.spilled[i] = True
+            buffer.clear()
+        self.stats["spills"] += 1
+        self.stats["spilled_bytes"] += self.buffered_bytes
+        self.buffered_bytes = 0
+
+    def partition(self, i: int) -> pd.DataFrame:
+        """
+        The rows of partition `i`, with a 'key' column; its buffers are released.
+        """
+        pieces = []
+        if self.spilled[i]:
+            pieces.append({
+                name: np.fromfile(self._path(i, column), dtype=dtype)
+                for column, (name, dtype) in enumerate(self.dtypes.items())
+            })
+        pieces.extend(self.buffers[i])
+        self.buffered_bytes -= sum(values.nbytes for piece in self.buffers[i] for values in piece.values())
+        self.buffers[i] = []
+
+        return pd.DataFrame({
+            name: np.concatenate([piece[name] for piece in pieces]) if pieces else np.empty(0, dtype=dtype)
+            for name, dtype in self.dtypes.items()
+        })
+
+    def close(self):
+        if self._folder is not None:
+            shutil.rmtree(self._folder, ignore_errors=True)
+            self._folder = None
+        self.buffers = [[] for _ in range(self.partitions)]
+        self.buffered_bytes = 0
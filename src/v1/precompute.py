@@ -0,0 +1,284 @@
+"""
+Per-semester results of the v1 dashboard: computed, precomputed at startup and persisted.
+
+`compute_semester_results` computes everything the dashboard shows for one semester, as the
+column data of its sources. `warm_up` fills the shared result cache (see `v1.shared_data`) with
+the results of every year and semester offered, from the result store of the current dataset
+version (a pickle in RESULT_STORE_PATH) or, when there is none yet, by computing them in a
+process pool and storing them. The store survives restarts, so a restarted server is warm at
+once. Its file name also carries a fingerprint of the code the results are computed with
+(`RESULT_CODE`), so results of an older calculator are never loaded. `start_warm_up` runs the warm-up once per process in a background thread, which then
+checks the dataset version every REFRESH_SECONDS and warms the new version up when a CSV changes.
+
+Precompute the store before starting the server (from `src/`):
+    python -m v1.precompute
+"""
+import functools
+import hashlib
+import importlib
+import inspect
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+from utils import constants
+from v1.availability import CourseAvailabilityIndex
+from v1.datasets import DATASETS, get_dataset_version
+from v1.kpi_calculator import (
+    create_ratio_of_course_availability_and_activity_for_semester,
+    create_student_retention_rate,
+    calculate_tasks_completion_rate,
+    calculate_average_score,
+    calculate_score_distribution,
+    calculate_feedback_time_vs_assignment_count,
+    calculate_monthly_course_availability,
+)
+from v1.shared_data import get_shared_datasets
+
+log = logging.getLogger(__name__)
+
+# Years and semesters offered by the dashboard
+YEARS = list(range(2020, 2025))
+SEMESTERS = ["Spring", "Summer", "Winter"]
+
+# Modules and functions of this module the results are computed with: their source is part of
+# the store file name (see `get_result_code_fingerprint`)
+RESULT_CODE = (
+    "v1.kpi_calculator",
+    "v1.availability",
+    "v1.time_index",
+    "v1.key_index",
+    "v1.out_of_core",
+    "compute_semester_results",
+    "get_feedback_data",
+)
+PRECOMPUTE_WORKERS = min(4, os.cpu_count() or 1)
+REFRESH_SECONDS = 60
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_result_code_fingerprint() -> str:
+    """
+    Hash of the source of `RESULT_CODE`, computed once per process.
+    """
+    digest = hashlib.sha256()
+    for name in RESULT_CODE:
+        code = importlib.import_module(name) if "." in name else globals()[name]
+        digest.update(f"\n{name}\n{inspect.getsource(code)}".encode())
+    return digest.hexdigest()[:12]
+
+
+def get_semester_key(year, semester, version):
+    return (year, semester, version)
+
+
+def get_course_availability_index(shared_datasets):
+    # Course end dates are sorted once and reused for every semester, by every session
+    return shared_datasets.derived(
+        'course_availability_index', lambda: CourseAvailabilityIndex(shared_datasets.frames["courses"])
+    )
+
+
+def get_feedback_data(submissions_df, year, semester):
+    data = calculate_feedback_time_vs_assignment_count(submissions_df, year=year, semester=semester)
+    data['average_feedback_time'] = data['average_feedback_time'].clip(upper=1000)
+    data['size'] = (data['assignment_count'] / data['assignment_count'].max() * 40).clip(lower=5)
+    data['course_id'] = data['value.course_id'].astype(str)
+    return data
+
+
+def compute_semester_results(shared_datasets, year, semester):
+    """
+    Every KPI of a semester and the column data of the sources that show them.
+    """
+    frames = shared_datasets.frames
+    courses_df, enrollments_df, scores_df = frames["courses"], frames["enrollments"], frames["scores"]
+    assignments_df, submissions_df = frames["assignments"], frames["submissions"]
+
+    active_count, inactive_count, ratio = create_ratio_of_course_availability_and_activity_for_semester(courses_df, year, semester)
+    monthly_data = calculate_monthly_course_availability(
+        courses_df, year, semester, availability_index=get_course_availability_index(shared_datasets)
+    )
+    retention_rate = create_student_retention_rate(enrollments_df, year, semester)
+    completion_rate = calculate_tasks_completion_rate(assignments_df, submissions_df, year, semester)
+    avg_score = calculate_average_score(scores_df, year, semester)
+
+    # Score distribution for the histogram
+    scores = calculate_score_distribution(scores_df, year, semester)
+    hist, edges = np.histogram(scores, bins=20, range=[0, 100])
+
+    feedback_data = get_feedback_data(submissions_df, year, semester)
+    return {
+        'year': year,
+        'semester': semester,
+        'completion_rate': completion_rate,
+        'retention_rate': retention_rate,
+        'avg_score': avg_score,
+        'max_hist': max(hist),
+        'course': dict(categories=['Active', 'Inactive'], counts=[active_count, inactive_count]),
+        'monthly': monthly_data,
+        'retention': dict(start=[0], end=[retention_rate / 100 * 2 * 3.14159], retention=[retention_rate]),
+        'retention_text': dict(rate_text=[f"{retention_rate:.1f}%"]),
+        'completion': dict(start=[0], end=[completion_rate / 100 * 2 * 3.14159], completion=[completion_rate]),
+        'completion_text': dict(rate_text=[f"{completion_rate:.1f}%"]),
+        'avg_score_arc': dict(start=[0], end=[avg_score / 100 * 2 * 3.14159], avg_score=[avg_score]),
+        'avg_score_text': dict(rate_text=[f"{avg_score:.1f}%"]),
+        'hist': dict(top=hist, left=edges[:-1], right=edges[1:]),
+        'avg_score_line': dict(x=[avg_score, avg_score], y=[0, max(hist)]),
+        'feedback_time': ColumnDataSource.from_df(feedback_data),
+    }
+
+
+def _init_worker(dataset_paths):
+    # Spawned workers import the modules afresh: they read the CSVs of the calling process, not the defaults
+    for name, path in dataset_paths.items():
+        DATASETS[name]["path"] = path
+
+
+def _compute_in_worker(year, semester, names, folder):
+    # The worker maps the same shared export as the calling process (see `v1.shared_data`)
+    shared_datasets = get_shared_datasets(names, folder=folder)
+    return shared_datasets.version, compute_semester_results(shared_datasets, year, semester)
+
+
+def precompute_results(shared_datasets, combinations, workers: int = PRECOMPUTE_WORKERS) -> dict:
+    """
+    Results of several (year, semester) combinations, computed in a process pool. The workers
+    are given the CSV paths and the export folder of `shared_datasets`, so they map the same
+    export whatever the defaults of their freshly imported modules.
+
+    Args:
+        shared_datasets (SharedDatasets): Datasets of the version to compute.
+        combinations (list): (year, semester) tuples.
+        workers (int): Worker processes; 1 computes in the calling process.
+
+    Returns:
+        dict: (year, semester) -> results. Combinations computed by a worker that saw another
+            dataset version (a CSV changed meanwhile) are left out.
+    """
+    if workers <= 1:
+        return {(year, semester): compute_semester_results(shared_datasets, year, semester) for year, semester in combinations}
+
+    results = {}
+    names = sorted(shared_datasets.frames)
+    dataset_paths = {name: DATASETS[name]["path"] for name in names}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(dataset_paths,)) as executor:
+        futures = {
+            combination: executor.submit(_compute_in_worker, *combination, names, shared_datasets.folder)
+            for combination in combinations
+        }
+        for combination, future in futures.items():
+            version, semester_results = future.result()
+            if version == shared_datasets.version:
+                results[combination] = semester_results
+    return results
+
+
+class ResultStore:
+    """
+    Results of every offered semester for one dataset version, persisted as a pickle.
+
+    Args:
+        folder (str): Folder of the stores, RESULT_STORE_PATH by default; one file per dataset
+            version and code fingerprint, older ones are removed.
+    """
+
+    def __init__(self, folder: str = None):
+        self.folder = folder or constants.RESULT_STORE_PATH
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.folder, f"semester_results.{version}.{get_result_code_fingerprint()}.pkl")
+
+    def load(self, version: str) -> dict:
+        """
+        Returns:
+            dict: (year, semester) -> results, empty when nothing is stored for `version`.
+        """
+        try:
+            with open(self.path(version), "rb") as store_file:
+                return pickle.load(store_file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Discarding unreadable result store {self.path(version)}: {e}")
+            return {}
+
+    def save(self, version: str, results: dict):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as store_file:
+            pickle.dump(results, store_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        for entry in os.listdir(self.folder):
+            if entry.startswith("semester_results.") and entry.endswith(".pkl") and os.path.join(self.folder, entry) != path:
+                os.remove(os.path.join(self.folder, entry))
+
+
+def warm_up(shared_datasets, store: ResultStore = None, workers: int = PRECOMPUTE_WORKERS) -> dict:
+    """
+    Puts the results of every offered semester in the shared result cache: from the store when
+    it has them, otherwise computed (and stored).
+
+    Returns:
+        dict: Counts of the results 'loaded' from the store and 'computed'.
+    """
+    store = store or ResultStore()
+    version = shared_datasets.version
+    combinations = [(year, semester) for year in YEARS for semester in SEMESTERS]
+
+    stored = store.load(version)
+    missing = [combination for combination in combinations if combination not in stored]
+    computed = precompute_results(shared_datasets, missing, workers) if missing else {}
+    if computed:
+        store.save(version, {**stored, **computed})
+
+    for (year, semester), results in {**stored, **computed}.items():
+        shared_datasets.result_cache.put(get_semester_key(year, semester, version), results)
+    log.info("Warm-up of dataset version %s: %d results loaded, %d computed", version, len(stored), len(computed))
+    return {"loaded": len(stored), "computed": len(computed)}
+
+
+def _warm_up_and_refresh(store, workers, refresh_seconds):
+    version = None
+    while True:
+        try:
+            if get_dataset_version() != version:
+                # A new version is exported and mapped by get_shared_datasets; new sessions use it
+                shared_datasets = get_shared_datasets()
+                warm_up(shared_datasets, store, workers)
+                version = shared_datasets.version
+        except Exception:
+            log.exception("Warm-up of the dashboard results failed")
+        time.sleep(refresh_seconds)
+
+
+def start_warm_up(store: ResultStore = None, workers: int = PRECOMPUTE_WORKERS, refresh_seconds: float = REFRESH_SECONDS):
+    """
+    Starts the warm-up and refresh thread of this process, if it is not running yet.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(
+                target=_warm_up_and_refresh, args=(store or ResultStore(), workers, refresh_seconds),
+                name="dashboard-warm-up", daemon=True,
+            )
+            _warm_up_thread.start()
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    counts = warm_up(get_shared_datasets())
+    print(f"{counts['loaded']} results loaded and {counts['computed']} computed in {time.perf_counter() - start:.1f}s")
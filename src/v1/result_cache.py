@@ -0,0 +1,104 @@
+"""
+Bounded LRU cache of the per-semester results of the v1 dashboard.
+
+Entries are keyed by (year, semester, dataset version) and hold everything an update of the
+dashboard needs: the KPI values and the column data of every source, histograms included. A
+semester that was already shown is then only a matter of assigning `ColumnDataSource.data`.
+Cached values are shared between updates and must not be modified.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = 16
+
+
+class ResultCache:
+    """
+    Least recently used results, computed on a miss.
+
+    Args:
+        max_entries (int): Entries kept; the least recently used one is dropped beyond that.
+        name (str): Name of the cache in the log.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, name: str = "Semester results"):
+        self.max_entries = max_entries
+        self.name = name
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "compute_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute):
+        """
+        The cached value of `key`, or `compute()` stored under it.
+
+        Args:
+            key (tuple): Hashable key, e.g. (year, semester, dataset version).
+            compute (callable): Builds the value on a miss.
+
+        Returns:
+            The value of `key`.
+        """
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self._log(key, "hit")
+                return self.entries[key]
+
+        start = time.perf_counter()
+        value = compute()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["compute_seconds"] += elapsed
+        self.put(key, value)
+        with self._lock:
+            self._log(key, f"miss ({elapsed:.2f}s)")
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a value computed elsewhere (e.g. precomputed), as the most recently used entry.
+        """
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def cached(self, key):
+        """
+        The value of `key` when it is cached (counted as a hit), otherwise None. Nothing is computed.
+        """
+        with self._lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            self._log(key, "hit")
+            return self.entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def _log(self, key, status: str):
+        log.info(
+            "%s cache: %s %s; %d hits, %d misses (%.0f%% hit rate), %d/%d entries, %d evicted",
+            self.name, key, status, self.stats["hits"], self.stats["misses"], 100 * self.hit_rate(),
+            len(self.entries), self.max_entries, self.stats["evictions"],
+        )
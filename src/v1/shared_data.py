@@ -0,0 +1,370 @@
+"""
+Datasets of the v1 dashboard shared by all its sessions, and by all the server processes.
+
+Bokeh runs `v1/dashboard.py` once per session, but imported modules live for the whole server
+process: `get_shared_datasets` loads the datasets once per process and dataset version, and
+every session gets the same read-only frames, time and key indexes, derived objects and result
+cache.
+
+The frames are memory-mapped from uncompressed Arrow IPC files (`SHARED_DATA_PATH/<export key>/`)
+whose columns are stored in the physical layout pandas uses: timestamps as int64 ticks (NaT as
+the int64 minimum), categoricals as codes plus categories, nullable integers as values plus a
+mask. Every column is then a zero-copy view of the mapped file, so the rows live in the page
+cache once, whatever the number of sessions or server processes (`bokeh serve --num-procs`).
+The sorted timestamps and row positions the KPI calculators slice by (see `v1.time_index`) and
+the sorted keys and row positions they join by (see `v1.key_index`) are stored and mapped the
+same way.
+
+Timestamps of mapped frames are naive datetimes in UTC: a tz-aware column cannot wrap the
+mapped ticks without a copy. The calculators compare them the same way. Without pyarrow the
+datasets are loaded into memory once per process instead.
+
+A new export removes the exports of older CSVs, except those a process is still mapping: it
+holds a shared lock on the export's lock file while it maps it (files already mapped stay valid
+once removed). Without `fcntl` (not on POSIX) older exports are kept.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from utils import constants
+from v1.datasets import DATASETS, get_dataset_version, load_dataset
+from v1.key_index import KeyIndex, build_key_indexes, register_key_index
+from v1.kpi_calculator import KEY_INDEX_COLUMNS, TIME_INDEX_COLUMNS
+from v1.result_cache import ResultCache
+from v1.time_index import NAT, TimeIndex, build_time_indexes, register_time_index
+
+# Part of the folder name: bump it when the file layout changes
+SHARED_FORMAT = 4
+METADATA_KEY = b"v1.shared_data"
+MASK_SUFFIX = "#mask"
+EXPORT_INFO_FILE = "export.json"
+LOCK_FILE = "export.lock"
+
+_current = None
+_lock = threading.Lock()
+
+
+class SharedDatasets:
+    """
+    The datasets of one version, with what the sessions derive from them.
+
+    Attributes:
+        version (str): Dataset version (see `v1.datasets.get_dataset_version`).
+        frames (dict): Dataset name -> read-only DataFrame.
+        result_cache (ResultCache): Per-semester results, shared by the sessions.
+        mapped (bool): Whether the frames are memory-mapped.
+        folder (str): Folder of the memory-mapped exports they were mapped from, if any.
+    """
+
+    def __init__(self, version: str, frames: dict, mapped: bool, folder: str = None):
+        self.version = version
+        self.frames = frames
+        self.mapped = mapped
+        self.folder = folder
+        self.result_cache = ResultCache()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name: str, build):
+        """
+        An object built from the frames (an index, a KPI frame, ...), built by the first session
+        that asks for it. It must not be modified.
+        """
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build()
+            return self._derived[name]
+
+
+def _encode_frame(df: pd.DataFrame):
+    """
+    The columns of `df` as Arrow arrays in the layout of their pandas dtype, and how to rebuild them.
+    """
+    import pyarrow as pa
+
+    arrays, names, columns = [], [], []
+    for column in df.columns:
+        series = df[column]
+        spec = {"name": column}
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            index = pd.DatetimeIndex(series)
+            # asi8 is UTC for tz-aware columns; naive columns are taken as UTC
+            spec.update(kind="timestamp", unit=index.unit)
+            values = index.asi8
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            spec.update(kind="category", categories=series.cat.categories.tolist())
+            values = series.cat.codes.to_numpy()
+        elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(series.dtype):
+            spec.update(kind="nullable", dtype=str(series.dtype))
+            values = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            arrays.append(pa.array(series.isna().to_numpy().view(np.uint8)))
+            names.append(f"{column}{MASK_SUFFIX}")
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind == "b":
+            # Arrow packs booleans into bits: stored as bytes instead
+            spec.update(kind="bool")
+            values = series.to_numpy().view(np.uint8)
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in "iuf":
+            spec.update(kind="numpy")
+            values = series.to_numpy()
+        else:
+            # Strings and others: converted (copied) when mapped
+            spec.update(kind="arrow")
+            values = series
+        arrays.append(pa.array(values))
+        names.append(column)
+        columns.append(spec)
+    return pa.Table.from_arrays(arrays, names=names, metadata={METADATA_KEY: json.dumps(columns).encode()})
+
+
+def write_shared_frame(df: pd.DataFrame, path: str):
+    """
+    Writes `df` as an uncompressed Arrow IPC file that `map_shared_frame` can map without copies.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    table = _encode_frame(df)
+    with pa.OSFile(path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def map_shared_frame(path: str) -> pd.DataFrame:
+    """
+    A read-only DataFrame whose columns are views of the memory-mapped file at `path`.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+    columns = {}
+    for spec in json.loads(table.schema.metadata[METADATA_KEY]):
+        name = spec["name"]
+        if spec["kind"] == "arrow":
+            columns[name] = table.column(name).to_pandas()
+            continue
+        values = _column_values(table, name)
+        if spec["kind"] == "timestamp":
+            columns[name] = values.view(f"M8[{spec['unit']}]")
+        elif spec["kind"] == "category":
+            columns[name] = pd.Categorical.from_codes(values, categories=spec["categories"])
+        elif spec["kind"] == "nullable":
+            mask = _column_values(table, f"{name}{MASK_SUFFIX}").view(bool)
+            columns[name] = pd.arrays.IntegerArray(values, mask, copy=False)
+        elif spec["kind"] == "bool":
+            columns[name] = values.view(bool)
+        else:
+            columns[name] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def _column_values(table, name: str) -> np.ndarray:
+    chunks = table.column(name).chunks
+    if len(chunks) != 1:
+        # Written as a single record batch; only an empty table has no chunk
+        return table.column(name).to_numpy()
+    return chunks[0].to_numpy(zero_copy_only=True)
+
+
+def _time_file(name: str, column: str) -> str:
+    return f"{name}.time.{column}.arrow"
+
+
+def _key_file(name: str, column: str) -> str:
+    return f"{name}.key.{column}.arrow"
+
+
+def get_shared_folder(version: str, names, index_columns: dict, key_columns: dict, folder: str) -> str:
+    key = [version, sorted(names), index_columns, key_columns, SHARED_FORMAT]
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(folder, digest)
+
+
+def get_data_mtime(names) -> int:
+    """
+    Modification time (ns) of the newest CSV of `names`: exports of older CSVs are outdated.
+    """
+    return max(os.stat(DATASETS[name]["path"]).st_mtime_ns for name in names)
+
+
+def _lock_export(target: str, exclusive: bool):
+    """
+    Opens the lock file of the export in `target` and locks it: shared while a process maps the
+    export, exclusive (without waiting) to remove it.
+
+    Returns:
+        The open lock file (closing it releases the lock), or None when `exclusive` and the
+        export is in use.
+
+    Raises:
+        FileNotFoundError: If the export was removed.
+    """
+    lock_file = open(os.path.join(target, LOCK_FILE), "rb")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _remove_outdated_exports(target: str, data_mtime: int):
+    """
+    Removes the exports next to `target` made from older CSVs, unless a process is mapping them.
+    """
+    if fcntl is None:
+        return
+    folder = os.path.dirname(target)
+    for entry in os.listdir(folder):
+        path = os.path.join(folder, entry)
+        if path == target or not os.path.isdir(path) or entry.endswith(".tmp"):
+            continue
+        try:
+            with open(os.path.join(path, EXPORT_INFO_FILE), encoding="utf-8") as info_file:
+                outdated = json.load(info_file)["data_mtime_ns"] < data_mtime
+        except (OSError, ValueError, KeyError):
+            # Exports of an earlier format
+            outdated = True
+        if not outdated:
+            continue
+        try:
+            lock_file = _lock_export(path, exclusive=True)
+        except FileNotFoundError:
+            continue
+        if lock_file is None:
+            continue
+        with lock_file:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def export_shared_datasets(target: str, names, index_columns: dict, key_columns: dict):
+    """
+    Writes every dataset and the arrays of the time indexes of its timestamp columns and of the
+    key indexes of its key columns, into `target`. The files
+    are written in a temporary folder that is renamed at the end, so processes starting at the
+    same time never map a partial export; the first rename wins. Exports of older CSVs are then
+    removed (see the module docstring).
+    """
+    data_mtime = get_data_mtime(names)
+    tmp_folder = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp_folder, exist_ok=True)
+    try:
+        for name in names:
+            df = load_dataset(name)
+            write_shared_frame(df, os.path.join(tmp_folder, f"{name}.arrow"))
+            for column in index_columns.get(name, []):
+                index = TimeIndex(df, column)
+                # Rows without a timestamp have no key: padded with NaT, which sorts them last
+                keys = np.concatenate([index.keys, np.full(len(index.positions) - len(index.keys), NAT)])
+                write_shared_frame(
+                    pd.DataFrame({"key": keys, "position": index.positions}), os.path.join(tmp_folder, _time_file(name, column))
+                )
+            for column in key_columns.get(name, []):
+                index = KeyIndex(df, column)
+                write_shared_frame(
+                    pd.DataFrame({"key": index.keys, "position": index.positions}), os.path.join(tmp_folder, _key_file(name, column))
+                )
+        with open(os.path.join(tmp_folder, EXPORT_INFO_FILE), "w", encoding="utf-8") as info_file:
+            json.dump({"names": sorted(names), "data_mtime_ns": data_mtime}, info_file)
+        open(os.path.join(tmp_folder, LOCK_FILE), "wb").close()
+        os.rename(tmp_folder, target)
+    except OSError:
+        if not os.path.isdir(target):
+            raise
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+
+    _remove_outdated_exports(target, data_mtime)
+
+
+def map_shared_datasets(target: str, names, index_columns: dict, key_columns: dict) -> dict:
+    """
+    Maps the datasets exported in `target` and registers their time and key indexes.
+    """
+    frames = {}
+    for name in names:
+        df = frames[name] = map_shared_frame(os.path.join(target, f"{name}.arrow"))
+        for column in index_columns.get(name, []):
+            arrays = map_shared_frame(os.path.join(target, _time_file(name, column)))
+            keys = arrays["key"].to_numpy()
+            register_time_index(
+                df, TimeIndex.from_arrays(df, column, keys[:np.count_nonzero(keys != NAT)], arrays["position"].to_numpy())
+            )
+        for column in key_columns.get(name, []):
+            arrays = map_shared_frame(os.path.join(target, _key_file(name, column)))
+            register_key_index(df, KeyIndex.from_arrays(column, arrays["key"].to_numpy(), arrays["position"].to_numpy()))
+    return frames
+
+
+def get_shared_datasets(names=None, index_columns: dict = None, key_columns: dict = None, folder: str = None) -> SharedDatasets:
+    """
+    The datasets of the current version, loaded (or mapped) once per process.
+
+    Args:
+        names (list): Datasets to load, all of them by default.
+        index_columns (dict): Dataset name -> timestamp columns to index, by default the ones
+            the KPI calculators use.
+        key_columns (dict): Dataset name -> key columns to index, by default the ones the KPI
+            calculators join on.
+        folder (str): Folder of the memory-mapped exports, SHARED_DATA_PATH by default.
+
+    Returns:
+        SharedDatasets
+    """
+    global _current
+    names = sorted(names or DATASETS)
+    index_columns = TIME_INDEX_COLUMNS if index_columns is None else index_columns
+    key_columns = KEY_INDEX_COLUMNS if key_columns is None else key_columns
+    folder = folder or constants.SHARED_DATA_PATH
+    version = get_dataset_version(names)
+
+    def is_current():
+        return _current is not None and _current.version == version and sorted(_current.frames) == names
+
+    with _lock:
+        if is_current():
+            return _current
+
+    # Loaded or exported without the lock, so that sessions already on the previous version
+    # are not held up while a new one is prepared
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        frames = {name: load_dataset(name) for name in names}
+        build_time_indexes(frames, index_columns)
+        build_key_indexes(frames, key_columns)
+        shared_datasets = SharedDatasets(version, frames, mapped=False)
+    else:
+        target = get_shared_folder(version, names, index_columns, key_columns, folder)
+        while True:
+            if not os.path.isdir(target):
+                os.makedirs(folder, exist_ok=True)
+                print(f"Exporting the dashboard datasets to {target}")
+                export_shared_datasets(target, names, index_columns, key_columns)
+            try:
+                lock_file = _lock_export(target, exclusive=False)
+            except FileNotFoundError:
+                # Removed by a process that exported newer CSVs meanwhile: export it again
+                continue
+            with lock_file:
+                frames = map_shared_datasets(target, names, index_columns, key_columns)
+            break
+        shared_datasets = SharedDatasets(version, frames, mapped=True, folder=folder)
+
+    with _lock:
+        # Another thread may have prepared the same version meanwhile; its frames are kept
+        if not is_current():
+            _current = shared_datasets
+        return _current
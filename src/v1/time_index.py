@@ -0,0 +1,176 @@
+"""
+Row positions of a frame sorted by one timestamp column, for date-range lookups by binary search.
+
+A `TimeIndex` sorts the timestamps of its column once (rows without a timestamp last) and keeps
+them as int64 UTC ticks, in the resolution of the column, with the position of each row in the
+frame. A date range is then two `searchsorted` calls and a gather of the rows in that range
+(`df.take(positions[lo:hi])`), so only the rows of the range are copied, when they are asked
+for, and the callers can ask for the columns they read only.
+
+Memory: an index costs at most 16 bytes per row (an int64 key and an int64 position), whatever
+the number of columns of the frame. The two indexed columns of a 10M-row submissions table
+(`kpi_calculator.TIME_INDEX_COLUMNS`) take at most 320 MB, not two sorted copies of the table.
+
+`get_time_index` keeps one index per (frame, column) for as long as the frame is alive, so the
+KPI calculators can slice the dashboard frames for every semester without re-sorting them. An
+index only holds a weak reference to its frame. The indexed frames must not be modified in
+place (see `v1.datasets`).
+"""
+import weakref
+
+import numpy as np
+import pandas as pd
+
+NAT = np.iinfo(np.int64).min
+
+# (id of the frame, column) -> (weak reference to the frame, TimeIndex)
+_indexes = {}
+
+
+def utc_nanoseconds(timestamps) -> np.ndarray:
+    """
+    Timestamps (Series, DatetimeIndex or array-like) as int64 UTC nanoseconds; NaT as the int64 minimum.
+    """
+    timestamps = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True))
+    return timestamps.as_unit("ns").asi8
+
+
+def _utc_ticks(timestamps):
+    """
+    Timestamps of a column as int64 UTC ticks and their unit ('s', 'ms', 'us' or 'ns'); NaT as the int64 minimum.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, utc=True, errors='coerce')
+    timestamps = pd.DatetimeIndex(timestamps)
+    # Naive timestamps are taken as UTC; aware ones are stored as UTC already
+    return timestamps.asi8, timestamps.unit
+
+
+def _bound(value, unit: str, side: str) -> int:
+    timestamp = pd.Timestamp(value)
+    if timestamp.tz is None:
+        # Naive bounds (e.g. the semester date strings) compare as UTC, like the column filters did
+        timestamp = timestamp.tz_localize('UTC')
+    # Bounds finer than the column round inwards, so inclusive comparisons are unchanged
+    timestamp = timestamp.ceil(unit) if side == 'start' else timestamp.floor(unit)
+    return int(timestamp.tz_convert('UTC').as_unit(unit).asm8.view(np.int64))
+
+
+class TimeIndex:
+    """
+    The rows of a frame in the order of one of its timestamp columns.
+
+    Args:
+        df (pd.DataFrame): Rows to index; only the positions of its rows are kept, and a weak
+            reference to it.
+        column (str): Timestamp column (datetimes or strings; unparseable values count as missing).
+
+    Attributes:
+        keys (np.ndarray): Sorted int64 timestamps of the rows that have one.
+        positions (np.ndarray): Position in `df` of every row, those with a timestamp in the order
+            of `keys`, then the ones without.
+    """
+
+    def __init__(self, df: pd.DataFrame, column: str):
+        keys, self.unit = _utc_ticks(df[column])
+        known = keys != NAT
+        # Rows with a timestamp in time order, then the ones without
+        order = np.concatenate([np.flatnonzero(known)[np.argsort(keys[known])], np.flatnonzero(~known)])
+
+        self.column = column
+        self._frame = weakref.ref(df)
+        self.keys = keys[order[:np.count_nonzero(known)]]
+        self.positions = order
+
+    @classmethod
+    def from_arrays(cls, df: pd.DataFrame, column: str, keys: np.ndarray, positions: np.ndarray) -> "TimeIndex":
+        """
+        An index of `df` from the `keys` and `positions` of another one (e.g. memory-mapped),
+        without a copy. `df[column]` must hold datetimes in the resolution of the keys.
+        """
+        index = cls.__new__(cls)
+        index.column = column
+        index.unit = df[column].dt.unit
+        index._frame = weakref.ref(df)
+        index.keys = keys
+        index.positions = positions
+        return index
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        frame = self._frame()
+        if frame is None:
+            raise ReferenceError("The indexed frame no longer exists")
+        return frame
+
+    def __len__(self):
+        return len(self.positions)
+
+    def positions_between(self, start=None, end=None):
+        """
+        Where the rows with `start <= timestamp <= end` are in `positions`.
+
+        Args:
+            start: First timestamp included, no lower bound when None.
+            end: Last timestamp included, no upper bound when None.
+
+        Returns:
+            tuple: (lo, hi) such that `positions[lo:hi]` are the matching rows.
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.keys, _bound(start, self.unit, 'start'), side='left'))
+        hi = len(self.keys) if end is None else int(np.searchsorted(self.keys, _bound(end, self.unit, 'end'), side='right'))
+        return lo, max(lo, hi)
+
+    def between(self, start=None, end=None, columns=None) -> pd.DataFrame:
+        """
+        Rows with `start <= timestamp <= end`, sorted by timestamp; rows without one never match.
+        Only the rows in the range are copied, and only `columns` of them when given.
+        """
+        lo, hi = self.positions_between(start, end)
+        return self._take(self.positions[lo:hi], columns)
+
+    def _take(self, positions: np.ndarray, columns) -> pd.DataFrame:
+        frame = self.frame
+        if columns is None:
+            return frame.take(positions)
+        return frame.iloc[positions, frame.columns.get_indexer(columns)]
+
+    def missing(self, columns=None) -> pd.DataFrame:
+        """
+        Rows without a timestamp (only `columns` of them when given).
+        """
+        return self._take(self.positions[len(self.keys):], columns)
+
+
+def get_time_index(df: pd.DataFrame, column: str) -> TimeIndex:
+    """
+    The `TimeIndex` of `df` by `column`, built on first use and kept while `df` is alive.
+    """
+    entry = _indexes.get((id(df), column))
+    if entry is None or entry[0]() is not df:
+        return register_time_index(df, TimeIndex(df, column))
+    return entry[1]
+
+
+def register_time_index(df: pd.DataFrame, index: TimeIndex) -> TimeIndex:
+    """
+    Makes `get_time_index(df, index.column)` return `index`, e.g. one built with `TimeIndex.from_arrays`.
+    """
+    key = (id(df), index.column)
+    reference = weakref.ref(df, lambda _, key=key: _indexes.pop(key, None))
+    _indexes[key] = (reference, index)
+    return index
+
+
+def build_time_indexes(frames: dict, columns: dict):
+    """
+    Builds the time indexes up front, e.g. when the dashboard starts.
+
+    Args:
+        frames (dict): Dataset name -> DataFrame.
+        columns (dict): Dataset name -> timestamp columns to index.
+    """
+    for name, names in columns.items():
+        if name in frames:
+            for column in names:
+                get_time_index(frames[name], column)